@@ -0,0 +1,123 @@
+"""
+Mierzy narzut frameworka na pojedynczą paczkę w pętli treningowej.
+Porównuje czas Data.trainLoop z minimalną pętlą pytorch dla trywialnego modelu,
+dlatego różnica czasów odpowiada kosztowi logiki pythona we frameworku (hooki, zapis statystyk, timery).
+
+Użycie:
+    python benchmarkLoopOverhead.py [batches] [repeats]
+"""
+import sys
+import time
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import TensorDataset, DataLoader
+from framework import smoothingFramework as sf
+
+FEATURES = 8
+CLASSES = 2
+BATCH_SIZE = 4
+
+class BenchmarkData_Metadata(sf.Data_Metadata):
+    def __init__(self, batches):
+        super().__init__(epoch=1)
+        self.batches = batches
+
+class BenchmarkModel_Metadata(sf.Model_Metadata):
+    def __init__(self):
+        super().__init__()
+        self.device = 'cpu'
+
+class BenchmarkData(sf.Data):
+    def __setInputTransform__(self, dataMetadata):
+        self.trainTransform = None
+        self.testTransform = None
+
+    def __prepare__(self, dataMetadata):
+        self.__setInputTransform__(dataMetadata)
+        size = dataMetadata.batches * BATCH_SIZE
+        self.trainset = TensorDataset(torch.randn(size, FEATURES), torch.randint(0, CLASSES, (size,)))
+        self.testset = self.trainset
+        self.trainloader = DataLoader(self.trainset, batch_size=BATCH_SIZE, shuffle=False)
+        self.testloader = self.trainloader
+
+    def __howManyTestInvInOneEpoch__(self):
+        return 0
+
+    def __howManyTrainInvInOneEpoch__(self):
+        return 1
+
+    def __epoch__(self, helperEpoch, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata):
+        self.trainLoop(model=model, helperEpoch=helperEpoch, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata,
+            smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+
+class BenchmarkModel(sf.Model):
+    def __init__(self, modelMetadata):
+        super().__init__(modelMetadata)
+        self.linear = nn.Linear(FEATURES, CLASSES)
+        self.loss_fn = nn.CrossEntropyLoss()
+        self.optimizer = optim.SGD(self.parameters(), lr=1e-3)
+        self.__initializeWeights__()
+
+    def forward(self, x):
+        return self.linear(x)
+
+    def __update__(self, modelMetadata):
+        pass
+
+def rawLoop(model, loader):
+    module = model.getNNModelModule()
+    module.train()
+    start = time.perf_counter()
+    for inputs, labels in loader:
+        model.__getOptimizer__().zero_grad()
+        outputs = module(inputs)
+        loss = model.__getLossFun__()(outputs, labels)
+        loss.backward()
+        model.__getOptimizer__().step()
+    return time.perf_counter() - start
+
+def frameworkLoop(data, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata):
+    helperEpoch = sf.EpochDataContainer()
+    helperEpoch.trainTotalNumber = 0
+    helperEpoch.currentLoopTimeAlias = 'loopTrainTime'
+    start = time.perf_counter()
+    data.trainLoop(model=model, helperEpoch=helperEpoch, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata,
+        smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+    return time.perf_counter() - start
+
+def hookSummary(data):
+    names = sf.HookRegistry.TRAIN_HOOKS + sf.HookRegistry.TEST_HOOKS + sf.HookRegistry.EPOCH_HOOKS
+    skipped = [name for name in names if sf.HookRegistry.resolve(type(data), name) is None]
+    return len(names), skipped
+
+if(__name__ == '__main__'):
+    batches = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    torch.set_num_threads(1)
+
+    metadata = sf.Metadata(trainFlag=True, debugInfo=False, logFolderSuffix='benchmarkLoopOverhead')
+    metadata.prepareOutput()
+    dataMetadata = BenchmarkData_Metadata(batches)
+    modelMetadata = BenchmarkModel_Metadata()
+    smoothingMetadata = sf.Smoothing_Metadata()
+
+    data = BenchmarkData(dataMetadata)
+    model = BenchmarkModel(modelMetadata)
+    smoothing = sf.Smoothing(smoothingMetadata)
+
+    # rozgrzewka
+    rawLoop(model, data.trainloader)
+    frameworkLoop(data, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata)
+
+    raw = min(rawLoop(model, data.trainloader) for _ in range(repeats))
+    framework = min(frameworkLoop(data, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata) for _ in range(repeats))
+    metadata.stream.flushAll()
+
+    total, skipped = hookSummary(data)
+    sf.Output.printBash("Batches: {}, repeats: {}, batch size: {}".format(batches, repeats, BATCH_SIZE), 'info')
+    sf.Output.printBash("Raw pytorch loop per batch (us):\t{:.2f}".format(raw / batches * 1e6), 'info')
+    sf.Output.printBash("Framework trainLoop per batch (us):\t{:.2f}".format(framework / batches * 1e6), 'info')
+    sf.Output.printBash("Framework overhead per batch (us):\t{:.2f}".format((framework - raw) / batches * 1e6), 'info')
+    sf.Output.printBash("Hooks skipped: {}/{} {}".format(len(skipped), total, skipped), 'info')
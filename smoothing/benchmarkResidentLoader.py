@@ -0,0 +1,56 @@
+"""
+Porównuje czas jednego epoch'u wczytywania danych przez torch.utils.data.DataLoader oraz przez ResidentTensorLoader.
+Dane mają kształt zbioru CIFAR10 (uint8 [N, 3, 32, 32]). Dla DataLoadera każda próbka pobierana jest osobno
+i łączona w paczkę, a dla ResidentTensorLoader paczka powstaje przez jedno indeksowanie tensora.
+Wszystkie warianty zwracają paczki na podanym urządzeniu.
+
+Użycie:
+    python benchmarkResidentLoader.py [samples] [batchSize] [device]
+"""
+import sys
+import time
+
+import torch
+from torch.utils.data import TensorDataset, DataLoader
+from framework import smoothingFramework as sf
+
+def loaderEpoch(loader, device):
+    start = time.perf_counter()
+    for inputs, labels in loader:
+        inputs, labels = inputs.to(device), labels.to(device)
+    if(device.type == 'cuda'):
+        torch.cuda.synchronize(device)
+    return time.perf_counter() - start
+
+def residentEpoch(loader, device):
+    start = time.perf_counter()
+    for batch, inputs, labels in loader.iterFrom(device=device):
+        inputs, labels = inputs.to(device), labels.to(device)
+    if(device.type == 'cuda'):
+        torch.cuda.synchronize(device)
+    return time.perf_counter() - start
+
+if(__name__ == '__main__'):
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    batchSize = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    device = torch.device(sys.argv[3] if len(sys.argv) > 3 else ('cuda:0' if torch.cuda.is_available() else 'cpu'))
+
+    inputs = torch.randint(0, 256, (samples, 3, 32, 32), dtype=torch.uint8)
+    labels = torch.randint(0, 10, (samples,))
+    dataset = TensorDataset(inputs, labels)
+
+    results = {}
+    for workers in (0, 2):
+        sampler = sf.BaseSampler(samples, batchSize)
+        loader = DataLoader(dataset, batch_size=batchSize, sampler=sampler, num_workers=workers)
+        loaderEpoch(loader, device) # rozgrzewka
+        results['DataLoader num_workers={}'.format(workers)] = loaderEpoch(loader, device)
+
+    for onDevice in (False, True):
+        loader = sf.ResidentTensorLoader(inputs, labels, batchSize=batchSize, sampler=sf.BaseSampler(samples, batchSize), onDevice=onDevice)
+        residentEpoch(loader, device) # rozgrzewka
+        results['ResidentTensorLoader onDevice={}'.format(onDevice)] = residentEpoch(loader, device)
+
+    sf.Output.printBash("Samples: {}, batch size: {}, device: {}".format(samples, batchSize, device), 'info')
+    for name, elapsed in results.items():
+        sf.Output.printBash("{}:\t{:.3f} s per epoch, {:.0f} samples/s".format(name, elapsed, samples / elapsed), 'info')
@@ -18,82 +18,58 @@ from framework import defaultClasses as dc
 # wzorowane na pracy https://paperswithcode.com/paper/wide-residual-networks
 # model wzorowany na resnet18 https://github.com/huyvnphan/PyTorch_CIFAR10/blob/master/module.py
 
-if(__name__ == '__main__'):
-    modelDevice = 'cuda:0'
-    if(sf.test_mode().isActive()):
-        modelDevice="cuda:0"
+loop = 5
+modelName = "wide_resnet"
+prefix = "set_copyOfExper_"
+runningAvgSize = 10
+num_classes = 10
+layers = [2, 2, 2, 2]
+block = modResnet.BasicBlock
+optimizerDataDict={"learning_rate":0.1, "momentum":0.9, "weight_decay":0.001}
+
+def task(cell, repetition):
+    """
+        Jedno powtórzenie eksperymentu dla komórki (rodzaj wygładzania, rootFolder). Wywoływane przez experiments.runScheduled w osobnym procesie.
+        Przy wielu kartach graficznych kolejne powtórzenia trafiają na kolejne karty.
+    """
+    smoothingType, rootFolder = cell
+    modelDevice = 'cuda:{}'.format(repetition % max(1, torch.cuda.device_count()))
 
     metadata = sf.Metadata(testFlag=True, trainFlag=True, debugInfo=True)
     dataMetadata = dc.DefaultData_Metadata(pin_memoryTest=False, pin_memoryTrain=False, epoch=100, fromGrayToRGB=False,
-        batchTrainSize=125, batchTestSize=125, startTestAtEpoch=[0, 24, 44, 74, 99])
-    optimizerDataDict={"learning_rate":0.1, "momentum":0.9, "weight_decay":0.001}
+        batchTrainSize=125, batchTestSize=125, startTestAtEpoch=[0, 24, 44, 74, 99], shareDatasets=True)
     modelMetadata = dc.DefaultModel_Metadata(device=modelDevice, lossFuncDataDict={}, optimizerDataDict=optimizerDataDict)
-    loop = 5
-    modelName = "wide_resnet"
-    prefix = "set_copyOfExper_"
-    runningAvgSize = 10
-    num_classes = 10
-    layers = [2, 2, 2, 2]
-    block = modResnet.BasicBlock
-
-
-    types = ('predefModel', 'CIFAR10', 'pytorchSWA')
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() + ''.join(x + "_" for x in types)
-        smoothingMetadata = dc.DefaultPytorchAveragedSmoothing_Metadata(device='cuda:0')
-
-        for r in range(loop):
-            obj = models.ResNet(block, layers, num_classes=num_classes)
-
-            data = dc.DefaultDataCIFAR10(dataMetadata)
-            model = dc.DefaultModelPredef(obj=obj, modelMetadata=modelMetadata, name=modelName)
-            smoothing = dc.DefaultPytorchAveragedSmoothing(smoothingMetadata,  model=model)
-
-            optimizer = optim.SGD(model.getNNModelModule().parameters(), lr=optimizerDataDict['learning_rate'], 
-                weight_decay=optimizerDataDict['weight_decay'], momentum=optimizerDataDict['momentum'])
-            scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=30, gamma=0.1)
-            loss_fn = nn.CrossEntropyLoss()     
-
-            stat=dc.run(metadataObj=metadata, data=data, model=model, smoothing=smoothing, optimizer=optimizer, lossFunc=loss_fn,
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, rootFolder=rootFolder,
-                schedulers=[([30, 60, 90, 120, 150, 180], scheduler)])
-
-            stat.saveSelf(name="stat")
 
-            stats.append(stat)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
-
-
-
-    types = ('predefModel', 'CIFAR10', 'EWMA')
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() +  ''.join(x + "_" for x in types)
+    obj = models.ResNet(block, layers, num_classes=num_classes)
+    data = dc.DefaultDataCIFAR10(dataMetadata)
+    model = dc.DefaultModelPredef(obj=obj, modelMetadata=modelMetadata, name=modelName)
+    if(smoothingType == 'pytorchSWA'):
+        smoothingMetadata = dc.DefaultPytorchAveragedSmoothing_Metadata(device=modelDevice)
+        smoothing = dc.DefaultPytorchAveragedSmoothing(smoothingMetadata, model=model)
+    else:
         smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=0.05, 
-            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98, device='cuda:0')
-
-        for r in range(loop):
-            obj = models.ResNet(block, layers, num_classes=num_classes)
+            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98, device=modelDevice)
+        smoothing = dc.DefaultSmoothingOscilationEWMA(smoothingMetadata)
 
-            data = dc.DefaultDataCIFAR10(dataMetadata)
-            smoothing = dc.DefaultSmoothingOscilationEWMA(smoothingMetadata)
-            model = dc.DefaultModelPredef(obj=obj, modelMetadata=modelMetadata, name=modelName)
+    optimizer = optim.SGD(model.getNNModelModule().parameters(), lr=optimizerDataDict['learning_rate'], 
+        weight_decay=optimizerDataDict['weight_decay'], momentum=optimizerDataDict['momentum'])
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=30, gamma=0.1)
+    loss_fn = nn.CrossEntropyLoss()     
 
-            optimizer = optim.SGD(model.getNNModelModule().parameters(), lr=optimizerDataDict['learning_rate'], 
-                weight_decay=optimizerDataDict['weight_decay'], momentum=optimizerDataDict['momentum'])
-            scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=30, gamma=0.1)
-            loss_fn = nn.CrossEntropyLoss()     
+    stat=dc.run(metadataObj=metadata, data=data, model=model, smoothing=smoothing, optimizer=optimizer, lossFunc=loss_fn,
+        modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, rootFolder=rootFolder,
+        schedulers=[([30, 60, 90, 120, 150, 180], scheduler)])
+    stat.saveSelf(name="stat")
+    return stat
 
-            stat=dc.run(metadataObj=metadata, data=data, model=model, smoothing=smoothing, optimizer=optimizer, lossFunc=loss_fn,
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, rootFolder=rootFolder,
-                schedulers=[([30, 60, 90, 120, 150, 180], scheduler)])
-
-            stat.saveSelf(name="stat")
-
-            stats.append(stat)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
\ No newline at end of file
+if(__name__ == '__main__'):
+    cells = [(smoothingType, prefix + sf.Output.getTimeStr() + ''.join(x + "_" for x in ('predefModel', 'CIFAR10', smoothingType)))
+        for smoothingType in ('pytorchSWA', 'EWMA')]
+    # jeden proces na kartę graficzną; powtórzenia nie dzielą pamięci jednej karty
+    stats = experiments.runScheduled(task, repetitions=loop, cells=cells, processes=max(1, torch.cuda.device_count()))
+
+    for (smoothingType, rootFolder), cellStats in zip(cells, stats):
+        try:
+            experiments.printAvgStats(cellStats, rootFolder, runningAvgSize=runningAvgSize)
+        except Exception as ex:
+            experiments.printException(ex, ('predefModel', 'CIFAR10', smoothingType))
@@ -25,7 +25,7 @@ if(__name__ == '__main__'):
 
     metadata = sf.Metadata(testFlag=True, trainFlag=True, debugInfo=True)
     dataMetadata = dc.DefaultData_Metadata(pin_memoryTest=False, pin_memoryTrain=False, epoch=100, fromGrayToRGB=False,
-        batchTrainSize=125, batchTestSize=125, startTestAtEpoch=[0, 24, 44, 74, 99])
+        batchTrainSize=125, batchTestSize=125, startTestAtEpoch=[0, 24, 44, 74, 99], shareDatasets=True)
     optimizerDataDict={"learning_rate":0.1, "momentum":0.9, "weight_decay":0.001}
     modelMetadata = dc.DefaultModel_Metadata(device=modelDevice, lossFuncDataDict={}, optimizerDataDict=optimizerDataDict)
     loop = 5
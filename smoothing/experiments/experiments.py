@@ -5,6 +5,9 @@ sys.path.append(str(Path(__file__).parents[1]))
 
 from framework import smoothingFramework as sf
 import traceback
+import multiprocessing
+import concurrent.futures
+import torch
 
 for i, arg in enumerate(sys.argv):
     if(arg == "debug" or arg == "test"):
@@ -41,4 +44,58 @@ def printAvgStats(stat, metadataRoot, startAt = -10, runningAvgSize=1):
     else:
         raise Exception("Unknown data type: {}".format(type(metadataRoot)))
     avgStats = sf.averageStatistics(stat, relativeRootFolder=root)
-    avgStats.printPlots(startAt=startAt, runningAvgSize=runningAvgSize)
\ No newline at end of file
+    avgStats.printPlots(startAt=startAt, runningAvgSize=runningAvgSize)
+
+def _Private_initWorker(threads, testMode):
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['MKL_NUM_THREADS'] = str(threads)
+    torch.set_num_threads(threads)
+    sf.StaticData.TEST_MODE = testMode
+
+def _Private_runTask(task, cell, repetition):
+    try:
+        return task(cell, repetition)
+    except Exception as ex:
+        printException(ex, (str(cell), 'repetition {}'.format(repetition)))
+        return None
+
+def runScheduled(task, repetitions = 1, cells = None, processes = None, threadsPerProcess = None):
+    """
+        Wywołuje task(cell, repetition) dla każdej komórki z cells oraz każdego powtórzenia w osobnych procesach.
+        Zwraca listę, w której dla każdej komórki znajduje się lista zwróconych obiektów (np. Statistics) 
+        w kolejności powtórzeń. Powtórzenia zakończone wyjątkiem są pomijane.
+
+        task - funkcja zdefiniowana na najwyższym poziomie modułu, ponieważ procesy tworzone są metodą 'spawn'. 
+            Powinna stworzyć własne obiekty (w tym sf.Metadata), dzięki czemu każde powtórzenie zapisuje logi do osobnego folderu.
+            Zwracany obiekt musi dać się zserializować przez pickle.
+        cells - lista parametrów przekazywanych do task, np. kolejne wartości hiperparametru. Dla None wywoływana jest jedna komórka z wartością None.
+        processes - liczba jednocześnie działających procesów. Domyślnie min(liczba zadań, liczba rdzeni).
+        threadsPerProcess - liczba wątków pytorcha w jednym procesie. Domyślnie rdzenie są dzielone po równo między procesy.
+
+        Wynik można przekazać do printAvgStats, przykładowo
+            stats = runScheduled(task, repetitions=5, cells=[0.05, 0.1])
+            for cellStats in stats:
+                printAvgStats(cellStats, rootFolder)
+    """
+    if(cells is None):
+        cells = [None]
+    jobs = [(cellIdx, r) for cellIdx in range(len(cells)) for r in range(repetitions)]
+    cpus = os.cpu_count() or 1
+    if(processes is None):
+        processes = max(1, min(len(jobs), cpus))
+    if(threadsPerProcess is None):
+        threadsPerProcess = max(1, cpus // processes)
+
+    results = [[None] * repetitions for _ in cells]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+        initializer=_Private_initWorker, initargs=(threadsPerProcess, sf.StaticData.TEST_MODE)) as executor:
+        futures = {executor.submit(_Private_runTask, task, cells[cellIdx], r): (cellIdx, r) for cellIdx, r in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            cellIdx, r = futures[future]
+            try:
+                results[cellIdx][r] = future.result()
+            except Exception as ex: # np. proces zakończony przez system
+                printException(ex, (str(cells[cellIdx]), 'repetition {}'.format(r)))
+            sf.Output.printBash("Finished repetition {} of cell {}.".format(r, cells[cellIdx]), 'info')
+
+    return [[stat for stat in cellStats if stat is not None] for cellStats in results]
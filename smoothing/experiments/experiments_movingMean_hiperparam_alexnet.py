@@ -11,126 +11,49 @@ import torch.nn.functional as F
 import torchvision.models as models
 from framework import defaultClasses as dc
 
-if(__name__ == '__main__'):
-    #sf.StaticData.TEST_MODE = True
-
-    # pin_memory = False - na serwerze inaczej występuje Warning: Leaking Caffe2 thread-pool after fork. 
+loop = 5
+modelName = "alexnet"
+prefix = "mov_param_"
+runningAvgSize = 10
+types = ('predefModel', 'MNIST', 'movingMean')
+
+def task(cell, repetition):
+    """
+        Jedno powtórzenie eksperymentu dla komórki (movingAvgParam, rootFolder). Wywoływane przez experiments.runScheduled w osobnym procesie.
+    """
+    movingAvgParam, rootFolder = cell
+
+    # pin_memory = False - na serwerze inaczej występuje Warning: Leaking Caffe2 thread-pool after fork.
     # więcej w wątku https://github.com/pytorch/pytorch/issues/57273
-
     metadata = sf.Metadata(testFlag=True, trainFlag=True, debugInfo=True)
-    dataMetadata = dc.DefaultData_Metadata(pin_memoryTest=False, pin_memoryTrain=False, epoch=2, fromGrayToRGB=True)
-    loop = 5
-    modelName = "alexnet"
-    prefix = "mov_param_"
-    runningAvgSize = 10
-
-    types = ('predefModel', 'MNIST', 'movingMean')
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() +  ''.join(x + "_" for x in types) + "set"
-        smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=0.05, 
-            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98)
-
-        for r in range(loop):
-            obj = models.alexnet()
-            metadata.resetOutput()
-
-            modelMetadata = dc.DefaultModel_Metadata()
-            data = DataMap[dataType](dataMetadata)
-            smoothing = SmoothingMap[smoothingType](smoothingMetadata)
-            model = ModelMap[modelType](obj=modelPredefObj, modelMetadata=modelMetadata, name=modelPredefObjName, optimizer=optimizer, lossFunc=lossFunc)
-            optimizer = optim.SGD(self.getNNModelModule().parameters(), lr=1e-3, momentum=0.9)
-            loss_fn = nn.CrossEntropyLoss()
-
-            stat=dc.run(modelType=types[0], dataType=types[1], smoothingType=types[2], metadataObj=metadata, 
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, modelPredefObj=obj,
-                modelPredefObjName=modelName, rootFolder=rootFolder, runningAvgSize=runningAvgSize,
-                optimizer=optimizer, lossFunc=loss_fn)
-            for idx, s in enumerate(stat):
-                s.saveSelf(name="stat" + str(idx))
-            stats.append(stat.pop()) # weź pod uwagę tylko ostatni wynik (najlepiej wyćwiczony)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
-
-
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() +  ''.join(x + "_" for x in types) + "set"
-        smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=0.1, 
-            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98)
-
-        for r in range(loop):
-            obj = models.alexnet()
-            metadata.resetOutput()
-            modelMetadata = dc.DefaultModel_Metadata()
+    dataMetadata = dc.DefaultData_Metadata(pin_memoryTest=False, pin_memoryTrain=False, epoch=2, fromGrayToRGB=True, shareDatasets=True)
+    modelMetadata = dc.DefaultModel_Metadata()
+    smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=movingAvgParam,
+        epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98)
 
-            stat=dc.run(numbOfRepetition=2, modelType=types[0], dataType=types[1], smoothingType=types[2], metadataObj=metadata, 
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, modelPredefObj=obj,
-                modelPredefObjName=modelName, rootFolder=rootFolder, runningAvgSize=runningAvgSize)
-            stats.append(stat.pop()) # weź pod uwagę tylko ostatni wynik (najlepiej wyćwiczony)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
+    obj = models.alexnet()
+    data = dc.DefaultDataMNIST(dataMetadata)
+    model = dc.DefaultModelPredef(obj=obj, modelMetadata=modelMetadata, name=modelName)
+    smoothing = dc.DefaultSmoothingOscilationEWMA(smoothingMetadata)
 
+    optimizer = optim.SGD(model.getNNModelModule().parameters(), lr=1e-3, momentum=0.9)
+    loss_fn = nn.CrossEntropyLoss()
 
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() +  ''.join(x + "_" for x in types) + "set"
-        smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=0.15, 
-            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98)
+    stat=dc.run(metadataObj=metadata, data=data, model=model, smoothing=smoothing, optimizer=optimizer, lossFunc=loss_fn,
+        modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, rootFolder=rootFolder,
+        runningAvgSize=runningAvgSize)
+    stat.saveSelf(name="stat")
+    return stat
 
-        for r in range(loop):
-            obj = models.alexnet()
-            metadata.resetOutput()
-            modelMetadata = dc.DefaultModel_Metadata()
-
-            stat=dc.run(numbOfRepetition=2, modelType=types[0], dataType=types[1], smoothingType=types[2], metadataObj=metadata, 
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, modelPredefObj=obj,
-                modelPredefObjName=modelName, rootFolder=rootFolder, runningAvgSize=runningAvgSize)
-            stats.append(stat.pop()) # weź pod uwagę tylko ostatni wynik (najlepiej wyćwiczony)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
-
-
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() +  ''.join(x + "_" for x in types) + "set"
-        smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=0.2, 
-            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98)
-
-        for r in range(loop):
-            obj = models.alexnet()
-            metadata.resetOutput()
-            modelMetadata = dc.DefaultModel_Metadata()
-
-            stat=dc.run(numbOfRepetition=2, modelType=types[0], dataType=types[1], smoothingType=types[2], metadataObj=metadata, 
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, modelPredefObj=obj,
-                modelPredefObjName=modelName, rootFolder=rootFolder, runningAvgSize=runningAvgSize)
-            stats.append(stat.pop()) # weź pod uwagę tylko ostatni wynik (najlepiej wyćwiczony)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
-
-
-
-    try:
-        stats = []
-        rootFolder = prefix + sf.Output.getTimeStr() +  ''.join(x + "_" for x in types) + "set"
-        smoothingMetadata = dc.DefaultSmoothingOscilationEWMA_Metadata(movingAvgParam=0.25, 
-            epsilon=1e-5, hardEpsilon=1e-7, weightsEpsilon=1e-6, batchPercentMaxStart=0.98)
-
-        for r in range(loop):
-            obj = models.alexnet()
-            metadata.resetOutput()
-            modelMetadata = dc.DefaultModel_Metadata()
+if(__name__ == '__main__'):
+    #sf.StaticData.TEST_MODE = True
 
-            stat=dc.run(numbOfRepetition=2, modelType=types[0], dataType=types[1], smoothingType=types[2], metadataObj=metadata, 
-                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, modelPredefObj=obj,
-                modelPredefObjName=modelName, rootFolder=rootFolder, runningAvgSize=runningAvgSize)
-            stats.append(stat.pop()) # weź pod uwagę tylko ostatni wynik (najlepiej wyćwiczony)
-        experiments.printAvgStats(stats, metadata, runningAvgSize=runningAvgSize)
-    except Exception as ex:
-        experiments.printException(ex, types)
+    cells = [(movingAvgParam, prefix + sf.Output.getTimeStr() + str(movingAvgParam) + '_' + ''.join(x + "_" for x in types) + "set")
+        for movingAvgParam in (0.05, 0.1, 0.15, 0.2, 0.25)]
+    stats = experiments.runScheduled(task, repetitions=loop, cells=cells)
 
+    for (movingAvgParam, rootFolder), cellStats in zip(cells, stats):
+        try:
+            experiments.printAvgStats(cellStats, rootFolder, runningAvgSize=runningAvgSize)
+        except Exception as ex:
+            experiments.printException(ex, types)
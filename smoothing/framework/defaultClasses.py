@@ -8,6 +8,16 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torchvision.models as models
 import os
+import json
+import numpy
+import random
+import fcntl
+import hashlib
+import tempfile
+import contextlib
+import atexit
+import weakref
+from multiprocessing import shared_memory, resource_tracker
 
 class ConfigClass():
     STD_NAN = 1e+10 # standard value if NaN
@@ -263,6 +273,7 @@ class _SmoothingOscilationBase(sf.Smoothing):
         self.goodEnoughCounter = 0
         self.alwaysOn = False 
         self.weightsComputed = False
+        self.convergenceMetric = None # ostatnia wartość porównana z weightsEpsilon; odczytywana przez sf.MetricsEndpoint
 
         self.lossContainer = sf.CircularList(smoothingMetadata.lossContainerSize)
         
@@ -274,14 +285,14 @@ class _SmoothingOscilationBase(sf.Smoothing):
         """
         avg_1 = self.lossContainer.getAverage()
         avg_2 = self.lossContainer.getAverage(smoothingMetadata.lossContainerDelayedStartAt)
-        metadata.stream.print("Loss average: {} : {}".format(avg_1, avg_2), 'debug:0')
+        metadata.stream.printLazy('debug:0', "Loss average: {} : {}", avg_1, avg_2, mode='debug')
         absAvgDiff = abs(avg_1 - avg_2)
         minStart = smoothingMetadata.batchPercentMinStart * helperEpoch.maxTrainTotalNumber
 
         # czy spelniono waruek na twardy epsilon
         if(absAvgDiff < smoothingMetadata.hardEpsilon and helperEpoch.trainTotalNumber > minStart):
             self.alwaysOn = True
-            metadata.stream.print("Reached hard epsilon.", 'debug:0')
+            metadata.stream.printLazy('debug:0', "Reached hard epsilon.", mode='debug')
 
         # wykonano maksymalną liczbę pętli przed włączeniem wygładzania
         return bool(
@@ -299,6 +310,7 @@ class _SmoothingOscilationBase(sf.Smoothing):
         return sf.sumAllWeights(smWg)
 
     def _smoothingGoodEnoughCheck(self, val, smoothingMetadata):
+        self.convergenceMetric = val
         ret = bool(val < smoothingMetadata.weightsEpsilon)
         if(ret):
             if(smoothingMetadata.softMarginAdditionalLoops >= self.goodEnoughCounter):
@@ -326,17 +338,17 @@ class _SmoothingOscilationBase(sf.Smoothing):
             self.tensorPrevSum.pushBack(absSum)
             avg_1, avg_2 = self.tensorPrevSum.getAverage(), self.tensorPrevSum.getAverage(smoothingMetadata.weightSumContainerSizeStartAt)
 
-            metadata.stream.print("Sum debug:" + str(absSum), 'debug:0')
-            metadata.stream.print("Weight avg diff: " + str(abs(avg_1 - avg_2)), 'debug:0')
-            metadata.stream.print("Weight avg diff bool: " + str(bool(abs(avg_1 - avg_2) < smoothingMetadata.weightsEpsilon)), 'debug:0')
+            metadata.stream.printLazy('debug:0', "Sum debug:{}", absSum, mode='debug')
+            metadata.stream.printLazy('debug:0', "Weight avg diff: {}", lambda: abs(avg_1 - avg_2), mode='debug')
+            metadata.stream.printLazy('debug:0', "Weight avg diff bool: {}", lambda: bool(abs(avg_1 - avg_2) < smoothingMetadata.weightsEpsilon), mode='debug')
             return self._smoothingGoodEnoughCheck(val=abs(avg_1 - avg_2), smoothingMetadata=smoothingMetadata)
         return False
 
     def __call__(self, helperEpoch, helper, model, dataMetadata, modelMetadata, metadata, smoothingMetadata):
         super().__call__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothingMetadata=smoothingMetadata)
         self.lossContainer.pushBack(helper.loss.item())
-        metadata.stream.print("Loss avg diff : " + 
-            str(abs(self.lossContainer.getAverage() - self.lossContainer.getAverage(smoothingMetadata.lossContainerDelayedStartAt))), 'debug:0')
+        metadata.stream.printLazy('debug:0', "Loss avg diff : {}",
+            lambda: abs(self.lossContainer.getAverage() - self.lossContainer.getAverage(smoothingMetadata.lossContainerDelayedStartAt)), mode='debug')
 
         self.weightsComputed = self.canComputeWeights(helperEpoch=helperEpoch, helper=helper, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata, metadata=metadata)
         if(self.alwaysOn or self.weightsComputed):                
@@ -805,8 +817,8 @@ class DefaultSmoothingOscilationWeightedMean(_SmoothingOscilationBase):
             smWg = self.__getSmoothedWeights__(smoothingMetadata=smoothingMetadata, metadata=metadata)
             stdDev = self._sumWeightsToArrayStd(smWg=smWg)
 
-            metadata.stream.print("Standard deviation:" + str(stdDev), 'debug:0')
-            metadata.stream.print("Standard deviation bool: " + str(bool(stdDev < smoothingMetadata.weightsEpsilon)), 'debug:0')
+            metadata.stream.printLazy('debug:0', "Standard deviation:{}", stdDev, mode='debug')
+            metadata.stream.printLazy('debug:0', "Standard deviation bool: {}", lambda: bool(stdDev < smoothingMetadata.weightsEpsilon), mode='debug')
             
             return self._smoothingGoodEnoughCheck(val=stdDev, smoothingMetadata=smoothingMetadata)
         return False
@@ -872,13 +884,26 @@ class DefaultData_Metadata(sf.Data_Metadata):
     """
     def __init__(self, worker_seed = 8418748, download = True, pin_memoryTrain = False, pin_memoryTest = False,
         epoch = 1, batchTrainSize = 16, batchTestSize = 16, fromGrayToRGB = True, startTestAtEpoch=-1, 
-        test_howOftenPrintTrain = 200, howOftenPrintTrain = 2000, resizeTo=None):
+        test_howOftenPrintTrain = 200, howOftenPrintTrain = 2000, resizeTo=None, prefetchBatches = 0, autoTuneTestBatch = False, testMemoryBudget = 0.9,
+        memmapCache = False, batchAugment = None, autoTuneLoader = False, shareDatasets = False, residentData = None, sharedMemory = False,
+        lossAwareSampling = False):
 
         super().__init__(worker_seed = worker_seed, train = True, download = download, pin_memoryTrain = pin_memoryTrain, pin_memoryTest = pin_memoryTest,
-            epoch = epoch, batchTrainSize = batchTrainSize, batchTestSize = batchTestSize, howOftenPrintTrain = howOftenPrintTrain)
+            epoch = epoch, batchTrainSize = batchTrainSize, batchTestSize = batchTestSize, howOftenPrintTrain = howOftenPrintTrain, 
+            prefetchBatches = prefetchBatches, autoTuneTestBatch = autoTuneTestBatch, testMemoryBudget = testMemoryBudget, autoTuneLoader = autoTuneLoader)
 
         self.fromGrayToRGB = fromGrayToRGB
         self.resizeTo = resizeTo
+        self.memmapCache = memmapCache # zbiory danych wczytywane z pliku stworzonego przez MemmapDataset
+        self.batchAugment = batchAugment # None, 'cpu' lub 'device' - gdzie wykonać augmentację całej paczki przez BatchAugment
+        if(batchAugment not in (None, 'cpu', 'device')):
+            raise Exception("Unknown batchAugment mode: {}. Use None, 'cpu' or 'device'.".format(batchAugment))
+        self.shareDatasets = shareDatasets # zbiory danych oraz loadery pobierane z DataRegistry
+        self.residentData = residentData # None, 'cpu' lub 'device' - gdzie przechowywać cały zbiór dla sf.ResidentTensorLoader
+        self.sharedMemory = sharedMemory # zbiory danych umieszczane w pamięci współdzielonej przez SharedTensorDataset
+        self.lossAwareSampling = lossAwareSampling # paczki treningowe losowane przez sf.LossAwareSampler
+        if(residentData not in (None, 'cpu', 'device')):
+            raise Exception("Unknown residentData mode: {}. Use None, 'cpu' or 'device'.".format(residentData))
         if(startTestAtEpoch == -1):
             self.startTestAtEpoch = [*range(epoch + 1)]
         else:
@@ -894,13 +919,574 @@ class DefaultData_Metadata(sf.Data_Metadata):
         tmp_str = super().__strAppend__()
         tmp_str += ('Resize data from Gray to RGB:\t{}\n'.format(self.fromGrayToRGB))
         tmp_str += ('Resize data to size:\t{}\n'.format(self.resizeTo))
+        tmp_str += ('Memory-mapped dataset cache:\t{}\n'.format(self.memmapCache))
+        tmp_str += ('Batch augmentation:\t{}\n'.format(self.batchAugment))
+        tmp_str += ('Share datasets in process:\t{}\n'.format(self.shareDatasets))
+        tmp_str += ('Resident data:\t{}\n'.format(self.residentData))
+        tmp_str += ('Shared memory datasets:\t{}\n'.format(self.sharedMemory))
+        tmp_str += ('Loss aware sampling:\t{}\n'.format(self.lossAwareSampling))
         return tmp_str
 
+class MemmapDataset(torch.utils.data.Dataset):
+    """
+        Zbiór danych wczytywany z pliku zawierającego ciągły tensor uint8 o wymiarach [N, C, H, W] oraz z pliku etykiet.
+        Plik jest mapowany do pamięci, a próbki zwracane są jako widoki tensora uint8 bez kopiowania danych. 
+        Na próbkach wykonywane są jedynie losowe augmentacje, a konwersja do float oraz normalizacja 
+        odbywa się dla całej paczki w DefaultData.__batchTransform__.
+
+        Pliki tworzone są raz, przy pierwszym wywołaniu fromTorchvision, w folderze StaticData.DATA_PATH/memmap.
+    """
+    def __init__(self, path, transform = None):
+        self.path = path
+        self.transform = transform
+        with open(path + '.json', 'r') as f:
+            self.shape = tuple(json.load(f)['shape'])
+        self.targets = numpy.load(path + '.labels.npy')
+        self.__open()
+
+    def __open(self):
+        # tryb 'c' (copy-on-write) pozwala tworzyć zapisywalne tensory bez kopiowania pliku
+        self.data = numpy.memmap(self.path + '.u8', dtype=numpy.uint8, mode='c', shape=self.shape)
+
+    def __getstate__(self):
+        # procesy DataLoadera otwierają plik ponownie zamiast kopiować jego zawartość
+        state = self.__dict__.copy()
+        del state['data']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__open()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        sample = torch.from_numpy(self.data[idx])
+        if(self.transform is not None):
+            sample = self.transform(sample)
+        return sample, int(self.targets[idx])
+
+    def exists(path):
+        return os.path.exists(path + '.json')
+
+    def toNCHW(data):
+        """
+            Zwraca ciągłą tablicę uint8 [N, C, H, W]. Dane [N, H, W] otrzymują wymiar kanału, 
+            a dane [N, H, W, C] są transponowane.
+        """
+        data = numpy.asarray(data, dtype=numpy.uint8)
+        if(data.ndim == 3):
+            data = data[:, None]
+        elif(data.ndim == 4 and data.shape[-1] in (1, 3)):
+            data = data.transpose(0, 3, 1, 2)
+        return numpy.ascontiguousarray(data)
+
+    def write(path, data, targets):
+        """
+            Zapisuje dane jako tensor uint8 [N, C, H, W] (patrz toNCHW). 
+            Plik .json zapisywany jest na końcu i oznacza kompletny zapis.
+        """
+        data = MemmapDataset.toNCHW(data)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '.' + str(os.getpid()) + '.tmp'
+        data.tofile(path + '.u8' + tmp)
+        os.replace(path + '.u8' + tmp, path + '.u8')
+        with open(path + '.labels' + tmp, 'wb') as f:
+            numpy.save(f, numpy.asarray(targets, dtype=numpy.int64))
+        os.replace(path + '.labels' + tmp, path + '.labels.npy')
+        with open(path + '.json' + tmp, 'w') as f:
+            json.dump({'shape': list(data.shape)}, f)
+        os.replace(path + '.json' + tmp, path + '.json')
+
+    def cacheName(datasetClass, **kwargs):
+        return datasetClass.__name__ + ''.join('_{}-{}'.format(k, v) for k, v in sorted(kwargs.items()))
+
+    def fromTorchvision(datasetClass, train, transform = None, download = True, **kwargs):
+        """
+            Zwraca MemmapDataset dla zbioru torchvision posiadającego pola data oraz targets. 
+            Przy pierwszym wywołaniu pobiera zbiór i zapisuje go do pliku.
+        """
+        name = MemmapDataset.cacheName(datasetClass, **kwargs) + ('_train' if train else '_test')
+        path = os.path.join(sf.StaticData.DATA_PATH, 'memmap', name)
+        if(not MemmapDataset.exists(path)):
+            sf.Output.printBash("Preprocessing dataset '{}' into memory-mapped file.".format(name), 'info')
+            source = datasetClass(root=sf.StaticData.DATA_PATH, train=train, download=download, **kwargs)
+            MemmapDataset.write(path, source.data, source.targets)
+        return MemmapDataset(path, transform)
+
+class SharedTensorDataset(torch.utils.data.Dataset):
+    """
+        Zbiór danych przechowywany w nazwanym segmencie pamięci współdzielonej, tworzonym raz na komputer.
+        Pierwszy proces tworzy segment z danych zwróconych przez factory() - pary tablic numpy (uint8 [N, C, H, W], int64 [N]).
+        Kolejne procesy z tą samą nazwą dołączają do istniejącego segmentu, a procesy robocze DataLoadera 
+        dołączają do niego przy odtwarzaniu obiektu po serializacji, bez kopiowania danych. Dane są tylko do odczytu.
+
+        Czas życia segmentu określa licznik referencji zapisany w jego nagłówku i modyfikowany pod blokadą pliku (flock).
+        Proces zwiększa licznik przy utworzeniu obiektu i zmniejsza go w release(); ostatni usuwa segment.
+        release() wywoływane jest także przez DataRegistry.clear() oraz przy zakończeniu procesu (atexit) dla obiektów, które nadal istnieją.
+        Proces potomny utworzony przez fork nie zmienia licznika dla obiektów odziedziczonych po rodzicu.
+        Segment nie jest rejestrowany w resource_tracker, ponieważ ten usuwałby go przy zakończeniu pierwszego procesu.
+        Jeżeli proces zakończy się awaryjnie bez release(), segment pozostanie w pamięci do wywołania SharedTensorDataset.unlink(name).
+
+        Układ segmentu: nagłówek int64 [licznik, N, C, H, W], etykiety int64 [N], dane uint8 [N, C, H, W].
+    """
+    HEADER_SIZE = 5
+    owners = weakref.WeakSet()
+
+    def __init__(self, name, factory, transform = None):
+        self.name = name
+        self.transform = transform
+        self.owner = True
+        self.pid = os.getpid()
+        self.released = False
+        with SharedTensorDataset.__lock(name):
+            try:
+                shm = SharedTensorDataset.__open(name, create=False)
+                numpy.ndarray((SharedTensorDataset.HEADER_SIZE,), dtype=numpy.int64, buffer=shm.buf)[0] += 1
+            except FileNotFoundError:
+                inputs, labels = factory()
+                inputs = numpy.ascontiguousarray(inputs, dtype=numpy.uint8)
+                labels = numpy.ascontiguousarray(labels, dtype=numpy.int64)
+                labelsOffset = SharedTensorDataset.HEADER_SIZE * 8
+                shm = SharedTensorDataset.__open(name, create=True, size=labelsOffset + labels.nbytes + inputs.nbytes)
+                numpy.ndarray((SharedTensorDataset.HEADER_SIZE,), dtype=numpy.int64, buffer=shm.buf)[:] = (1, *inputs.shape)
+                numpy.ndarray(labels.shape, dtype=numpy.int64, buffer=shm.buf, offset=labelsOffset)[:] = labels
+                numpy.ndarray(inputs.shape, dtype=numpy.uint8, buffer=shm.buf, offset=labelsOffset + labels.nbytes)[:] = inputs
+                sf.Output.printBash("Created shared memory dataset '{}' ({} bytes).".format(name, shm.size), 'info')
+        self.__attach(shm)
+        SharedTensorDataset.owners.add(self)
+
+    def segmentName(*parts):
+        # nazwy segmentów są na niektórych systemach ograniczone do 31 znaków
+        return 'smoothing_' + hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+    def __lockPath(name):
+        return os.path.join(tempfile.gettempdir(), name + '.lock')
+
+    @contextlib.contextmanager
+    def __lock(name):
+        with open(SharedTensorDataset.__lockPath(name), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __open(name, create, size = 0):
+        try:
+            return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+        except TypeError: # python < 3.13
+            shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            return shm
+
+    def __attach(self, shm):
+        self.shm = shm
+        header = numpy.ndarray((SharedTensorDataset.HEADER_SIZE,), dtype=numpy.int64, buffer=shm.buf)
+        size, shape = int(header[1]), tuple(int(x) for x in header[1:])
+        labelsOffset = SharedTensorDataset.HEADER_SIZE * 8
+        self.targets = numpy.ndarray((size,), dtype=numpy.int64, buffer=shm.buf, offset=labelsOffset)
+        self.data = numpy.ndarray(shape, dtype=numpy.uint8, buffer=shm.buf, offset=labelsOffset + size * 8)
+        self.targets.setflags(write=False)
+        self.data.setflags(write=False)
+
+    def __detach(self):
+        # tablice wskazujące na bufor segmentu muszą zostać usunięte przed jego zamknięciem
+        self.data = None
+        self.targets = None
+        shm, self.shm = self.shm, None
+        return shm
+
+    def release(self):
+        """
+            Zmniejsza licznik referencji i zamyka segment. Ostatni proces usuwa segment. Bezpieczne do wielokrotnego wywołania.
+        """
+        if(self.released or self.shm is None):
+            return
+        self.released = True
+        SharedTensorDataset.owners.discard(self)
+        if(not self.owner or self.pid != os.getpid()):
+            self.__detach().close()
+            return
+        with SharedTensorDataset.__lock(self.name):
+            header = numpy.ndarray((SharedTensorDataset.HEADER_SIZE,), dtype=numpy.int64, buffer=self.shm.buf)
+            header[0] -= 1
+            last = header[0] <= 0
+            del header
+            shm = self.__detach()
+            if(last):
+                shm.unlink()
+            shm.close()
+
+    def releaseAll():
+        """
+            Zwalnia wszystkie istniejące obiekty utworzone w tym procesie. Wywoływane przy zakończeniu procesu.
+        """
+        for dataset in list(SharedTensorDataset.owners):
+            try:
+                dataset.release()
+            except Exception as e:
+                sf.Output.printBash("Could not release shared memory dataset '{}': {}".format(dataset.name, e), 'warn')
+
+    def unlink(name):
+        """
+            Usuwa segment niezależnie od licznika referencji, np. po awaryjnym zakończeniu procesów.
+        """
+        with SharedTensorDataset.__lock(name):
+            try:
+                shm = SharedTensorDataset.__open(name, create=False)
+            except FileNotFoundError:
+                return
+            shm.close()
+            shm.unlink()
+
+    def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
+
+    def __getstate__(self):
+        # proces roboczy dołącza do segmentu bez zwiększania licznika referencji
+        state = self.__dict__.copy()
+        del state['shm']
+        del state['data']
+        del state['targets']
+        state['owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__attach(SharedTensorDataset.__open(self.name, create=False))
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        sample = torch.from_numpy(self.data[idx].copy())
+        if(self.transform is not None):
+            sample = self.transform(sample)
+        return sample, int(self.targets[idx])
+
+atexit.register(SharedTensorDataset.releaseAll)
+
+class SyntheticDataset(torch.utils.data.TensorDataset):
+    """
+        Deterministyczny zbiór losowych próbek uint8 [C, H, W] oraz etykiet, generowany w pamięci bez dostępu do sieci i dysku.
+        Ten sam seed daje zawsze te same dane. Jako TensorDataset może zostać użyty bezpośrednio przez sf.ResidentTensorLoader.
+    """
+    def __init__(self, size, shape = (3, 32, 32), classes = 10, seed = 0, transform = None):
+        generator = torch.Generator().manual_seed(seed)
+        inputs = torch.randint(0, 256, (size, *shape), generator=generator, dtype=torch.uint8)
+        labels = torch.randint(0, classes, (size,), generator=generator)
+        super().__init__(inputs, labels)
+        self.transform = transform
+
+    def __getitem__(self, idx):
+        sample, label = super().__getitem__(idx)
+        if(self.transform is not None):
+            sample = self.transform(sample)
+        return sample, label
+
+class ShardedDataset(torch.utils.data.IterableDataset):
+    """
+        Zbiór danych odczytywany sekwencyjnie z plików (shardów) utworzonych przez ShardedDataset.pack, 
+        dzięki czemu nie musi mieścić się w pamięci. Każdy shard składa się z rekordów o stałym rozmiarze: 
+        etykieta int64 oraz próbka uint8 [C, H, W]. Plik path.json opisuje kształt próbki oraz listę shardów.
+
+        Kolejność shardów jest mieszana dla każdego epoch'u (setEpoch), a shardy dzielone są pomiędzy procesy DataLoadera
+        tak, że proces o numerze w czyta co workers-ty shard. Próbki mieszane są w buforze o rozmiarze shuffleBuffer.
+
+        Wznowienie: pozycja w strumieniu to dla każdego procesu trójka (numer sharda na jego liście, numer rekordu w shardzie, 
+        liczba wydanych próbek). Para (shard, rekord) wskazuje pierwszy nieodczytany rekord, czyli uwzględnia również rekordy 
+        znajdujące się w buforze mieszającym. setResume ustawia pozycje, od których procesy zaczną czytać, przesuwając się w pliku 
+        bez odczytu wcześniejszych rekordów. Zawartość bufora oraz stan generatora liczb losowych odtwarzane są przez symulację 
+        mieszania na numerach rekordów (bez odczytu danych), a same rekordy z bufora wczytywane są pojedynczo. 
+        Dzięki temu wznowiony strumień nie powtarza ani nie gubi żadnej próbki.
+    """
+    def __init__(self, path, transform = None, shuffleBuffer = 1024, shuffleShards = True, seed = 984, readChunk = 256):
+        self.path = path
+        self.transform = transform
+        self.shuffleBuffer = shuffleBuffer
+        self.shuffleShards = shuffleShards
+        self.seed = seed
+        self.readChunk = readChunk
+        self.epoch = 0
+        self.resume = None
+        with open(path + '.json', 'r') as f:
+            manifest = json.load(f)
+        self.shape = tuple(manifest['shape'])
+        self.shards = manifest['shards']
+        self.recordSize = 8 + int(numpy.prod(self.shape))
+
+    def __len__(self):
+        return sum(shard['count'] for shard in self.shards)
+
+    def setEpoch(self, epoch):
+        self.epoch = epoch
+
+    def setResume(self, positions):
+        self.resume = positions
+
+    def workerShards(self, worker, workers):
+        order = list(range(len(self.shards)))
+        if(self.shuffleShards):
+            random.Random(self.seed + self.epoch).shuffle(order)
+        return order[worker::workers]
+
+    def positions(self, batches, batchSize, workers):
+        """
+            Zwraca pozycje [numer sharda na liście procesu, numer rekordu, liczba wydanych próbek] dla każdego z workers procesów 
+            po pobraniu batches paczek. DataLoader pobiera paczki od procesów na zmianę, 
+            dlatego proces w utworzył paczki o numerach w, w + workers, ...
+            Numer rekordu wskazuje pierwszy nieodczytany rekord, czyli wydane próbki oraz zawartość bufora mieszającego.
+        """
+        workers = max(1, workers)
+        result = []
+        for worker in range(workers):
+            yielded = max(0, (batches - worker + workers - 1) // workers) * batchSize
+            counts = [self.shards[shard]['count'] for shard in self.workerShards(worker, workers)]
+            read, _, _ = self.__schedule(counts, self.__rng(worker), yielded)
+            result.append(self.__locate(counts, read) + [yielded])
+        return result
+
+    def __rng(self, worker):
+        return random.Random(self.seed * 1000 + self.epoch * 100 + worker)
+
+    def __locate(self, counts, read):
+        pos = 0
+        while(pos < len(counts) and read >= counts[pos]):
+            read -= counts[pos]
+            pos += 1
+        return [pos, read if pos < len(counts) else 0]
+
+    def __schedule(self, counts, rng, yielded):
+        """
+            Symuluje mieszanie z __iter__ na numerach rekordów w strumieniu procesu, do chwili wydania yielded próbek.
+            Zwraca (liczba odczytanych rekordów, numery rekordów w buforze, czy odczyt się zakończył). 
+            rng pozostaje w tym samym stanie co w __iter__ po wydaniu yielded próbek.
+        """
+        total = sum(counts)
+        buffer = []
+        read, emitted = 0, 0
+        while(emitted < yielded and read < total):
+            if(self.shuffleBuffer <= 1):
+                emitted += 1
+            elif(len(buffer) < self.shuffleBuffer):
+                buffer.append(read)
+            else:
+                buffer[rng.randrange(len(buffer))] = read
+                emitted += 1
+            read += 1
+        if(emitted < yielded): # wydawanie pozostałości bufora po odczytaniu wszystkich rekordów
+            rng.shuffle(buffer)
+            return read, buffer[yielded - emitted:], True
+        return read, buffer, False
+
+    def __readRecord(self, shards, counts, ordinal):
+        pos, offset = self.__locate(counts, ordinal)
+        with open(os.path.join(os.path.dirname(self.path), self.shards[shards[pos]]['file']), 'rb') as f:
+            f.seek(offset * self.recordSize)
+            record = numpy.frombuffer(f.read(self.recordSize), dtype=numpy.uint8)
+        return record[8:].reshape(self.shape), record[:8].copy().view(numpy.int64)[0]
+
+    def __readShard(self, shard, offset):
+        with open(os.path.join(os.path.dirname(self.path), self.shards[shard]['file']), 'rb') as f:
+            f.seek(offset * self.recordSize)
+            while(True):
+                chunk = f.read(self.recordSize * self.readChunk)
+                if(not chunk):
+                    return
+                records = numpy.frombuffer(chunk, dtype=numpy.uint8).reshape(-1, self.recordSize)
+                labels = records[:, :8].copy().view(numpy.int64).reshape(-1)
+                samples = records[:, 8:].reshape(-1, *self.shape)
+                for idx in range(len(labels)):
+                    yield samples[idx], labels[idx]
+
+    def __item(self, record):
+        sample = torch.from_numpy(record[0].copy())
+        if(self.transform is not None):
+            sample = self.transform(sample)
+        return sample, int(record[1])
+
+    def __iter__(self):
+        info = torch.utils.data.get_worker_info()
+        worker, workers = (info.id, info.num_workers) if info is not None else (0, 1)
+        shards = self.workerShards(worker, workers)
+        counts = [self.shards[shard]['count'] for shard in shards]
+        rng = self.__rng(worker)
+        start, offset = 0, 0
+        buffer = []
+        finished = False
+        if(self.resume is not None and len(self.resume) == workers):
+            start, offset = self.resume[worker][:2]
+            if(len(self.resume[worker]) > 2): # odtworzenie bufora mieszającego oraz stanu rng
+                _, ordinals, finished = self.__schedule(counts, rng, self.resume[worker][2])
+                buffer = [self.__readRecord(shards, counts, ordinal) for ordinal in ordinals]
+
+        if(not finished):
+            for pos in range(start, len(shards)):
+                for record in self.__readShard(shards[pos], offset if pos == start else 0):
+                    if(self.shuffleBuffer <= 1):
+                        yield self.__item(record)
+                    elif(len(buffer) < self.shuffleBuffer):
+                        buffer.append(record)
+                    else:
+                        idx = rng.randrange(len(buffer))
+                        buffer[idx], record = record, buffer[idx]
+                        yield self.__item(record)
+            rng.shuffle(buffer)
+        for record in buffer:
+            yield self.__item(record)
+
+    def shardPath(name, train):
+        return os.path.join(sf.StaticData.DATA_PATH, 'shards', name + ('_train' if train else '_test'))
+
+    def pack(path, data, targets, samplesPerShard = 10000):
+        """
+            Zapisuje dane (patrz MemmapDataset.toNCHW) oraz etykiety do shardów po samplesPerShard rekordów. 
+            Plik path.json zapisywany jest na końcu i oznacza kompletny zapis.
+        """
+        data = MemmapDataset.toNCHW(data)
+        targets = numpy.asarray(targets, dtype=numpy.int64)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        base = os.path.basename(path)
+        tmp = '.' + str(os.getpid()) + '.tmp'
+        shards = []
+        for number, start in enumerate(range(0, len(data), samplesPerShard)):
+            samples = data[start:start + samplesPerShard].reshape(-1, int(numpy.prod(data.shape[1:])))
+            labels = numpy.ascontiguousarray(targets[start:start + samplesPerShard]).view(numpy.uint8).reshape(-1, 8)
+            fileName = '{}-{:05d}.shard'.format(base, number)
+            numpy.concatenate([labels, samples], axis=1).tofile(os.path.join(os.path.dirname(path), fileName) + tmp)
+            os.replace(os.path.join(os.path.dirname(path), fileName) + tmp, os.path.join(os.path.dirname(path), fileName))
+            shards.append({'file': fileName, 'count': len(samples)})
+        with open(path + '.json' + tmp, 'w') as f:
+            json.dump({'shape': list(data.shape[1:]), 'shards': shards}, f)
+        os.replace(path + '.json' + tmp, path + '.json')
+
+class BatchAugment():
+    """
+        Augmentacja wykonywana na całej paczce danych zamiast na pojedynczych próbkach. 
+        Odpowiada transformacjom RandomCrop(size, padding), RandomHorizontalFlip() oraz Normalize(mean, std), 
+        gdzie size to int lub para (wysokość, szerokość),
+        przy czym przesunięcia wycinka oraz odbicia losowane są dla całej paczki naraz, a wycinanie, odbicie 
+        i normalizacja wykonywane są jedną operacją indeksowania oraz jedną operacją arytmetyczną.
+
+        Paczki typu uint8 są zamieniane na float z zakresu [0, 1] tak jak w transforms.ToTensor().
+        Może zostać wywołana na urządzeniu modelu albo w procesach DataLoadera przez BatchAugmentCollate.
+    """
+    def __init__(self, size = 32, padding = 4, flip = True, mean = (0.4914, 0.4822, 0.4465), std = (0.2023, 0.1994, 0.2010)):
+        self.size = size
+        self.padding = padding
+        self.flip = flip
+        self.mean = mean
+        self.std = std
+
+    def normalize(inputs, mean, std):
+        if(inputs.dtype == torch.uint8):
+            inputs = inputs.float().div_(255)
+        mean = torch.tensor(mean, dtype=inputs.dtype, device=inputs.device).view(-1, 1, 1)
+        std = torch.tensor(std, dtype=inputs.dtype, device=inputs.device).view(-1, 1, 1)
+        return (inputs - mean) / std
+
+    def augment(self, inputs):
+        """
+            Losowe wycinki o rozmiarze size z paczki dopełnionej zerami oraz losowe odbicia w poziomie.
+        """
+        batch, channels, height, width = inputs.shape
+        sizeY, sizeX = (self.size, self.size) if isinstance(self.size, int) else self.size
+        device = inputs.device
+        padded = torch.nn.functional.pad(inputs, (self.padding, self.padding, self.padding, self.padding))
+        offsetY = torch.randint(0, height + 2 * self.padding - sizeY + 1, (batch, 1), device=device)
+        offsetX = torch.randint(0, width + 2 * self.padding - sizeX + 1, (batch, 1), device=device)
+        rows = offsetY + torch.arange(sizeY, device=device)
+        cols = offsetX + torch.arange(sizeX, device=device)
+        if(self.flip):
+            flipMask = torch.rand(batch, 1, device=device) < 0.5
+            cols = torch.where(flipMask, cols.flip(1), cols)
+
+        return padded[
+            torch.arange(batch, device=device).view(-1, 1, 1, 1),
+            torch.arange(channels, device=device).view(1, -1, 1, 1),
+            rows.view(batch, 1, -1, 1),
+            cols.view(batch, 1, 1, -1)
+        ]
+
+    def __call__(self, inputs, train):
+        if(train):
+            inputs = self.augment(inputs)
+        return BatchAugment.normalize(inputs, self.mean, self.std)
+
+    def __repr__(self):
+        return 'BatchAugment(size={}, padding={}, flip={}, mean={}, std={})'.format(self.size, self.padding, self.flip, self.mean, self.std)
+
+class BatchAugmentCollate():
+    """
+        Funkcja łącząca próbki w paczkę dla DataLoadera, która wykonuje BatchAugment w procesach roboczych.
+    """
+    def __init__(self, batchAugment, train):
+        self.batchAugment = batchAugment
+        self.train = train
+
+    def __call__(self, batch):
+        inputs, labels = torch.utils.data.dataloader.default_collate(batch)
+        return self.batchAugment(inputs, self.train), labels
+
+    def __repr__(self):
+        return 'BatchAugmentCollate({}, train={})'.format(self.batchAugment, self.train)
+
+class DataRegistry():
+    """
+        Rejestr zbiorów danych oraz loaderów współdzielonych w obrębie jednego procesu.
+        Kolejne powtórzenia eksperymentu oraz komórki przeszukiwania hiperparametrów tworzą nowe obiekty DefaultData,
+        które przy ustawionym DefaultData_Metadata.shareDatasets pobierają stąd gotowe zbiory danych, 
+        zamiast ponownie wczytywać pliki, oraz loadery z trwałymi procesami roboczymi (persistent_workers), 
+        zamiast ponownie je uruchamiać.
+
+        Loader jest współdzielony tylko przy identycznych parametrach. Przy ponownym użyciu podmieniany jest jedynie sampler 
+        (zarówno loader.sampler, jak i loader.batch_sampler.sampler), 
+        dlatego stan wznowienia (startIndex) nowego obiektu DefaultData jest zachowany. 
+        Procesy robocze nie są uruchamiane ponownie, więc worker_init_fn wywoływany jest tylko raz.
+    """
+    datasets = {}
+    loaders = {}
+
+    def dataset(key, factory):
+        if(key not in DataRegistry.datasets):
+            DataRegistry.datasets[key] = factory()
+        return DataRegistry.datasets[key]
+
+    def loader(key, factory, sampler = None):
+        loader = DataRegistry.loaders.get(key)
+        if(loader is None):
+            loader = factory()
+            DataRegistry.loaders[key] = loader
+        elif(sampler is not None):
+            loader.batch_sampler.sampler = sampler
+            object.__setattr__(loader, 'sampler', sampler) # DataLoader nie pozwala zmienić atrybutu sampler po utworzeniu
+        return loader
+
+    def clear():
+        """
+            Usuwa wszystkie zbiory danych oraz loadery. Trwałe procesy robocze kończą działanie razem z loaderem.
+            Zbiory w pamięci współdzielonej są zwalniane jawnie, bez czekania na odśmiecanie.
+        """
+        DataRegistry.loaders.clear()
+        for dataset in DataRegistry.datasets.values():
+            if(isinstance(dataset, SharedTensorDataset)):
+                dataset.release()
+        DataRegistry.datasets.clear()
+
 class DefaultData(sf.Data):
     """
         Domyślna klasa na dane. Jeżeli zabrakło pamięci, należy zwrócić uwagę na rozmiar wejściowego obrazka. Można go zmniejszyć
         uswawiając odpowiedni rozmiar w metadanych dla tej klasy argumentem resizeTo. 
     """
+    NORMALIZE_MEAN = (0.4914, 0.4822, 0.4465)
+    NORMALIZE_STD = (0.2023, 0.1994, 0.2010)
+
     def __init__(self, dataMetadata):
         super().__init__(dataMetadata=dataMetadata)
         self.testAlias = 'statLossTest_normal'
@@ -927,24 +1513,44 @@ class DefaultData(sf.Data):
         )
         """
 
-        if(dataMetadata.resizeTo is not None):
+        self.batchAugment = None
+        self.batchAugmentOnDevice = False
+        self.deviceNormalize = False
+        self.fromGrayToRGB = dataMetadata.fromGrayToRGB
+        cropSize = self.__cropSize__(dataMetadata)
+        self.resizeTo = dataMetadata.resizeTo
+        resident = getattr(dataMetadata, 'residentData', None) is not None
+        if(getattr(dataMetadata, 'batchAugment', None) is not None or resident):
+            # augmentacja oraz normalizacja wykonywane są dla całej paczki przez BatchAugment
+            # ResidentTensorLoader nie wykonuje transformacji, dlatego wtedy augmentacja odbywa się zawsze na urządzeniu modelu
+            self.batchAugment = BatchAugment(size=cropSize, mean=DefaultData.NORMALIZE_MEAN, std=DefaultData.NORMALIZE_STD)
+            self.batchAugmentOnDevice = resident or dataMetadata.batchAugment == 'device'
+            if(self.__rawSamples__(dataMetadata)):
+                self.trainTransform = None
+                self.testTransform = None
+            else:
+                self.trainTransform = transforms.ToTensor()
+                self.testTransform = transforms.ToTensor()
+        elif(self.__rawSamples__(dataMetadata)):
+            # próbki są tensorami uint8; ToTensor oraz Normalize wykonuje __batchTransform__
             self.trainTransform = transforms.Compose([
-                #transforms.Resize(dataMetadata.resizeTo),
-                transforms.RandomCrop(32, padding=4),
+                transforms.RandomCrop(cropSize, padding=4),
                 transforms.RandomHorizontalFlip(),
-                transforms.ToTensor(),
-                #transforms.Lambda(DefaultData.lambdaGrayToRGB if dataMetadata.fromGrayToRGB else DefaultData.NoneTransform),
-                transforms.Normalize((0.4914, 0.4822, 0.4465), (0.2023, 0.1994, 0.2010)), 
             ])
-            self.testTransform = transforms.Compose([
-                #transforms.Resize(dataMetadata.resizeTo),
+            self.testTransform = None
+        elif(dataMetadata.resizeTo is not None or dataMetadata.fromGrayToRGB):
+            # zmiana liczby kanałów, normalizacja oraz zmiana rozmiaru wykonywane są na urządzeniu modelu w __batchTransform__,
+            # dzięki czemu paczki przesyłane są w oryginalnym rozmiarze
+            self.deviceNormalize = True
+            self.trainTransform = transforms.Compose([
+                transforms.RandomCrop(cropSize, padding=4),
+                transforms.RandomHorizontalFlip(),
                 transforms.ToTensor(),
-                #transforms.Lambda(DefaultData.lambdaGrayToRGB if dataMetadata.fromGrayToRGB else DefaultData.NoneTransform),
-                transforms.Normalize((0.4914, 0.4822, 0.4465), (0.2023, 0.1994, 0.2010)),
             ])
+            self.testTransform = transforms.ToTensor()
         else:
             self.trainTransform = transforms.Compose([
-                transforms.RandomCrop(32, padding=4),
+                transforms.RandomCrop(cropSize, padding=4),
                 transforms.RandomHorizontalFlip(),
                 transforms.ToTensor(),
                 #transforms.Lambda(DefaultData.lambdaGrayToRGB if dataMetadata.fromGrayToRGB else DefaultData.NoneTransform),
@@ -968,6 +1574,170 @@ class DefaultData(sf.Data):
     def __prepare__(self, dataMetadata):
         raise NotImplementedError("def __prepare__(self, dataMetadata)")
 
+    def __cropSize__(self, dataMetadata):
+        """
+            Rozmiar wycinka losowej augmentacji zbioru treningowego - int lub para (wysokość, szerokość). 
+            Musi być równy rozmiarowi próbek zbioru testowego, który nie jest przycinany.
+        """
+        return 32
+
+    def __rawSamples__(self, dataMetadata):
+        """
+            Zwraca True, jeżeli zbiór danych zwraca próbki jako tensory uint8 [C, H, W] zamiast obrazów PIL.
+        """
+        return getattr(dataMetadata, 'memmapCache', False) or getattr(dataMetadata, 'sharedMemory', False)
+
+    def __batchTransform__(self, inputs, train):
+        """
+            Wykonywane na urządzeniu modelu dla całej paczki, w kolejności:
+            - zamiana obrazów w skali szarości na RGB (fromGrayToRGB) przez rozszerzenie wymiaru kanału bez kopiowania,
+            - BatchAugment, jeżeli został skonfigurowany na urządzeniu modelu, albo sama normalizacja dla paczek typu uint8 
+                (MemmapDataset) lub gdy normalizacja została przeniesiona na urządzenie,
+            - zmiana rozmiaru do resizeTo przez interpolację dwuliniową.
+        """
+        if(self.fromGrayToRGB and inputs.dim() == 4 and inputs.shape[1] == 1):
+            inputs = inputs.expand(-1, 3, -1, -1)
+
+        if(self.batchAugment is not None and self.batchAugmentOnDevice):
+            inputs = self.batchAugment(inputs, train)
+        elif(inputs.dtype == torch.uint8 or self.deviceNormalize):
+            inputs = BatchAugment.normalize(inputs, DefaultData.NORMALIZE_MEAN, DefaultData.NORMALIZE_STD)
+
+        if(self.resizeTo is not None):
+            size = (self.resizeTo, self.resizeTo) if isinstance(self.resizeTo, int) else tuple(self.resizeTo)
+            if(tuple(inputs.shape[-2:]) != size):
+                inputs = torch.nn.functional.interpolate(inputs, size=size, mode='bilinear', align_corners=False)
+        return inputs
+
+    def __createDatasets__(self, datasetClass, dataMetadata, **kwargs):
+        """
+            Tworzy self.trainset oraz self.testset dla klasy zbioru danych torchvision. 
+            Jeżeli dataMetadata.memmapCache jest ustawione, zbiory wczytywane są przez MemmapDataset.
+        """
+        self.trainset = self.__createDataset__(datasetClass, dataMetadata, True, self.trainTransform, **kwargs)
+        self.testset = self.__createDataset__(datasetClass, dataMetadata, False, self.testTransform, **kwargs)
+
+    def __createDataset__(self, datasetClass, dataMetadata, train, transform, **kwargs):
+        memmap = getattr(dataMetadata, 'memmapCache', False)
+        sharedMemory = getattr(dataMetadata, 'sharedMemory', False)
+        def load(transform):
+            if(memmap):
+                return MemmapDataset.fromTorchvision(datasetClass, train=train, transform=transform, download=dataMetadata.download, **kwargs)
+            return datasetClass(root=sf.StaticData.DATA_PATH, train=train, transform=transform, download=dataMetadata.download, **kwargs)
+
+        def decoded():
+            inputs, labels = DefaultData.residentTensors(load(None))
+            return inputs.numpy(), labels.numpy()
+
+        def factory():
+            if(sharedMemory):
+                name = SharedTensorDataset.segmentName(datasetClass.__name__, train, sorted(kwargs.items()), sf.StaticData.DATA_PATH)
+                return SharedTensorDataset(name, decoded, transform=transform)
+            return load(transform)
+
+        if(not getattr(dataMetadata, 'shareDatasets', False)):
+            return factory()
+        key = (datasetClass.__name__, train, memmap, sharedMemory, repr(transform), tuple(sorted(kwargs.items())), sf.StaticData.DATA_PATH)
+        return DataRegistry.dataset(key, factory)
+
+    def __createLoaders__(self, dataMetadata, trainShuffle = False):
+        """
+            Tworzy samplery oraz loadery dla self.trainset oraz self.testset.
+            trainShuffle - zamiast samplera treningowego używa shuffle=True w pojedynczym procesie.
+        """
+        self.trainSampler = self.__createTrainSampler__(dataMetadata)
+        self.testSampler = sf.BaseSampler(len(self.testset), dataMetadata.batchTestSize)
+        if(isinstance(self.trainSampler, sf.LossAwareSampler)):
+            trainShuffle = False # kolejność paczek musi pochodzić z samplera
+
+        if(getattr(dataMetadata, 'residentData', None) is not None):
+            onDevice = dataMetadata.residentData == 'device'
+            shuffle = trainShuffle and sf.distributedWorldSize() <= 1 # przy wielu procesach dane muszą zostać podzielone przez sampler
+            self.trainloader = sf.ResidentTensorLoader(*DefaultData.residentTensors(self.trainset), batchSize=dataMetadata.batchTrainSize, 
+                sampler=None if shuffle else self.trainSampler, onDevice=onDevice, shuffle=shuffle)
+            self.testloader = sf.ResidentTensorLoader(*DefaultData.residentTensors(self.testset), batchSize=dataMetadata.batchTestSize, 
+                sampler=self.testSampler, onDevice=onDevice)
+            return
+
+        workerInit = dataMetadata.worker_seed if sf.enabledDeterminism() else None
+        trainCollate = None
+        if(self.batchAugment is not None and not self.batchAugmentOnDevice):
+            trainCollate = BatchAugmentCollate(self.batchAugment, train=True)
+
+        if(trainShuffle):
+            workerInit = None
+        trainSettings = self.loaderSettings(self.trainset, dataMetadata.batchTrainSize, dataMetadata.pin_memoryTrain, dataMetadata, 
+            collate_fn=trainCollate, worker_init_fn=workerInit)
+
+        if(trainShuffle):
+            distributed = sf.distributedWorldSize() > 1 # przy wielu procesach dane muszą zostać podzielone przez sampler
+            self.trainloader = self.__createLoader__(self.trainset, dataMetadata.batchTrainSize, self.trainSampler if distributed else None,
+                                            not distributed, trainCollate, workerInit, trainSettings, dataMetadata)
+        else:
+            self.trainloader = self.__createLoader__(self.trainset, dataMetadata.batchTrainSize, self.trainSampler, False, trainCollate, workerInit, 
+                                            trainSettings, dataMetadata)
+        self.testLoaderArgs = (not trainShuffle, workerInit)
+        self.__createTestLoader__(dataMetadata)
+
+    def __createTestLoader__(self, dataMetadata):
+        """
+            Tworzy self.testloader dla bieżącego dataMetadata.batchTestSize z argumentami zapisanymi w self.testLoaderArgs 
+            (czy użyć self.testSampler, worker_init_fn).
+        """
+        useSampler, workerInit = self.testLoaderArgs
+        testCollate = None
+        if(self.batchAugment is not None and not self.batchAugmentOnDevice):
+            testCollate = BatchAugmentCollate(self.batchAugment, train=False)
+        testSettings = self.loaderSettings(self.testset, dataMetadata.batchTestSize, dataMetadata.pin_memoryTest, dataMetadata, 
+            collate_fn=testCollate, worker_init_fn=workerInit)
+        self.testloader = self.__createLoader__(self.testset, dataMetadata.batchTestSize, self.testSampler if useSampler else None, False, 
+                                        testCollate, workerInit, testSettings, dataMetadata)
+
+    def __recreateTestLoader__(self, dataMetadata):
+        if(isinstance(self.testloader, sf.ResidentTensorLoader)):
+            self.testloader = self.testloader.withBatchSize(dataMetadata.batchTestSize)
+            return
+        self.__createTestLoader__(dataMetadata)
+
+    def __createTrainSampler__(self, dataMetadata):
+        """
+            Przy ustawionym dataMetadata.lossAwareSampling zwraca sf.LossAwareSampler. Sampler odtworzony razem z obiektem 
+            z zapisanego stanu jest używany ponownie, aby zachować zebrane straty oraz sekwencję bieżącego epoch'u.
+        """
+        if(not getattr(dataMetadata, 'lossAwareSampling', False)):
+            return sf.createSampler(len(self.trainset), dataMetadata.batchTrainSize)
+        if(sf.distributedWorldSize() > 1):
+            sf.Output.printBash("LossAwareSampler does not support distributed training. Using default sampler.", 'warn')
+            return sf.createSampler(len(self.trainset), dataMetadata.batchTrainSize)
+        old = getattr(self, 'trainSampler', None)
+        if(isinstance(old, sf.LossAwareSampler) and old.dataSize == len(self.trainset) and old.batchSize == dataMetadata.batchTrainSize):
+            return old
+        return sf.LossAwareSampler(len(self.trainset), dataMetadata.batchTrainSize)
+
+    def residentTensors(dataset):
+        """
+            Zwraca całe dane zbioru jako tensor uint8 [N, C, H, W] oraz tensor etykiet.
+        """
+        if(isinstance(dataset, (MemmapDataset, SharedTensorDataset))):
+            return torch.from_numpy(numpy.array(dataset.data)), torch.from_numpy(numpy.array(dataset.targets))
+        if(isinstance(dataset, torch.utils.data.TensorDataset)):
+            return dataset.tensors
+        return torch.from_numpy(MemmapDataset.toNCHW(dataset.data)), torch.as_tensor(dataset.targets, dtype=torch.long)
+
+    def __createLoader__(self, dataset, batchSize, sampler, shuffle, collate, workerInit, settings, dataMetadata):
+        """
+            Przy ustawionym dataMetadata.shareDatasets loader pobierany jest z DataRegistry, a procesy robocze są trwałe.
+        """
+        if(not getattr(dataMetadata, 'shareDatasets', False)):
+            return torch.utils.data.DataLoader(dataset, batch_size=batchSize, sampler=sampler, shuffle=shuffle, 
+                worker_init_fn=workerInit, collate_fn=collate, **settings)
+
+        if(settings['num_workers'] > 0):
+            settings = dict(settings, persistent_workers=True)
+        key = (id(dataset), batchSize, sampler is None, type(sampler).__name__, shuffle, repr(collate), workerInit, tuple(sorted(settings.items())))
+        return DataRegistry.loader(key, lambda: torch.utils.data.DataLoader(dataset, batch_size=batchSize, sampler=sampler, shuffle=shuffle, 
+                worker_init_fn=workerInit, collate_fn=collate, **settings), sampler=sampler)
+
     def __update__(self, dataMetadata):
         self.__prepare__(dataMetadata)
 
@@ -975,9 +1745,11 @@ class DefaultData(sf.Data):
         super().__beforeTrainLoop__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
         model.getNNModelModule().train()
 
+    @sf.forwardHook
     def __beforeTrain__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         super().__beforeTrain__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
 
+    @sf.forwardHook
     def __afterTrain__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         super().__afterTrain__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
 
@@ -1006,6 +1778,7 @@ class DefaultData(sf.Data):
         super().__beforeTestLoop__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
         metadata.stream.print("\n\ntestLoop;\nAverage test time;Loop test time;Accuracy;Avg loss", ['stat'])
 
+    @sf.forwardHook
     def __beforeTest__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         super().__beforeTest__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
 
@@ -1064,17 +1837,9 @@ class DefaultDataMNIST(DefaultData):
 
         #self.trainset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform)
         #self.testset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform)
-        self.trainset = torchvision.datasets.MNIST(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform, download=dataMetadata.download)
-        self.testset = torchvision.datasets.MNIST(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform, download=dataMetadata.download)
+        self.__createDatasets__(torchvision.datasets.MNIST, dataMetadata)
 
-        self.trainSampler = sf.BaseSampler(len(self.trainset), dataMetadata.batchTrainSize)
-        self.testSampler = sf.BaseSampler(len(self.testset), dataMetadata.batchTestSize)
-
-        self.trainloader = torch.utils.data.DataLoader(self.trainset, batch_size=dataMetadata.batchTrainSize, sampler=self.trainSampler,
-                                          shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTrain, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
-
-        self.testloader = torch.utils.data.DataLoader(self.testset, batch_size=dataMetadata.batchTestSize, sampler=self.testSampler,
-                                         shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTest, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
+        self.__createLoaders__(dataMetadata)
 
 class DefaultDataEMNIST(DefaultData):
     def __init__(self, dataMetadata):
@@ -1085,17 +1850,9 @@ class DefaultDataEMNIST(DefaultData):
 
         #self.trainset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform)
         #self.testset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform)
-        self.trainset = torchvision.datasets.EMNIST(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform, split='digits', download=dataMetadata.download)
-        self.testset = torchvision.datasets.EMNIST(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform, split='digits', download=dataMetadata.download)
-
-        self.trainSampler = sf.BaseSampler(len(self.trainset), dataMetadata.batchTrainSize)
-        self.testSampler = sf.BaseSampler(len(self.testset), dataMetadata.batchTestSize)
+        self.__createDatasets__(torchvision.datasets.EMNIST, dataMetadata, split='digits')
 
-        self.trainloader = torch.utils.data.DataLoader(self.trainset, batch_size=dataMetadata.batchTrainSize, sampler=self.trainSampler,
-                                          shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTrain, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
-
-        self.testloader = torch.utils.data.DataLoader(self.testset, batch_size=dataMetadata.batchTestSize, sampler=self.testSampler,
-                                         shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTest, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
+        self.__createLoaders__(dataMetadata)
 
 class DefaultDataCIFAR10(DefaultData):
     def __init__(self, dataMetadata):
@@ -1109,17 +1866,9 @@ class DefaultDataCIFAR10(DefaultData):
 
         #self.trainset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform)
         #self.testset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform)
-        self.trainset = torchvision.datasets.CIFAR10(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform, download=dataMetadata.download)
-        self.testset = torchvision.datasets.CIFAR10(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform, download=dataMetadata.download)
-
-        self.trainSampler = sf.BaseSampler(len(self.trainset), dataMetadata.batchTrainSize)
-        self.testSampler = sf.BaseSampler(len(self.testset), dataMetadata.batchTestSize)
+        self.__createDatasets__(torchvision.datasets.CIFAR10, dataMetadata)
 
-        self.trainloader = torch.utils.data.DataLoader(self.trainset, batch_size=dataMetadata.batchTrainSize,# sampler=self.trainSampler,
-                                          shuffle=True, num_workers=2, pin_memory=dataMetadata.pin_memoryTrain)#, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
-
-        self.testloader = torch.utils.data.DataLoader(self.testset, batch_size=dataMetadata.batchTestSize,# sampler=self.testSampler,
-                                         shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTest)#, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
+        self.__createLoaders__(dataMetadata, trainShuffle=True)
 
 class DefaultDataCIFAR100(DefaultData):
     def __init__(self, dataMetadata):
@@ -1133,19 +1882,167 @@ class DefaultDataCIFAR100(DefaultData):
 
         #self.trainset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform)
         #self.testset = torchvision.datasets.ImageNet(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform)
-        self.trainset = torchvision.datasets.CIFAR100(root=sf.StaticData.DATA_PATH, train=True, transform=self.trainTransform, download=dataMetadata.download)
-        self.testset = torchvision.datasets.CIFAR100(root=sf.StaticData.DATA_PATH, train=False, transform=self.testTransform, download=dataMetadata.download)
+        self.__createDatasets__(torchvision.datasets.CIFAR100, dataMetadata)
 
-        self.trainSampler = sf.BaseSampler(len(self.trainset), dataMetadata.batchTrainSize)
-        self.testSampler = sf.BaseSampler(len(self.testset), dataMetadata.batchTestSize)
+        self.__createLoaders__(dataMetadata)
 
-        self.trainloader = torch.utils.data.DataLoader(self.trainset, batch_size=dataMetadata.batchTrainSize, sampler=self.trainSampler,
-                                          shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTrain, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
 
-        self.testloader = torch.utils.data.DataLoader(self.testset, batch_size=dataMetadata.batchTestSize, sampler=self.testSampler,
-                                         shuffle=False, num_workers=2, pin_memory=dataMetadata.pin_memoryTest, worker_init_fn=dataMetadata.worker_seed if sf.enabledDeterminism() else None)
+class DefaultDataSharded_Metadata(DefaultData_Metadata):
+    """
+        shardName - nazwa zbioru spakowanego przez packShards.py, np. 'CIFAR10' lub 'EMNIST_split-digits'.
+        shuffleBuffer - rozmiar bufora mieszającego próbki zbioru treningowego.
+        numWorkers - liczba procesów DataLoadera, pomiędzy które dzielone są shardy.
+        Pozostałe argumenty są przekazywane do DefaultData_Metadata.
+    """
+    def __init__(self, shardName = 'CIFAR10', shuffleBuffer = 2048, numWorkers = 2, **kwargs):
+        super().__init__(**kwargs)
+        self.shardName = shardName
+        self.shuffleBuffer = shuffleBuffer
+        self.numWorkers = numWorkers
+
+    def __strAppend__(self):
+        tmp_str = super().__strAppend__()
+        tmp_str += ('Shard name:\t{}\n'.format(self.shardName))
+        tmp_str += ('Shuffle buffer:\t{}\n'.format(self.shuffleBuffer))
+        tmp_str += ('Number of workers:\t{}\n'.format(self.numWorkers))
+        return tmp_str
+
+class DefaultDataSharded(DefaultData):
+    """
+        Dane odczytywane strumieniowo przez ShardedDataset z shardów utworzonych przez packShards.py.
+        Przy zapisie stanu zapamiętywana jest pozycja (shard, rekord) każdego procesu DataLoadera, 
+        dzięki czemu wznowienie przesuwa się w plikach bez ponownego odczytu pobranych już paczek.
+
+        Nie obsługuje residentData, lossAwareSampling (strumień nie ma indeksów próbek), shareDatasets (trwałe procesy robocze 
+        nie otrzymałyby nowej pozycji wznowienia) ani autoTuneLoader (liczba procesów wyznacza podział shardów i zapisane pozycje).
+    """
+    UNSUPPORTED = ('residentData', 'lossAwareSampling', 'shareDatasets', 'autoTuneLoader')
+
+    def __init__(self, dataMetadata):
+        self.streamBatch = 0
+        self.trainStreamPosition = None
+        super().__init__(dataMetadata=dataMetadata)
+
+    def __rawSamples__(self, dataMetadata):
+        return True
+
+    def __prepare__(self, dataMetadata):
+        for flag in DefaultDataSharded.UNSUPPORTED:
+            if(getattr(dataMetadata, flag, None) not in (None, False)):
+                raise Exception("DefaultDataSharded does not support '{}'. Got: {}".format(flag, getattr(dataMetadata, flag)))
+        self.__setInputTransform__(dataMetadata)
+
+        self.trainset = ShardedDataset(ShardedDataset.shardPath(dataMetadata.shardName, True), transform=self.trainTransform, 
+            shuffleBuffer=dataMetadata.shuffleBuffer)
+        self.testset = ShardedDataset(ShardedDataset.shardPath(dataMetadata.shardName, False), transform=self.testTransform, 
+            shuffleBuffer=0, shuffleShards=False)
+
+        trainCollate, testCollate = None, None
+        if(self.batchAugment is not None and not self.batchAugmentOnDevice):
+            trainCollate = BatchAugmentCollate(self.batchAugment, train=True)
+            testCollate = BatchAugmentCollate(self.batchAugment, train=False)
+        self.trainloader = self.__createLoader__(self.trainset, dataMetadata.batchTrainSize, None, False, trainCollate, None, 
+            self.loaderSettings(self.trainset, dataMetadata.batchTrainSize, dataMetadata.pin_memoryTrain, dataMetadata, numWorkers=dataMetadata.numWorkers), 
+            dataMetadata)
+        self.testloader = self.__createLoader__(self.testset, dataMetadata.batchTestSize, None, False, testCollate, None, 
+            self.loaderSettings(self.testset, dataMetadata.batchTestSize, dataMetadata.pin_memoryTest, dataMetadata, numWorkers=dataMetadata.numWorkers), 
+            dataMetadata)
+
+    def __customizeState__(self, state):
+        super().__customizeState__(state)
+        if(self.trainset is not None and self.trainloader is not None):
+            state['trainStreamPosition'] = {
+                'epoch': self.trainset.epoch,
+                'workers': self.trainloader.num_workers,
+                'positions': self.trainset.positions(self.streamBatch, self.trainloader.batch_size, self.trainloader.num_workers)
+            }
+
+    def __beforeTrainLoop__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
+        super().__beforeTrainLoop__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        self.trainset.setEpoch(helperEpoch.epochNumber)
+
+    def __batchIterator__(self, loader, startNumb, dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata'):
+        """
+            Zamiast pomijać startNumb paczek, ustawia pozycję startową strumienia. Numery paczek zaczynają się od startNumb.
+        """
+        dataset = loader.dataset
+        if(startNumb > 0):
+            recorded = self.trainStreamPosition if loader is self.trainloader else None
+            if(recorded is not None and recorded['epoch'] == dataset.epoch and recorded['workers'] == loader.num_workers):
+                positions = recorded['positions']
+            else:
+                positions = dataset.positions(startNumb, loader.batch_size, loader.num_workers)
+            sf.Output.printBash("Resuming stream at (shard, record) positions {}.".format(positions), 'info')
+            dataset.setResume(positions)
+        else:
+            dataset.setResume(None)
+        self.trainStreamPosition = None
+        if(loader is self.trainloader):
+            self.streamBatch = startNumb
+        source = super().__batchIterator__(loader=loader, startNumb=0, dataMetadata=dataMetadata, modelMetadata=modelMetadata)
+
+        def shifted():
+            try:
+                for batch, inputs, labels in source:
+                    dataset.setResume(None) # procesy DataLoadera otrzymały już kopię pozycji startowej
+                    if(loader is self.trainloader):
+                        self.streamBatch = batch + startNumb + 1
+                    yield batch + startNumb, inputs, labels
+            finally:
+                source.close()
+        return shifted()
+
+class DefaultDataSynthetic_Metadata(DefaultData_Metadata):
+    """
+        shape - kształt pojedynczej próbki [C, H, W].
+        classes - liczba klas.
+        trainSize, testSize - liczba próbek zbioru treningowego oraz testowego.
+        seed - ziarno generatora danych; zbiór testowy używa seed + 1.
+        Domyślnie fromGrayToRGB jest ustawione tylko dla jednego kanału. Pozostałe argumenty są przekazywane do DefaultData_Metadata.
+    """
+    def __init__(self, shape = (3, 32, 32), classes = 10, trainSize = 1024, testSize = 256, seed = 0, **kwargs):
+        kwargs.setdefault('fromGrayToRGB', shape[0] == 1)
+        kwargs.setdefault('download', False)
+        super().__init__(**kwargs)
+        self.shape = tuple(shape)
+        self.classes = classes
+        self.trainSize = trainSize
+        self.testSize = testSize
+        self.seed = seed
+
+    def __strAppend__(self):
+        tmp_str = super().__strAppend__()
+        tmp_str += ('Synthetic sample shape:\t{}\n'.format(self.shape))
+        tmp_str += ('Synthetic classes:\t{}\n'.format(self.classes))
+        tmp_str += ('Synthetic train size:\t{}\n'.format(self.trainSize))
+        tmp_str += ('Synthetic test size:\t{}\n'.format(self.testSize))
+        tmp_str += ('Synthetic seed:\t{}\n'.format(self.seed))
+        return tmp_str
+
+class DefaultDataSynthetic(DefaultData):
+    """
+        Losowe dane o zadanym kształcie, przeznaczone do testów wydajności oraz szybkiego sprawdzenia całego wywołania dc.run 
+        na komputerze bez dostępu do sieci ani zbiorów danych. Obsługuje te same tryby co pozostałe klasy DefaultData, 
+        w tym residentData.
+    """
+    def __init__(self, dataMetadata):
+        super().__init__(dataMetadata=dataMetadata)
+
+    def __rawSamples__(self, dataMetadata):
+        return True
+
+    def __cropSize__(self, dataMetadata):
+        return tuple(dataMetadata.shape[-2:])
+
+    def __prepare__(self, dataMetadata):
+        self.__setInputTransform__(dataMetadata)
 
+        self.trainset = SyntheticDataset(dataMetadata.trainSize, shape=dataMetadata.shape, classes=dataMetadata.classes, 
+            seed=dataMetadata.seed, transform=self.trainTransform)
+        self.testset = SyntheticDataset(dataMetadata.testSize, shape=dataMetadata.shape, classes=dataMetadata.classes, 
+            seed=dataMetadata.seed + 1, transform=self.testTransform)
 
+        self.__createLoaders__(dataMetadata)
 
 ModelMap = {
     'simpleConvModel': DefaultModelSimpleConv,
@@ -1156,7 +2053,9 @@ DataMap = {
     'MNIST': DefaultDataMNIST,
     'CIFAR10': DefaultDataCIFAR10,
     'CIFAR100': DefaultDataCIFAR100,
-    'EMNIST': DefaultDataEMNIST
+    'EMNIST': DefaultDataEMNIST,
+    'sharded': DefaultDataSharded,
+    'synthetic': DefaultDataSynthetic
 }
 
 SmoothingMap = {
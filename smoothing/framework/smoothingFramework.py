@@ -4,6 +4,8 @@ import torchvision.transforms as transforms
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 import os, sys, getopt
 from os.path import expanduser
 import signal
@@ -14,13 +16,37 @@ from pathlib import Path
 import pandas as pd
 import errno
 import csv
-import operator
 import copy
+import functools
+import threading
+import queue
+import collections
+import json
+import socket
+import pickle
+import io
+import shutil
+import atexit
+import concurrent.futures
+import hashlib
+import zlib
+import lzma
+import struct
+import stat
+import http.server
+import socketserver
+import contextlib
+try:
+    import fcntl
+except ImportError: # brak na Windows; BlobStore korzysta wtedy z okresu karencji zamiast blokady
+    fcntl = None
 
 import matplotlib.pyplot as plt
 import numpy
 
 SAVE_AND_EXIT_FLAG = False
+CHECKPOINT_WRITER = None
+CHECKPOINT_POLICY = None
 
 
 def saveWorkAndExit(signumb, frame):
@@ -39,6 +65,81 @@ def enabledDeterminism():
 def enabledSaveAndExit():
     return bool(SAVE_AND_EXIT_FLAG)
 
+def enabledAsyncCheckpoint():
+    return CHECKPOINT_WRITER is not None
+
+def useAsyncCheckpoint(snapshotMode = 'copy', shardSize = 64 * 2**20, pinned = True, deduplicate = False, compression = None, compressionWorkers = None):
+    """
+    Włącza zapis stanu programu przez ShardedCheckpointWriter. Od tej pory SaveClass.trySave tylko wykonuje migawkę tensorów, 
+    a zapis na dysk odbywa się w wątku w tle.
+    deduplicate - jeżeli True, to tensory zapisywane są do BlobStore, dzięki czemu te same wagi zapisane przez różne obiekty 
+        (np. model oraz kopia wag w klasie wygładzania) trafiają na dysk tylko raz.
+    compression - 'zlib' lub 'lzma'. Każdy obiekt zapisywany jest jako ChunkedArchive, kompresowany równolegle przez compressionWorkers wątków.
+    """
+    global CHECKPOINT_WRITER
+    if(CHECKPOINT_WRITER is not None):
+        CHECKPOINT_WRITER.close()
+    CHECKPOINT_WRITER = ShardedCheckpointWriter(snapshotMode=snapshotMode, shardSize=shardSize, pinned=pinned, deduplicate=deduplicate, 
+        compression=compression, compressionWorkers=compressionWorkers)
+    return CHECKPOINT_WRITER
+
+def waitForCheckpoints():
+    """
+    Czeka na zakończenie wszystkich zapisów zleconych w tle. Zwraca False, jeżeli któryś z nich się nie powiódł.
+    """
+    if(CHECKPOINT_WRITER is None):
+        return True
+    return CHECKPOINT_WRITER.wait()
+
+def checkpointBarrier():
+    """
+    Punkt synchronizacji przed modyfikacją stanu zapisywanych obiektów (np. przed krokiem treningu). 
+    Przy zapisie w tle w trybie 'reference' czeka na zakończenie zleconych zapisów, w pozostałych przypadkach nic nie robi.
+    """
+    if(CHECKPOINT_WRITER is not None):
+        CHECKPOINT_WRITER.barrier()
+
+def loadMapLocation():
+    """
+    Urządzenie, na które wczytywane są tensory zapisanego stanu programu. Bez dostępnego GPU tensory zapisane na CUDA trafiają na CPU.
+    """
+    return None if torch.cuda.is_available() else 'cpu'
+
+def _Private_torchLoad(path, mapLocation = None):
+    """
+    Wczytuje plik z torch.save, mapując dane tensorów do pamięci (mmap). Zawartość tensorów jest wczytywana z dysku 
+    dopiero przy pierwszym dostępie. Starsze wersje pytorch oraz pliki w starym formacie wczytywane są w całości.
+    """
+    try:
+        return torch.load(path, map_location=mapLocation, mmap=True, weights_only=False)
+    except TypeError: # brak argumentów mmap / weights_only
+        return torch.load(path, map_location=mapLocation)
+    except RuntimeError: # plik w formacie innym niż zip nie może zostać zmapowany
+        return torch.load(path, map_location=mapLocation, weights_only=False)
+
+def _Private_remapDevice(obj, mapLocation):
+    """
+    Obiekty metadanych przechowują urządzenie w zmiennej device. Przy wczytaniu na CPU zapisu z CUDA zmieniamy je na CPU, 
+    aby metody __update__ nie przenosiły modelu z powrotem na niedostępne urządzenie.
+    """
+    if(mapLocation != 'cpu'):
+        return
+    device = getattr(obj, 'device', None)
+    if(device is not None and 'cuda' in str(device)):
+        Output.printBash("{}: device '{}' is not available. Remapped to 'cpu'.".format(type(obj).__name__, device), 'warn')
+        obj.device = 'cpu' if isinstance(device, str) else torch.device('cpu')
+
+def useCheckpointPolicy(everyBatches = None, everyMinutes = None, keepLast = 1):
+    """
+    Włącza okresowy zapis stanu programu w trakcie pętli treningowej. Wywołanie z domyślnymi argumentami wyłącza zapis.
+    """
+    global CHECKPOINT_POLICY
+    if(everyBatches is None and everyMinutes is None):
+        CHECKPOINT_POLICY = None
+    else:
+        CHECKPOINT_POLICY = CheckpointPolicy(everyBatches=everyBatches, everyMinutes=everyMinutes, keepLast=keepLast)
+    return CHECKPOINT_POLICY
+
 signal.signal(signal.SIGQUIT, saveWorkAndExit) # Ctrl + \
 
 signal.signal(signal.SIGINT, terminate)
@@ -61,6 +162,25 @@ def useDeterministic(torchSeed = 0, randomSeed = 0):
 def warnings():
     return StaticData.FORCE_PRINT_WARNINGS or StaticData.PRINT_WARNINGS
 
+def distributedWorldSize():
+    """
+    Zwraca liczbę procesów biorących udział w treningu. Bez zainicjalizowanej grupy procesów zwraca 1.
+    """
+    if(dist.is_available() and dist.is_initialized()):
+        return dist.get_world_size()
+    return 1
+
+def distributedRank():
+    if(dist.is_available() and dist.is_initialized()):
+        return dist.get_rank()
+    return 0
+
+def isMainProcess():
+    """
+    Tylko główny proces (rank 0) zapisuje logi, statystyki oraz stan programu i wykonuje wygładzanie.
+    """
+    return distributedRank() == 0
+
 class StaticData:
     PATH = os.path.join(expanduser("~"), '.data', 'models')
     TMP_PATH = os.path.join(expanduser("~"), '.data', 'models', 'tmp')
@@ -76,6 +196,7 @@ class StaticData:
     SMOOTHING_METADATA_SUFFIX = '.smthmd'
     NAME_CLASS_METADATA = 'Metadata'
     DATA_PATH = os.path.join(expanduser("~"), '.data')
+    CACHE_PATH = os.path.join(expanduser("~"), '.data', 'cache')
     PREDEFINED_MODEL_SUFFIX = '.pdmodel'
     LOG_FOLDER = os.path.join('.', 'savedLogs')
     IGNORE_IO_WARNINGS = False
@@ -94,19 +215,34 @@ class SaveClass:
     Child class should implement its own trySave, getFileSuffix(self = None), canUpdate() methods.
     """
 
-    def tryLoad(metadata, Class, classMetadataObj = None, temporaryLocation = False):
+    def loadFile(path, mapLocation = None):
+        if(ChunkedArchive.isArchive(path)):
+            return ShardedCheckpointWriter.loadArchive(path, map_location=mapLocation)
+        if(ShardedCheckpointWriter.isManifest(path)):
+            return ShardedCheckpointWriter.load(path, map_location=mapLocation)
+        return _Private_torchLoad(path, mapLocation)
+
+    def tryLoad(metadata, Class, classMetadataObj = None, temporaryLocation = False, mapLocation = None):
+        """
+        mapLocation - urządzenie, na które trafią wczytane tensory. Domyślnie wartość loadMapLocation().
+        """
         suffix = Class.getFileSuffix()
         fileName = metadata.fileNameLoad
         path = None
-        if(temporaryLocation):
+        if(fileName is None):
+            pass
+        elif(temporaryLocation):
             path = StaticData.TMP_PATH + fileName + suffix
         else:
-            path = StaticData.PATH + fileName + suffix
-        if fileName is not None and os.path.exists(path):
-            toLoad = torch.load(path)
+            prefix = CheckpointPolicy.loadPrefix(fileName)
+            path = (prefix + os.path.basename(fileName) if prefix != StaticData.PATH else StaticData.PATH + fileName) + suffix
+        if path is not None and os.path.exists(path):
+            mapLocation = loadMapLocation() if mapLocation is None else mapLocation
+            toLoad = SaveClass.loadFile(path, mapLocation)
             loadedClassNameStr = toLoad['classNameStr']
             obj = toLoad['obj']
             obj.only_Key_Ingredients = None
+            _Private_remapDevice(obj, mapLocation)
             if(loadedClassNameStr == Class.__name__):
                 Output.printBash(Class.__name__ + ' loaded successfully', 'info')
                 if(Class.canUpdate() == True):
@@ -118,6 +254,8 @@ class SaveClass:
         return None
 
     def trySave(self, metadata, suffix: str, onlyKeyIngredients = False, temporaryLocation = False) -> bool:
+        if(not isMainProcess()):
+            return False
         if(metadata.fileNameSave is None):
             Output.printBash(type(self).__name__ + ' save not enabled', 'info')
             return False
@@ -132,13 +270,616 @@ class SaveClass:
                 'classNameStr': type(self).__name__,
                 'obj': self
             }
-            torch.save(toSave, path)
+            if(CHECKPOINT_WRITER is not None):
+                try:
+                    CHECKPOINT_WRITER.save(toSave, path, name=type(self).__name__)
+                finally:
+                    self.only_Key_Ingredients = None
+                return True
+            torch.save(toSave, path + '.tmp')
+            os.replace(path + '.tmp', path)
             self.only_Key_Ingredients = None
             Output.printBash(type(self).__name__ + ' saved successfully', 'info')
             return True
         Output.printBash(type(self).__name__ + ' save failure', 'info')
         return False
 
+class _Private_TensorRefPickler(pickle.Pickler):
+    """
+    Zamiast tensorów zapisuje do strumienia jedynie ich numer. Same tensory trafiają do listy tensors po przejściu przez snapshot.
+    """
+    def __init__(self, file, tensors, snapshot):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.tensors = tensors
+        self.snapshot = snapshot
+        self.tensorMemo = {}
+
+    def persistent_id(self, obj):
+        if(not isinstance(obj, torch.Tensor)):
+            return None
+        key = id(obj)
+        if(key not in self.tensorMemo):
+            self.tensorMemo[key] = (len(self.tensors), obj) # trzymamy referencję, aby id nie zostało ponownie użyte
+            self.tensors.append(self.snapshot(obj))
+        return ('tensor', self.tensorMemo[key][0], isinstance(obj, nn.Parameter), obj.requires_grad)
+
+class _Private_TensorRefUnpickler(pickle.Unpickler):
+    """
+    Pickle nie zapamiętuje obiektów zwróconych przez persistent_load, dlatego robi to tensorMemo.
+    Dzięki temu ten sam numer tensora zwraca zawsze ten sam obiekt, np. parametry modelu i parametry w optimizer.param_groups.
+    """
+    def __init__(self, file, tensors):
+        super().__init__(file)
+        self.tensors = tensors
+        self.tensorMemo = {}
+
+    def persistent_load(self, pid):
+        _, index, isParameter, requiresGrad = pid
+        if(index in self.tensorMemo):
+            return self.tensorMemo[index]
+        tensor = self.tensors[index]
+        if(isParameter):
+            tensor = nn.Parameter(tensor, requires_grad=requiresGrad)
+        elif(requiresGrad and tensor.is_floating_point()):
+            tensor.requires_grad_(True)
+        self.tensorMemo[index] = tensor
+        return tensor
+
+class ShardedCheckpointWriter():
+    """
+    Zapisuje obiekty SaveClass jako zbiór plików z tensorami (shardów) oraz mały manifest w formacie json.
+    Metoda save wykonuje się w wątku wywołującym tylko na czas migawki: graf obiektu jest serializowany przez pickle, 
+    przy czym każdy tensor zastępowany jest swoim numerem, a jego zawartość kopiowana do bufora w pamięci hosta.
+    Zapis shardów na dysk odbywa się w wątku w tle, dlatego trening może być kontynuowany od razu.
+
+    snapshotMode:
+        'copy' - tensory z GPU kopiowane są do buforów typu pinned, a tensory z CPU klonowane. Bezpieczne bez dodatkowej synchronizacji.
+        'reference' - zapamiętywane są same referencje do tensorów, bez kopii. save wraca od razu, a zapis w tle musi się zakończyć, 
+            zanim tensory zostaną zmienione. Pętla treningowa wywołuje w tym celu checkpointBarrier() przed każdym krokiem treningu.
+
+    Manifest zapisywany jest na końcu pod docelową ścieżką przez os.replace, dlatego plik pod tą ścieżką zawsze wskazuje na kompletny zapis.
+    Shardy każdego zapisu znajdują się w osobnym katalogu <ścieżka>.shards-<numer>, a katalog wskazywany przez poprzedni manifest 
+    jest usuwany dopiero po jego podmianie.
+
+    Dla deduplicate=True zamiast shardów tensory oraz szkielet obiektu zapisywane są do BlobStore w katalogu manifestu, 
+    a manifest przechowuje jedynie ich klucze. Po podmianie manifestu usuwane są bloby, do których nie odwołuje się już żaden manifest.
+
+    Dla compression równego 'zlib' lub 'lzma' zamiast manifestu pod docelową ścieżką zapisywany jest ChunkedArchive 
+    zawierający szkielet obiektu oraz każdy tensor jako osobny wpis, dzięki czemu pojedynczy tensor można odczytać bez 
+    dekompresji całego pliku (archiveTensor).
+    """
+    FORMAT = 'smoothing-sharded-checkpoint'
+    VERSION = 1
+    SKELETON_FILE = 'skeleton.pkl'
+
+    def __init__(self, snapshotMode = 'copy', shardSize = 64 * 2**20, pinned = True, deduplicate = False, compression = None, compressionWorkers = None):
+        if(snapshotMode not in ('copy', 'reference')):
+            raise Exception("Unknown snapshotMode: {}. Expected 'copy' or 'reference'.".format(snapshotMode))
+        if(compression is not None and compression not in ChunkedArchive.CODECS):
+            raise Exception("Unknown compression: {}. Expected one of {}.".format(compression, list(ChunkedArchive.CODECS)))
+        if(compression is not None and deduplicate):
+            raise Exception("ShardedCheckpointWriter: compression and deduplicate cannot be used together.")
+        self.snapshotMode = snapshotMode
+        self.shardSize = shardSize
+        self.pinned = pinned
+        self.deduplicate = deduplicate
+        self.compression = compression
+        self.compressionWorkers = compressionWorkers
+        self.queue = queue.Queue()
+        self.thread = None
+        self.failed = []
+        self.closed = False
+        atexit.register(self.close)
+
+    def __snapshotTensor__(self, tensor):
+        tensor = tensor.detach()
+        if(self.snapshotMode == 'reference'):
+            return tensor
+        if(tensor.device.type == 'cuda'):
+            buffer = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=self.pinned)
+            buffer.copy_(tensor, non_blocking=True)
+            return buffer
+        return tensor.clone()
+
+    def snapshot(self, obj):
+        """
+        Zwraca parę (szkielet obiektu w postaci bajtów, lista tensorów).
+        """
+        tensors = []
+        stream = io.BytesIO()
+        _Private_TensorRefPickler(stream, tensors, self.__snapshotTensor__).dump(obj)
+        if(self.snapshotMode == 'copy' and torch.cuda.is_available() and torch.cuda.is_initialized()):
+            torch.cuda.synchronize() # kopie non_blocking muszą się zakończyć, zanim wątek zapisu je odczyta
+        return stream.getvalue(), tensors
+
+    def save(self, obj, path, name = None):
+        if(self.closed):
+            raise Exception("ShardedCheckpointWriter is closed.")
+        skeleton, tensors = self.snapshot(obj)
+        if(self.thread is None or not self.thread.is_alive()):
+            self.thread = threading.Thread(target=self.__worker__, name='ShardedCheckpointWriter', daemon=True)
+            self.thread.start()
+        self.queue.put((skeleton, tensors, path, name if name is not None else os.path.basename(path)))
+
+    def after(self, callback):
+        """
+        Wywołuje callback() w wątku zapisu po zakończeniu wszystkich wcześniej zleconych zapisów.
+        """
+        if(self.thread is None or not self.thread.is_alive()):
+            self.thread = threading.Thread(target=self.__worker__, name='ShardedCheckpointWriter', daemon=True)
+            self.thread.start()
+        self.queue.put(callback)
+
+    def barrier(self):
+        """
+        W trybie 'reference' czeka na zakończenie zleconych zapisów, ponieważ odwołują się one do tensorów, które zaraz zostaną zmienione. 
+        W trybie 'copy' migawka jest niezależna od tensorów, dlatego nie czeka.
+        """
+        if(self.snapshotMode == 'reference' and self.queue.unfinished_tasks > 0):
+            self.queue.join()
+
+    def __worker__(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if(task is None):
+                    return
+                if(callable(task)):
+                    try:
+                        task()
+                    except Exception as ex:
+                        Output.printBash('Checkpoint writer callback failure: {}'.format(ex), 'err')
+                else:
+                    self.__write__(*task)
+            finally:
+                self.queue.task_done()
+
+    def __groupShards__(self, tensors):
+        shards = []
+        current = []
+        size = 0
+        for index, tensor in enumerate(tensors):
+            current.append(index)
+            size += tensor.numel() * tensor.element_size()
+            if(size >= self.shardSize):
+                shards.append(current)
+                current = []
+                size = 0
+        if(current):
+            shards.append(current)
+        return shards
+
+    def __writeShards__(self, skeleton, tensors, path):
+        shardsDirName = os.path.basename(path) + '.shards-' + str(time.time_ns())
+        shardsDir = os.path.join(os.path.dirname(path), shardsDirName)
+        Path(shardsDir).mkdir(parents=True, exist_ok=False)
+        manifest = {
+            'format': ShardedCheckpointWriter.FORMAT,
+            'version': ShardedCheckpointWriter.VERSION,
+            'shardsDir': shardsDirName,
+            'skeleton': ShardedCheckpointWriter.SKELETON_FILE,
+            'tensors': len(tensors),
+            'shards': []
+        }
+        for numb, indices in enumerate(self.__groupShards__(tensors)):
+            fileName = '{:05d}.pt'.format(numb)
+            torch.save([tensors[i] for i in indices], os.path.join(shardsDir, fileName))
+            manifest['shards'].append({'file': fileName, 'count': len(indices)})
+        with open(os.path.join(shardsDir, ShardedCheckpointWriter.SKELETON_FILE), 'wb') as file:
+            file.write(skeleton)
+        return manifest, '{} tensors in {} shards'.format(len(tensors), len(manifest['shards']))
+
+    def __writeBlobs__(self, skeleton, tensors, path):
+        store = BlobStore(os.path.join(os.path.dirname(path), BlobStore.DIR_NAME))
+        keys = []
+        written = 0
+        for tensor in tensors:
+            key, isNew = store.put(tensor)
+            keys.append(key)
+            written += int(isNew)
+        manifest = {
+            'format': ShardedCheckpointWriter.FORMAT,
+            'version': ShardedCheckpointWriter.VERSION,
+            'blobStore': BlobStore.DIR_NAME,
+            'skeleton': store.putBytes(skeleton),
+            'tensors': len(tensors),
+            'blobs': keys
+        }
+        return manifest, '{} tensors, {} new blobs'.format(len(tensors), written)
+
+    def archiveEntry(index):
+        return 'tensor/{:06d}'.format(index)
+
+    def __writeArchive__(self, skeleton, tensors, path):
+        def entries():
+            yield ShardedCheckpointWriter.SKELETON_FILE, skeleton
+            for index, tensor in enumerate(tensors):
+                stream = io.BytesIO()
+                torch.save(tensor, stream)
+                yield ShardedCheckpointWriter.archiveEntry(index), stream.getbuffer()
+        stats = ChunkedArchive.write(path, entries(), codec=self.compression, workers=self.compressionWorkers)
+        return '{} tensors, {}'.format(len(tensors), ChunkedArchive.statsStr(stats))
+
+    def __write__(self, skeleton, tensors, path, name):
+        try:
+            oldManifest = ShardedCheckpointWriter.readManifest(path)
+            tmpPath = path + '.tmp'
+            blobs = self.deduplicate and self.compression is None
+            # bloby muszą trafić do manifestu, zanim collect innego procesu policzy odwołania
+            with (BlobStore(os.path.join(os.path.dirname(path), BlobStore.DIR_NAME)).lock() if blobs else contextlib.nullcontext()):
+                if(self.compression is not None):
+                    summary = self.__writeArchive__(skeleton, tensors, tmpPath)
+                else:
+                    if(self.deduplicate):
+                        manifest, summary = self.__writeBlobs__(skeleton, tensors, path)
+                    else:
+                        manifest, summary = self.__writeShards__(skeleton, tensors, path)
+                    with open(tmpPath, 'w') as file:
+                        json.dump(manifest, file)
+                        file.flush()
+                        os.fsync(file.fileno())
+                os.replace(tmpPath, path)
+            if(oldManifest is not None):
+                ShardedCheckpointWriter.__release__(path, oldManifest)
+            Output.printBash('{} saved successfully (background, {})'.format(name, summary), 'info')
+        except Exception as ex:
+            self.failed.append((path, ex))
+            Output.printBash('{} save failure in background writer: {}'.format(name, ex), 'err')
+
+    def readManifest(path):
+        """
+        Zwraca manifest zapisany pod ścieżką path lub None, jeżeli plik nie istnieje lub nie jest manifestem.
+        """
+        if(not os.path.isfile(path) or not ShardedCheckpointWriter.isManifest(path)):
+            return None
+        try:
+            with open(path, 'r') as file:
+                manifest = json.load(file)
+        except ValueError:
+            return None
+        if(not isinstance(manifest, dict) or manifest.get('format') != ShardedCheckpointWriter.FORMAT):
+            return None
+        return manifest
+
+    def __release__(path, manifest):
+        """
+        Zwalnia dane manifestu, który nie znajduje się już pod ścieżką path.
+        """
+        dirPath = os.path.dirname(path)
+        if('shardsDir' in manifest):
+            shutil.rmtree(os.path.join(dirPath, manifest['shardsDir']), ignore_errors=True)
+        else:
+            BlobStore(os.path.join(dirPath, manifest['blobStore'])).collect(dirPath)
+
+    def remove(path):
+        """
+        Usuwa zapisany obiekt. W przypadku manifestu usuwany jest również katalog z shardami lub nieużywane już bloby.
+        """
+        manifest = ShardedCheckpointWriter.readManifest(path)
+        if(os.path.exists(path)):
+            os.remove(path)
+        if(manifest is not None):
+            ShardedCheckpointWriter.__release__(path, manifest)
+
+    def wait(self):
+        """
+        Czeka na zapisanie wszystkich zleconych obiektów. Zwraca False, jeżeli od ostatniego wywołania któryś zapis się nie powiódł.
+        """
+        self.queue.join()
+        ok = not self.failed
+        self.failed = []
+        return ok
+
+    def close(self):
+        if(self.closed):
+            return
+        self.closed = True
+        if(self.thread is not None and self.thread.is_alive()):
+            self.queue.put(None)
+            self.thread.join()
+
+    def isManifest(path):
+        with open(path, 'rb') as file:
+            return file.read(1) == b'{'
+
+    def load(path, map_location = None):
+        manifest = ShardedCheckpointWriter.readManifest(path)
+        if(manifest is None):
+            raise Exception("File {} is not a sharded checkpoint manifest.".format(path))
+        tensors = []
+        if('blobs' in manifest):
+            store = BlobStore(os.path.join(os.path.dirname(path), manifest['blobStore']))
+            tensors = [store.get(key, map_location) for key in manifest['blobs']]
+            skeleton = store.getBytes(manifest['skeleton'])
+        else:
+            shardsDir = os.path.join(os.path.dirname(path), manifest['shardsDir'])
+            for shard in manifest['shards']:
+                tensors.extend(_Private_torchLoad(os.path.join(shardsDir, shard['file']), map_location))
+            with open(os.path.join(shardsDir, manifest['skeleton']), 'rb') as file:
+                skeleton = file.read()
+        if(len(tensors) != manifest['tensors']):
+            raise Exception("Sharded checkpoint {} is incomplete: expected {} tensors, found {}.".format(path, manifest['tensors'], len(tensors)))
+        return _Private_TensorRefUnpickler(io.BytesIO(skeleton), tensors).load()
+
+    def loadArchive(path, map_location = None):
+        archive = ChunkedArchive(path)
+        tensors = []
+        while(ShardedCheckpointWriter.archiveEntry(len(tensors)) in archive.index['entries']):
+            tensors.append(ShardedCheckpointWriter.archiveTensor(path, len(tensors), map_location, archive=archive))
+        return _Private_TensorRefUnpickler(io.BytesIO(archive.read(ShardedCheckpointWriter.SKELETON_FILE)), tensors).load()
+
+    def archiveTensor(path, index, map_location = None, archive = None):
+        """
+        Odczytuje pojedynczy tensor z obiektu zapisanego jako ChunkedArchive. Dekompresowane są tylko fragmenty tego tensora.
+        Numer tensora odpowiada kolejności, w jakiej pickle napotkał tensory w grafie obiektu.
+        """
+        archive = ChunkedArchive(path) if archive is None else archive
+        return torch.load(io.BytesIO(archive.read(ShardedCheckpointWriter.archiveEntry(index))), map_location=map_location)
+
+class ChunkedArchive():
+    """
+    Kontener plików skompresowanych we fragmentach (chunkach) o stałym rozmiarze. Każdy fragment kompresowany jest niezależnie, 
+    dlatego kompresja odbywa się równolegle w puli wątków (zlib oraz lzma zwalniają GIL), a odczyt dowolnego zakresu 
+    dowolnego wpisu wymaga dekompresji jedynie obejmujących go fragmentów.
+
+    Układ pliku: MAGIC | skompresowane fragmenty | indeks json | przesunięcie indeksu (8 bajtów, little-endian) | MAGIC.
+    Indeks przechowuje dla każdego wpisu jego rozmiar oraz listę [przesunięcie, rozmiar po kompresji, rozmiar przed kompresją] fragmentów.
+    """
+    MAGIC = b'SMTHARC1'
+    SUFFIX = '.sarc'
+    CODECS = {
+        'zlib': (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+        'lzma': (lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress)
+    }
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            file.seek(-(8 + len(ChunkedArchive.MAGIC)), os.SEEK_END)
+            footer = file.read()
+            if(footer[8:] != ChunkedArchive.MAGIC):
+                raise Exception("File {} is not a complete ChunkedArchive.".format(path))
+            indexOffset = struct.unpack('<Q', footer[:8])[0]
+            file.seek(indexOffset)
+            self.index = json.loads(file.read(os.path.getsize(path) - len(footer) - indexOffset).decode('utf-8'))
+        self.decompress = ChunkedArchive.CODECS[self.index['codec']][1]
+
+    def isArchive(path):
+        with open(path, 'rb') as file:
+            return file.read(len(ChunkedArchive.MAGIC)) == ChunkedArchive.MAGIC
+
+    def names(self):
+        return list(self.index['entries'].keys())
+
+    def size(self, name):
+        return self.index['entries'][name]['size']
+
+    def read(self, name, offset = 0, size = None):
+        """
+        Zwraca bajty wpisu name z zakresu [offset, offset + size). Dekompresowane są tylko fragmenty obejmujące ten zakres.
+        """
+        entry = self.index['entries'][name]
+        end = entry['size'] if size is None else min(entry['size'], offset + size)
+        if(offset >= end):
+            return b''
+        chunkSize = self.index['chunkSize']
+        first = offset // chunkSize
+        last = (end - 1) // chunkSize
+        parts = []
+        with open(self.path, 'rb') as file:
+            for chunkOffset, compressedSize, _ in entry['chunks'][first:last + 1]:
+                file.seek(chunkOffset)
+                parts.append(self.decompress(file.read(compressedSize)))
+        data = b''.join(parts)
+        start = offset - first * chunkSize
+        return data[start:start + end - offset]
+
+    def extractAll(self, folder):
+        for name in self.names():
+            target = os.path.join(folder, *name.split('/'))
+            Path(os.path.dirname(target)).mkdir(parents=True, exist_ok=True)
+            with open(target, 'wb') as file:
+                file.write(self.read(name))
+
+    def statsStr(stats):
+        return '{:.2f} MiB -> {:.2f} MiB, ratio {:.2f}, {:.1f} MiB/s'.format(stats['rawBytes'] / 2**20, stats['compressedBytes'] / 2**20, 
+            stats['ratio'], stats['throughput'] / 2**20)
+
+    def write(path, entries, codec = 'zlib', level = None, chunkSize = 4 * 2**20, workers = None):
+        """
+        Zapisuje wpisy (nazwa, bajty) do archiwum path. Fragmenty kompresowane są w workers wątkach, 
+        przy czym w pamięci znajduje się co najwyżej kilka fragmentów na wątek oczekujących na zapis.
+        Zwraca słownik ze statystykami: rawBytes, compressedBytes, ratio, seconds, throughput (bajty nieskompresowane na sekundę).
+        """
+        if(codec not in ChunkedArchive.CODECS):
+            raise Exception("Unknown codec: {}. Expected one of {}.".format(codec, list(ChunkedArchive.CODECS)))
+        compress = ChunkedArchive.CODECS[codec][0]
+        workers = workers if workers is not None else (os.cpu_count() or 1)
+        index = {'codec': codec, 'chunkSize': chunkSize, 'entries': {}}
+        rawBytes = 0
+        start = time.perf_counter()
+        pending = collections.deque()
+
+        with open(path, 'wb') as file, concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ChunkedArchive') as executor:
+            def flush(limit):
+                while(len(pending) > limit):
+                    chunks, rawSize, future = pending.popleft()
+                    compressed = future.result()
+                    chunks.append([file.tell(), len(compressed), rawSize])
+                    file.write(compressed)
+
+            file.write(ChunkedArchive.MAGIC)
+            for name, data in entries:
+                if(name in index['entries']):
+                    raise Exception("Duplicate ChunkedArchive entry: {}".format(name))
+                view = memoryview(data).cast('B')
+                chunks = []
+                index['entries'][name] = {'size': len(view), 'chunks': chunks}
+                rawBytes += len(view)
+                for offset in range(0, len(view), chunkSize):
+                    part = view[offset:offset + chunkSize]
+                    pending.append((chunks, len(part), executor.submit(compress, part, level)))
+                    flush(2 * workers)
+            flush(0)
+
+            indexOffset = file.tell()
+            file.write(json.dumps(index).encode('utf-8'))
+            file.write(struct.pack('<Q', indexOffset))
+            file.write(ChunkedArchive.MAGIC)
+            file.flush()
+            os.fsync(file.fileno())
+            compressedBytes = file.tell()
+
+        seconds = time.perf_counter() - start
+        return {
+            'rawBytes': rawBytes,
+            'compressedBytes': compressedBytes,
+            'ratio': rawBytes / compressedBytes if compressedBytes > 0 else 0.0,
+            'seconds': seconds,
+            'throughput': rawBytes / seconds if seconds > 0 else 0.0
+        }
+
+    def packFolder(folder, path = None, codec = 'zlib', level = None, chunkSize = 4 * 2**20, workers = None, remove = False):
+        """
+        Pakuje zakończony folder (np. folder logów z savedLogs) do archiwum <folder>.sarc. 
+        Jeżeli remove jest True, to po poprawnym zapisie folder jest usuwany. Zwraca statystyki zapisu.
+        """
+        folder = os.path.normpath(folder)
+        path = folder + ChunkedArchive.SUFFIX if path is None else path
+        def entries():
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for fileName in sorted(files):
+                    filePath = os.path.join(root, fileName)
+                    with open(filePath, 'rb') as file:
+                        yield os.path.relpath(filePath, folder).replace(os.sep, '/'), file.read()
+        stats = ChunkedArchive.write(path + '.tmp', entries(), codec=codec, level=level, chunkSize=chunkSize, workers=workers)
+        os.replace(path + '.tmp', path)
+        Output.printBash('Archived {}: {}'.format(folder, ChunkedArchive.statsStr(stats)), 'info')
+        if(remove):
+            shutil.rmtree(folder)
+        return stats
+
+class BlobStore():
+    """
+    Magazyn danych adresowanych zawartością. Kluczem bloba jest skrót sha256 jego zawartości 
+    (dla tensorów również typu oraz kształtu), dlatego identyczne tensory zapisywane są na dysk tylko raz, 
+    niezależnie od tego, ile manifestów się do nich odwołuje.
+    Bloby przechowywane są w plikach <root>/<dwa pierwsze znaki klucza>/<klucz>.
+    Usuwanie nieużywanych blobów odbywa się przez collect, który zlicza odwołania ze wszystkich manifestów w danym katalogu.
+
+    Z magazynu może korzystać wiele procesów naraz (np. eksperymenty z runScheduled zapisujące do StaticData.PATH). 
+    Zapis blobów wraz z podmianą manifestu oraz collect wykonywane są pod blokadą pliku <root>.lock (fcntl.flock), 
+    dlatego collect nie usunie blobów, do których manifest innego procesu jeszcze nie został zapisany.
+    Bez fcntl collect pomija bloby zmienione w ciągu ostatnich GRACE_SECONDS sekund, a put odświeża czas modyfikacji 
+    ponownie użytego bloba. Pliki *.tmp nigdy nie są usuwane przez collect.
+    """
+    DIR_NAME = 'blobs'
+    GRACE_SECONDS = 3600
+
+    def __init__(self, root):
+        self.root = root
+
+    def key(tensor):
+        data = tensor.detach().reshape(-1).contiguous().cpu()
+        digest = hashlib.sha256('{}|{}'.format(tensor.dtype, tuple(tensor.shape)).encode())
+        if(data.numel() > 0):
+            digest.update(memoryview(data.view(torch.uint8).numpy()))
+        return digest.hexdigest()
+
+    def blobPath(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Blokada magazynu pomiędzy procesami. Nie jest wielokrotnego wejścia - collect nie może być wywołany pod blokadą.
+        """
+        if(fcntl is None):
+            yield
+            return
+        Path(os.path.dirname(self.root) or '.').mkdir(parents=True, exist_ok=True)
+        with open(self.root + '.lock', 'a') as file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def __writeFile__(self, key, write):
+        path = self.blobPath(key)
+        if(os.path.exists(path)):
+            os.utime(path) # blob ponownie użyty; chroni go przed collect bez blokady
+            return False
+        Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+        write(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return True
+
+    def put(self, tensor):
+        """
+        Zapisuje tensor, o ile blob o tej samej zawartości jeszcze nie istnieje. Zwraca parę (klucz, czy zapisano nowy blob).
+        """
+        key = BlobStore.key(tensor)
+        if(tensor.untyped_storage().nbytes() != tensor.numel() * tensor.element_size()):
+            tensor = tensor.clone() # widok na większy tensor; torch.save zapisałby cały bufor
+        return key, self.__writeFile__(key, lambda path: torch.save(tensor, path))
+
+    def putBytes(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        def write(path):
+            with open(path, 'wb') as file:
+                file.write(data)
+        self.__writeFile__(key, write)
+        return key
+
+    def get(self, key, mapLocation = None):
+        return _Private_torchLoad(self.blobPath(key), mapLocation)
+
+    def getBytes(self, key):
+        with open(self.blobPath(key), 'rb') as file:
+            return file.read()
+
+    def referenced(self, manifestDir):
+        """
+        Zwraca zbiór kluczy, do których odwołują się manifesty z katalogu manifestDir korzystające z tego magazynu.
+        """
+        keys = set()
+        for entry in os.listdir(manifestDir or '.'):
+            manifest = ShardedCheckpointWriter.readManifest(os.path.join(manifestDir, entry))
+            if(manifest is None or 'blobs' not in manifest):
+                continue
+            if(os.path.join(manifestDir, manifest['blobStore']) != self.root):
+                continue
+            keys.update(manifest['blobs'])
+            keys.add(manifest['skeleton'])
+        return keys
+
+    def collect(self, manifestDir):
+        """
+        Usuwa bloby, do których nie odwołuje się żaden manifest z katalogu manifestDir. Zwraca liczbę usuniętych plików.
+        Wykonywane pod blokadą magazynu, dlatego nie usuwa danych zapisów trwających w innych procesach.
+        """
+        if(not os.path.isdir(self.root)):
+            return 0
+        with self.lock():
+            keys = self.referenced(manifestDir)
+            oldest = time.time() - BlobStore.GRACE_SECONDS if fcntl is None else None
+            removed = 0
+            for prefix in os.listdir(self.root):
+                prefixDir = os.path.join(self.root, prefix)
+                for entry in os.listdir(prefixDir):
+                    entryPath = os.path.join(prefixDir, entry)
+                    if(entry in keys or entry.endswith('.tmp')):
+                        continue
+                    if(oldest is not None and os.path.getmtime(entryPath) > oldest):
+                        continue
+                    os.remove(entryPath)
+                    removed += 1
+                if(not os.listdir(prefixDir)):
+                    os.rmdir(prefixDir)
+        return removed
+
 class BaseSampler:
     """
     Returns a sequence of the next indices.
@@ -161,6 +902,326 @@ class BaseSampler:
     def __setstate__(self, state):
         self.__dict__.update(state)
 
+class DistributedBaseSampler(BaseSampler):
+    """
+    Wersja BaseSampler dla wielu procesów. Wszystkie procesy mieszają sekwencję tym samym ziarnem, 
+    a każdy z nich otrzymuje co worldSize-ty indeks, zaczynając od swojego numeru rank. 
+    Dzięki temu paczka o numerze b we wszystkich procesach obejmuje kolejne worldSize * batchSize indeksy całej sekwencji, 
+    co pozwala wznowić pętlę przy innej liczbie procesów.
+    Sekwencja jest uzupełniana jej początkowymi indeksami, aby każdy proces wykonał tę samą liczbę paczek.
+    """
+    def __init__(self, dataSize, batchSize, startIndex = 0, seed = 984, rank = None, worldSize = None):
+        self.rank = distributedRank() if rank is None else rank
+        self.worldSize = distributedWorldSize() if worldSize is None else worldSize
+
+        sequence = list(range(dataSize))
+        random.Random(seed).shuffle(sequence)
+        sequence += sequence[:(-len(sequence)) % self.worldSize]
+        self.sequence = sequence[self.rank::self.worldSize][startIndex * batchSize:]
+
+class LossAwareSampler(BaseSampler):
+    """
+    Sampler losujący w każdym epoch'u dataSize indeksów (ze zwracaniem) z prawdopodobieństwem zależnym od ostatniej 
+    straty danej próbki: p_i = (1 - uniformMix) * l_i^alpha / sum(l^alpha) + uniformMix / dataSize.
+    Próbki, dla których nie znamy jeszcze straty, otrzymują największą dotychczas zaobserwowaną stratę.
+    Liczba paczek w epoch'u jest taka sama jak dla BaseSampler, dlatego warunki oparte o trainTotalNumber działają bez zmian.
+
+    Strata jest ważona wagami istotności w_i = 1 / (dataSize * p_i), co zachowuje nieobciążony estymator średniej straty.
+    Strata pojedynczych próbek pobierana jest w Data.__train__ przez weightedLoss i uśredniana wykładniczo z parametrem decay.
+
+    Stan (straty, numer epoch'u, wylosowana sekwencja) jest zapisywany razem z obiektem Data. 
+    Sekwencja nieukończonego epoch'u jest zachowywana, dzięki czemu wznowienie pętli pomija te same paczki.
+    Wyczerpanie iteratora (np. przez ResidentTensorLoader lub procesy DataLoadera pobierające paczki z wyprzedzeniem) 
+    nie kończy epoch'u. Nowa sekwencja losowana jest dopiero wtedy, gdy rozpoczyna się iteracja kolejnego epoch'u: 
+    po setEpoch z innym numerem lub, bez setEpoch, przy kolejnym wywołaniu __iter__ po pełnym przejściu.
+    Działa tylko w pojedynczym procesie.
+    """
+    def __init__(self, dataSize, batchSize, startIndex = 0, seed = 984, alpha = 1.0, uniformMix = 0.1, decay = 0.5):
+        self.dataSize = dataSize
+        self.batchSize = batchSize
+        self.startIndex = startIndex
+        self.seed = seed
+        self.alpha = alpha
+        self.uniformMix = uniformMix
+        self.decay = decay
+        self.epoch = 0
+        self.losses = numpy.full(dataSize, numpy.nan)
+        self.probabilities = numpy.full(dataSize, 1.0 / dataSize)
+        self.sequence = None # sekwencja bieżącego epoch'u
+        self.sequenceEpoch = None # numer epoch'u, dla którego wylosowano sequence
+        self.exhausted = False # czy sequence została w całości zwrócona
+        self.current = None # ostatnio wylosowana sekwencja, używana do odnalezienia indeksów paczki
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.sequenceEpoch = state.get('sequenceEpoch', self.epoch if self.sequence is not None else None)
+        self.exhausted = state.get('exhausted', False)
+
+    def setEpoch(self, epoch):
+        """
+        Wywoływane przed iteracją danego epoch'u. Dla tego samego numeru (wznowienie) zachowuje wylosowaną sekwencję.
+        """
+        if(epoch != self.sequenceEpoch):
+            self.sequence = None
+        self.epoch = epoch
+        self.exhausted = False
+
+    def __draw(self):
+        losses = self.losses.copy()
+        seen = ~numpy.isnan(losses)
+        losses[~seen] = losses[seen].max() if seen.any() else 1.0
+        weights = numpy.power(numpy.maximum(losses, 1e-12), self.alpha)
+        self.probabilities = (1.0 - self.uniformMix) * weights / weights.sum() + self.uniformMix / self.dataSize
+        self.probabilities /= self.probabilities.sum()
+        rng = numpy.random.RandomState((self.seed + self.epoch) % (2**32))
+        return rng.choice(self.dataSize, size=self.dataSize, replace=True, p=self.probabilities)[self.startIndex * self.batchSize:].tolist()
+
+    def __iter__(self):
+        if(self.exhausted): # poprzedni epoch został w całości zwrócony, a setEpoch nie został wywołany
+            self.epoch += 1
+            self.sequence = None
+            self.exhausted = False
+        if(self.sequence is None or self.sequenceEpoch != self.epoch):
+            self.sequence = self.__draw()
+            self.sequenceEpoch = self.epoch
+            self.current = self.sequence
+        for idx in self.sequence:
+            yield idx
+        self.exhausted = True
+
+    def __len__(self):
+        return max(0, self.dataSize - self.startIndex * self.batchSize)
+
+    def batchIndices(self, batch):
+        return self.current[batch * self.batchSize:(batch + 1) * self.batchSize]
+
+    def update(self, indices, losses):
+        old = self.losses[indices]
+        self.losses[indices] = numpy.where(numpy.isnan(old), losses, self.decay * old + (1.0 - self.decay) * losses)
+
+    def weights(self, indices):
+        return 1.0 / (self.dataSize * self.probabilities[indices])
+
+    def weightedLoss(self, lossFun, outputs, labels, batch):
+        """
+        Oblicza stratę ważoną wagami istotności dla paczki o numerze batch i zapamiętuje straty jej próbek.
+        lossFun musi posiadać pole reduction (np. nn.CrossEntropyLoss), które na czas wywołania ustawiane jest na 'none'.
+        """
+        if(not hasattr(lossFun, 'reduction')):
+            raise Exception("LossAwareSampler requires a loss function with the 'reduction' attribute. Got '{}'.".format(type(lossFun).__name__))
+        indices = numpy.asarray(self.batchIndices(batch), dtype=numpy.int64)
+        reduction = lossFun.reduction
+        lossFun.reduction = 'none'
+        try:
+            perSample = lossFun(outputs, labels)
+        finally:
+            lossFun.reduction = reduction
+        detached = perSample.detach().float().cpu().numpy()
+        self.update(indices, detached)
+        weights = torch.as_tensor(self.weights(indices), dtype=perSample.dtype, device=perSample.device)
+        return (perSample * weights).mean()
+
+def createSampler(dataSize, batchSize, startIndex = 0, seed = 984):
+    """
+    Zwraca DistributedBaseSampler, jeżeli trening odbywa się w wielu procesach. W przeciwnym wypadku zwraca BaseSampler.
+    """
+    if(distributedWorldSize() > 1):
+        return DistributedBaseSampler(dataSize=dataSize, batchSize=batchSize, startIndex=startIndex, seed=seed)
+    return BaseSampler(dataSize=dataSize, batchSize=batchSize, startIndex=startIndex, seed=seed)
+
+class DevicePrefetcher():
+    """
+    Opakowuje obiekt zwracający paczki danych (np. torch.utils.data.DataLoader) i przygotowuje z wyprzedzeniem
+    kolejne prefetchBatches paczek na docelowym urządzeniu, aby przesyłanie danych odbywało się równolegle z obliczeniami.
+
+    Jeżeli urządzenie jest typu CUDA, a loader posiada włączone pin_memory, to kopiowanie odbywa się 
+    asynchronicznie (non_blocking) na osobnym strumieniu CUDA. W przeciwnym wypadku kolejne paczki pobierane są 
+    przez osobny wątek do ograniczonej kolejki.
+
+    Iterator zwraca krotki (batch, inputs, labels), gdzie batch jest numerem paczki w loaderze. 
+    Paczki o numerze mniejszym niż startAt są pomijane bez przenoszenia ich na urządzenie (wznowienie pętli).
+    Przy wcześniejszym wyjściu z pętli należy wywołać metodę close().
+    """
+    def __init__(self, loader, device, prefetchBatches = 2, startAt = 0):
+        self.loader = loader
+        self.device = torch.device(device) if device is not None else None
+        self.prefetchBatches = max(1, int(prefetchBatches))
+        self.startAt = startAt
+        self.iterator = None
+
+    def usesCudaStream(self):
+        return bool(self.device is not None and self.device.type == 'cuda' and torch.cuda.is_available() 
+            and getattr(self.loader, 'pin_memory', False))
+
+    def __skipBatches(self):
+        for batch, (inputs, labels) in enumerate(self.loader):
+            if(batch < self.startAt): # already iterated
+                continue
+            yield batch, inputs, labels
+
+    def __iterCudaStream(self):
+        source = self.__skipBatches()
+        stream = torch.cuda.Stream(device=self.device)
+        staged = collections.deque()
+
+        def stage():
+            try:
+                batch, inputs, labels = next(source)
+            except StopIteration:
+                return False
+            with torch.cuda.stream(stream):
+                inputs = inputs.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(stream)
+            staged.append((batch, inputs, labels, event))
+            return True
+
+        for _ in range(self.prefetchBatches):
+            if(not stage()):
+                break
+
+        while(staged):
+            batch, inputs, labels, event = staged.popleft()
+            current = torch.cuda.current_stream(self.device)
+            current.wait_event(event)
+            # pamięć zaalokowana na strumieniu pobocznym jest używana przez strumień główny
+            inputs.record_stream(current)
+            labels.record_stream(current)
+            stage()
+            yield batch, inputs, labels
+
+    def __iterThread(self):
+        buffer = queue.Queue(maxsize=self.prefetchBatches)
+        stopEvent = threading.Event()
+        endMark = object()
+
+        def put(obj):
+            while(not stopEvent.is_set()):
+                try:
+                    buffer.put(obj, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                for batch, inputs, labels in self.__skipBatches():
+                    if(self.device is not None):
+                        inputs, labels = inputs.to(self.device), labels.to(self.device)
+                    if(not put((batch, inputs, labels))):
+                        return
+            except Exception as ex:
+                put(ex)
+                return
+            put(endMark)
+
+        thread = threading.Thread(target=worker, name='DevicePrefetcher', daemon=True)
+        thread.start()
+        try:
+            while(True):
+                obj = buffer.get()
+                if(obj is endMark):
+                    break
+                if(isinstance(obj, Exception)):
+                    raise obj
+                yield obj
+        finally:
+            stopEvent.set()
+            thread.join()
+
+    def __iter__(self):
+        self.close()
+        if(self.usesCudaStream()):
+            self.iterator = self.__iterCudaStream()
+        else:
+            self.iterator = self.__iterThread()
+        return self.iterator
+
+    def __len__(self):
+        return len(self.loader)
+
+    def close(self):
+        """
+        Zatrzymuje przygotowywanie kolejnych paczek. Bezpieczne do wielokrotnego wywołania.
+        """
+        if(self.iterator is not None):
+            self.iterator.close()
+            self.iterator = None
+
+class ResidentTensorLoader():
+    """
+    Zamiennik torch.utils.data.DataLoader dla zbiorów danych mieszczących się w całości w pamięci.
+    Cały zbiór przechowywany jest jako jeden tensor wejść oraz jeden tensor etykiet, a paczki tworzone są 
+    przez indeksowanie tych tensorów kolejnymi fragmentami permutacji zwracanej przez sampler. 
+    Pomija to wywołania __getitem__ dla pojedynczych próbek, łączenie ich w paczkę oraz komunikację z procesami roboczymi.
+    Transformacje próbek nie są wykonywane, dlatego augmentację należy przeprowadzić na całej paczce w Data.__batchTransform__.
+
+    onDevice - jeżeli True, to przy pierwszej iteracji tensory przenoszone są na urządzenie przekazane do iterFrom 
+        i tam tworzone są paczki.
+    shuffle - jeżeli True, to kolejność indeksów jest mieszana permutacją zależną od seed oraz numeru epoch'u (setEpoch). 
+        Ten sam epoch daje zawsze tę samą kolejność, dzięki czemu wznowienie pętli pomija te same paczki. 
+        Bez wywołania setEpoch numer epoch'u zwiększany jest po każdym pełnym przejściu przez loader.
+    """
+    def __init__(self, inputs, labels, batchSize, sampler = None, onDevice = False, shuffle = False, seed = 984):
+        self.inputs = inputs
+        self.labels = labels
+        self.batch_size = batchSize
+        self.sampler = sampler
+        self.onDevice = onDevice
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.dataset = torch.utils.data.TensorDataset(inputs, labels)
+        self.pin_memory = False
+        self.num_workers = 0
+
+    def withBatchSize(self, batchSize):
+        loader = ResidentTensorLoader(inputs=self.inputs, labels=self.labels, batchSize=batchSize, sampler=self.sampler, onDevice=self.onDevice, 
+            shuffle=self.shuffle, seed=self.seed)
+        loader.epoch = self.epoch
+        return loader
+
+    def setEpoch(self, epoch):
+        self.epoch = epoch
+        if(hasattr(self.sampler, 'setEpoch')):
+            self.sampler.setEpoch(epoch)
+
+    def __indices(self):
+        if(self.sampler is None):
+            indices = torch.arange(len(self.labels))
+        else:
+            indices = torch.as_tensor(list(iter(self.sampler)), dtype=torch.long)
+        if(self.shuffle):
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            indices = indices[torch.randperm(len(indices), generator=generator)]
+        return indices
+
+    def __len__(self):
+        size = len(self.sampler) if self.sampler is not None else len(self.labels)
+        return (size + self.batch_size - 1) // self.batch_size
+
+    def iterFrom(self, startBatch = 0, device = None):
+        """
+        Zwraca generator krotek (batch, inputs, labels) zaczynając od paczki o numerze startBatch. 
+        Wcześniejsze paczki nie są tworzone.
+        """
+        if(self.onDevice and device is not None):
+            device = torch.device(device)
+            if(self.inputs.device != device):
+                self.inputs, self.labels = self.inputs.to(device), self.labels.to(device)
+        indices = self.__indices().to(self.inputs.device)
+        for batch in range(startBatch, len(self)):
+            idx = indices[batch * self.batch_size:(batch + 1) * self.batch_size]
+            yield batch, self.inputs[idx], self.labels[idx]
+        self.epoch += 1
+
+    def __iter__(self):
+        for batch, inputs, labels in self.iterFrom():
+            yield inputs, labels
+
 class BaseMainClass:
     def __strAppend__(self):
         return ""
@@ -350,7 +1411,22 @@ class Metadata(SaveClass, BaseMainClass):
         Aby ją ponownie użyć należy wywołać resetOutput(), który zresetuje wszystkie dane dotyczące wyjścia modelu.
     """
     def __init__(self, fileNameSave=None, fileNameLoad=None, testFlag=False, trainFlag=False, debugInfo=False, modelOutput=None,
-            debugOutput=None, stream=None, bashFlag=False, name=None, formatedOutput=None, logFolderSuffix=None, relativeRoot=None):
+            debugOutput=None, stream=None, bashFlag=False, name=None, formatedOutput=None, logFolderSuffix=None, relativeRoot=None,
+            binaryMetrics=False, asyncOutput=False, retention=None, retentionKeepRaw=False, metricsEndpoint=None, minMode=None):
+        """
+            binaryMetrics - jeżeli True, to statystyki liczbowe zapisywane w każdej paczce (czasy pętli, strata, suma wag) 
+                trafiają do binarnego pliku MetricsSink zamiast do osobnych plików csv.
+            asyncOutput - jeżeli True, to zapis logów do plików odbywa się w osobnym wątku (OutputWriter).
+            retention - polityka zachowywania wartości statystyk liczbowych zapisywanych w każdej paczce, 
+                w formacie RetentionPolicy.fromStr, np. 'nth:10', 'bucket:100:mean', 'reservoir:10000'. None - zapisywane są wszystkie.
+            retentionKeepRaw - jeżeli True, to przy ustawionym retention wszystkie wartości trafiają dodatkowo do pliku MetricsSink.
+            metricsEndpoint - adres 'host:port' lub 'unix:<ścieżka>', pod którym MetricsEndpoint udostępnia stan treningu. 
+                None - serwer nie jest uruchamiany.
+            minMode - najniższy tryb (Output.MODE_LEVELS) wypisywany przez Output.printLazy, np. 'info' pomija komunikaty 'debug'. 
+                None - wypisywane są wszystkie.
+        """
+        if(minMode not in Output.MODE_LEVELS):
+            raise Exception("Unknown output mode: '{}'. Expected one of {}.".format(minMode, list(Output.MODE_LEVELS.keys())))
         super().__init__()
         self.fileNameSave = fileNameSave
         self.fileNameLoad = fileNameLoad
@@ -370,9 +1446,16 @@ class Metadata(SaveClass, BaseMainClass):
 
         self.logFolderSuffix = logFolderSuffix
         self.relativeRoot = relativeRoot
+        self.binaryMetrics = binaryMetrics
+        self.asyncOutput = asyncOutput
+        self.retention = retention
+        self.retentionKeepRaw = retentionKeepRaw
+        self.metricsEndpoint = metricsEndpoint
+        self.minMode = minMode
 
         # zmienne wewnętrzne
         self.noPrepareOutput = False
+        self.endpoint = None # MetricsEndpoint, nie jest serializowany
 
     def __strAppend__(self):
         tmp_str = super().__strAppend__()
@@ -387,6 +1470,12 @@ class Metadata(SaveClass, BaseMainClass):
         tmp_str += ('Formated output name:\t{}\n'.format(self.formatedOutput))
         tmp_str += ('Folder sufix name:\t{}\n'.format(self.logFolderSuffix))
         tmp_str += ('Folder relative root name:\t{}\n'.format(self.relativeRoot))
+        tmp_str += ('Binary metrics:\t{}\n'.format(self.binaryMetrics))
+        tmp_str += ('Asynchronous output:\t{}\n'.format(self.asyncOutput))
+        tmp_str += ('Series retention:\t{}\n'.format(self.retention))
+        tmp_str += ('Series retention keep raw:\t{}\n'.format(self.retentionKeepRaw))
+        tmp_str += ('Metrics endpoint:\t{}\n'.format(self.metricsEndpoint))
+        tmp_str += ('Minimal output mode:\t{}\n'.format(self.minMode))
         tmp_str += ('Output is prepared flag:\t{}\n'.format(self.noPrepareOutput))
         return tmp_str
 
@@ -442,6 +1531,12 @@ class Metadata(SaveClass, BaseMainClass):
         sys.exit(2)
 
     def resetOutput(self):
+        if(self.stream is not None):
+            self.stream.finishRetention()
+            self.stream.stopWriter()
+        if(self.endpoint is not None):
+            self.endpoint.stop()
+            self.endpoint = None
         self.stream = None
         self.logFolderSuffix = None
         self.relativeRoot = None
@@ -470,31 +1565,64 @@ class Metadata(SaveClass, BaseMainClass):
         if(self.stream is None):
             self.stream = Output(self.logFolderSuffix, self.relativeRoot)
 
+        if(not isMainProcess()): # logi zapisuje tylko główny proces
+            self.stream.silent = True
+            self.noPrepareOutput = True
+            return
+
+        self.stream.minMode = self.minMode
+
+        if(self.asyncOutput):
+            self.stream.startWriter()
+        if(self.metricsEndpoint is not None and self.endpoint is None):
+            try:
+                self.endpoint = MetricsEndpoint(self.metricsEndpoint).start()
+            except OSError as ex:
+                Output.printBash("Could not start metrics endpoint at '{}': {}".format(self.metricsEndpoint, ex), 'warn')
         if(self.debugInfo == True):
             self.stream.open(metadata=self, outputType='debug', alias='debug:0', pathName='debug')
         self.stream.open(metadata=self, outputType='model', alias='model:0', pathName='model')
         self.stream.open(metadata=self, outputType='bash')
         self.stream.open(metadata=self, outputType='formatedLog', alias='stat', pathName='statistics')
 
-        self.stream.open(metadata=self, outputType='formatedLog', alias='loopTrainTime', pathName='loopTrainTime')
-        self.stream.open(metadata=self, outputType='formatedLog', alias='loopTestTime_normal', pathName='loopTestTime_normal')
-        self.stream.open(metadata=self, outputType='formatedLog', alias='loopTestTime_smooothing', pathName='loopTestTime_smooothing')
+        metricType = 'metrics' if self.binaryMetrics else 'formatedLog'
+        self.stream.open(metadata=self, outputType=metricType, alias='loopTrainTime', pathName='loopTrainTime')
+        self.stream.open(metadata=self, outputType=metricType, alias='loopTestTime_normal', pathName='loopTestTime_normal')
+        self.stream.open(metadata=self, outputType=metricType, alias='loopTestTime_smooothing', pathName='loopTestTime_smooothing')
 
-        self.stream.open(metadata=self, outputType='formatedLog', alias='statLossTrain', pathName='statLossTrain')
-        self.stream.open(metadata=self, outputType='formatedLog', alias='statLossTest_normal', pathName='statLossTest_normal')
-        self.stream.open(metadata=self, outputType='formatedLog', alias='statLossTest_smooothing', pathName='statLossTest_smooothing')
+        self.stream.open(metadata=self, outputType=metricType, alias='statLossTrain', pathName='statLossTrain')
+        self.stream.open(metadata=self, outputType=metricType, alias='statLossTest_normal', pathName='statLossTest_normal')
+        self.stream.open(metadata=self, outputType=metricType, alias='statLossTest_smooothing', pathName='statLossTest_smooothing')
 
-        self.stream.open(metadata=self, outputType='formatedLog', alias='weightsSumTrain', pathName='weightsSumTrain')
+        self.stream.open(metadata=self, outputType=metricType, alias='weightsSumTrain', pathName='weightsSumTrain')
+
+        if(self.retention is not None and self.binaryMetrics and RetentionPolicy.fromStr(self.retention).snapshot() is not None):
+            Output.printBash("Retention policy '{}' rewrites the whole series and cannot be used with binary metrics. Series are kept in full.".format(
+                self.retention), 'warn')
+        elif(self.retention is not None):
+            for alias in ('loopTrainTime', 'loopTestTime_normal', 'loopTestTime_smooothing', 'statLossTrain', 'statLossTest_normal', 
+                'statLossTest_smooothing', 'weightsSumTrain'):
+                if(alias not in self.stream.retention):
+                    self.stream.setRetention(alias, RetentionPolicy.fromStr(self.retention), keepRaw=self.retentionKeepRaw)
 
         Output.printBash('Default outputs prepared.', 'info')
 
         self.noPrepareOutput = True
 
     def __getstate__(self):
-        return self.__dict__.copy()
+        state = self.__dict__.copy()
+        state['endpoint'] = None
+        return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self.endpoint = None
+        self.metricsEndpoint = state.get('metricsEndpoint', None)
+        self.binaryMetrics = state.get('binaryMetrics', False)
+        self.asyncOutput = state.get('asyncOutput', False)
+        self.retention = state.get('retention', None)
+        self.retentionKeepRaw = state.get('retentionKeepRaw', False)
+        self.minMode = state.get('minMode', None)
         self.noPrepareOutput = False
         self.prepareOutput()
 
@@ -597,6 +1725,9 @@ class Output(SaveClass):
     """
     Instancja tego obiektu odpowiada instancji jednego folderu, w którym będą się znajdowały wszystkie otwarte pliki.
     """
+    MODE_LEVELS = {'debug': 0, None: 1, 'info': 1, 'warn': 2, 'err': 3}
+    INDEX_SUFFIX = '_index' # seria numerów wartości zachowanych przez RetentionPolicy
+
     class FileHandler():
         def __init__(self, root, pathName, mode, OType):
             if not os.path.exists(os.path.dirname(root + pathName)):
@@ -667,13 +1798,48 @@ class Output(SaveClass):
         self.root = None
         self.currentDefaultAlias = None
         self.debugDisabled = False
+        self.silent = False # ustawiane dla procesów innych niż główny; nic nie jest zapisywane
+        self.metrics = None # MetricsSink dla aliasów otwartych w trybie 'metrics'
+        self.metricAliases = {} # alias -> nazwa serii w MetricsSink
+        self.writer = None # OutputWriter; jeżeli istnieje, to zapis do plików odbywa się w osobnym wątku
+        self.writerQueueSize = None
+        self.minMode = None # najniższy tryb (Output.MODE_LEVELS) przepuszczany przez printLazy; None - wszystkie
+        self.retention = {} # alias -> (RetentionPolicy, nazwa serii surowych wartości w MetricsSink lub None)
 
     def __getstate__(self):
         state = self.__dict__.copy()
+        if(self.writer is not None):
+            self.writer.flush()
+        state['writer'] = None
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self.silent = state.get('silent', False)
+        self.metrics = state.get('metrics', None)
+        self.metricAliases = state.get('metricAliases', {})
+        self.writerQueueSize = state.get('writerQueueSize', None)
+        self.minMode = state.get('minMode', None)
+        self.retention = state.get('retention', {})
+        if(self.writerQueueSize is not None):
+            self.startWriter(self.writerQueueSize)
+
+    def startWriter(self, queueSize = 10000):
+        """
+        Od tej pory write / print przekazują tekst do OutputWriter, a zapis do plików odbywa się w osobnym wątku.
+        """
+        if(self.writer is None):
+            self.writer = OutputWriter(queueSize=queueSize)
+        self.writerQueueSize = queueSize
+
+    def stopWriter(self):
+        """
+        Zapisuje wszystkie oczekujące teksty oraz kończy wątek zapisu. Kolejne zapisy wykonywane są synchronicznie.
+        """
+        if(self.writer is not None):
+            self.writer.close()
+            self.writer = None
+        self.writerQueueSize = None
 
     def setDefaultAlias(self, name):
         if(name not in self.aliasToFH):
@@ -701,13 +1867,27 @@ class Output(SaveClass):
         self.filesDict[pathName] = {outputType: fh}
         self.aliasToFH[alias] = fh
 
+    def __metricsSink(self):
+        if(self.metrics is None):
+            self.metrics = MetricsSink(os.path.join(self.setLogFolder(), MetricsSink.FILE_NAME))
+        return self.metrics
+
+    def __openMetrics(self, alias, pathName):
+        self.__metricsSink().add(pathName)
+        self.metricAliases[alias] = pathName
+        return True
+
     def open(self, metadata, outputType: str, alias: str = None, pathName: str = None):
-        if((outputType != 'debug' and outputType != 'model' and outputType != 'bash' and outputType != 'formatedLog') or outputType is None):
+        """
+        Tryb 'metrics' zamiast pliku csv zapisuje wartości liczbowe do serii pathName w binarnym pliku MetricsSink.
+        """
+        if((outputType != 'debug' and outputType != 'model' and outputType != 'bash' and outputType != 'formatedLog' 
+            and outputType != 'metrics') or outputType is None):
             if(warnings()):
                 Output.printBash("Unknown command in open for Output class.", 'warn')
             return False
 
-        if(alias == 'debug' or alias == 'model' or alias == 'bash' or alias == 'formatedLog'):
+        if(alias == 'debug' or alias == 'model' or alias == 'bash' or alias == 'formatedLog' or alias == 'metrics'):
             if(warnings()):
                 Output.printBash("Alias cannot have the same name as output configuration in open for Output class.", 'warn')
             return False
@@ -721,6 +1901,13 @@ class Output(SaveClass):
                 Output.printBash("Alias is None but the output is not 'bash'; it is: {}.".format(outputType), 'warn')
             return False
 
+        if(outputType == 'metrics'):
+            if(pathName is None):
+                if(warnings()):
+                    Output.printBash("For this '{}' Output type pathName should not be None.".format(outputType), 'warn')
+                return False
+            return self.__openMetrics(alias, pathName)
+
         if(pathName is not None):
             root = self.setLogFolder()
             if(pathName in self.filesDict):
@@ -748,18 +1935,28 @@ class Output(SaveClass):
         return self.root
 
     def createLogFolder(folderSuffix, relativeRoot = None):
+        """
+        Tworzy nowy folder na logi o nazwie zawierającej aktualny czas.
+        Jeżeli folder o tej nazwie już istnieje (np. inny proces stworzył go w tej samej sekundzie), 
+        to do nazwy dodawany jest kolejny numer.
+        """
         dt_string = datetime.now().strftime("%d.%m.%Y_%H-%M-%S_")
         prfx = folderSuffix if folderSuffix is not None else ""
-        path = None
-        pathRel = None
-        if(relativeRoot is not None):
-            path = os.path.join(StaticData.LOG_FOLDER, relativeRoot, str(dt_string) + prfx)
-            pathRel = os.path.join(relativeRoot, str(dt_string) + prfx)
-        else:
-            path = os.path.join(StaticData.LOG_FOLDER, str(dt_string) + prfx)
-            pathRel = os.path.join(str(dt_string) + prfx)
-        Path(path).mkdir(parents=True, exist_ok=False)
-        return path, pathRel
+        name = str(dt_string) + prfx
+        counter = 0
+        while(True):
+            if(relativeRoot is not None):
+                path = os.path.join(StaticData.LOG_FOLDER, relativeRoot, name)
+                pathRel = os.path.join(relativeRoot, name)
+            else:
+                path = os.path.join(StaticData.LOG_FOLDER, name)
+                pathRel = os.path.join(name)
+            try:
+                Path(path).mkdir(parents=True, exist_ok=False)
+                return path, pathRel
+            except FileExistsError:
+                counter += 1
+                name = str(dt_string) + prfx + "_" + str(counter)
 
     def tryCreateFolder(relativeRoot):
         path = os.path.join(StaticData.LOG_FOLDER, relativeRoot)
@@ -791,28 +1988,107 @@ class Output(SaveClass):
         Przekazuje argument do wszystkich możliwych, aktywnych strumieni wyjściowych.\n
         Na końcu argumentu nie daje znaku nowej linii.
         """
-        if(alias == 'debug' and self.debugDisabled):
+        if(self.silent or (alias == 'debug' and self.debugDisabled)):
             return
         prefix = Output.__getPrefix(mode)
 
         if(alias is None):
             for fh in self.aliasToFH.values():
                 if(fh.exist() and 'formatedLog' not in fh.OType):
-                    fh.get().write(str(arg) + end)
+                    if(self.writer is not None):
+                        self.writer.put(fh, str(arg) + end)
+                    else:
+                        fh.get().write(str(arg) + end)
         else:
             if(not isinstance(alias, list)):
                 alias = [alias]
             for al in alias:
-                if(al == 'bash'):
-                    print(arg, end=end)
-                if(al in self.aliasToFH.keys() and self.aliasToFH[al].exist()):
-                    self.aliasToFH[al].get().write(str(arg) + end)
-                    if('formatedLog' in self.aliasToFH[al].OType):
-                        prBash = False
-                elif(warnings() and not (ignoreWarnings or StaticData.IGNORE_IO_WARNINGS)):
-                    self.printBash("Output alias for 'write / print' not found: '{}'".format(al), 'warn')
-                    self.printBash(str(al) + " " + str(self.aliasToFH.keys()), 'warn')
-                
+                if(al in self.retention):
+                    policy, rawName, indexAlias = self.retention[al]
+                    value = float(arg)
+                    if(rawName is not None):
+                        self.metrics.append(rawName, value)
+                    for index, retained in policy.push(value):
+                        self.__writeAlias(al, retained, ignoreWarnings, end)
+                        self.__writeAlias(indexAlias, index, True, end)
+                    continue
+                self.__writeAlias(al, arg, ignoreWarnings, end)
+
+    def __writeAlias(self, al, arg, ignoreWarnings, end):
+        if(al in self.metricAliases):
+            self.metrics.append(self.metricAliases[al], float(arg))
+            return
+        if(al == 'bash'):
+            print(arg, end=end)
+        if(al in self.aliasToFH.keys() and self.aliasToFH[al].exist()):
+            if(self.writer is not None):
+                self.writer.put(self.aliasToFH[al], str(arg) + end)
+            else:
+                self.aliasToFH[al].get().write(str(arg) + end)
+            if('formatedLog' in self.aliasToFH[al].OType):
+                prBash = False
+        elif(warnings() and not (ignoreWarnings or StaticData.IGNORE_IO_WARNINGS)):
+            self.printBash("Output alias for 'write / print' not found: '{}'".format(al), 'warn')
+            self.printBash(str(al) + " " + str(self.aliasToFH.keys()), 'warn')
+
+    def setRetention(self, alias, policy, keepRaw = False):
+        """
+        Od tej pory wartości zapisywane do aliasu przechodzą przez politykę policy (RetentionPolicy), np. EveryNthRetention.\n
+        Numery zachowanych wartości w pierwotnej serii trafiają do serii <nazwa>_index (seriesIndexPath), używanej jako oś x przez plot.\n
+        keepRaw - jeżeli True, to wszystkie wartości przed zastosowaniem polityki trafiają do serii <nazwa>_raw w MetricsSink.
+        """
+        if(self.silent):
+            return False
+        if(alias in self.metricAliases):
+            name = self.metricAliases[alias]
+            outputType = 'metrics'
+            if(policy.snapshot() is not None):
+                raise Exception("Retention policy {} rewrites the whole series and cannot be used with 'metrics' alias '{}'.".format(
+                    type(policy).__name__, alias))
+        elif(alias in self.aliasToFH and self.aliasToFH[alias].exist()):
+            name = os.path.splitext(self.aliasToFH[alias].pathName)[0]
+            outputType = 'formatedLog'
+            if(policy.snapshot() is not None and self.aliasToFH[alias].OType != ['formatedLog']):
+                raise Exception("Retention policy {} rewrites the whole series and requires 'formatedLog' alias; '{}' is not.".format(
+                    type(policy).__name__, alias))
+        else:
+            self.printBash("Could not set retention. Alias '{}' not found in opened files.".format(alias), 'warn')
+            return False
+
+        rawName = None
+        if(keepRaw):
+            rawName = name + '_raw'
+            self.__metricsSink().add(rawName)
+        indexAlias = alias + Output.INDEX_SUFFIX
+        self.open(metadata=None, outputType=outputType, alias=indexAlias, pathName=name + Output.INDEX_SUFFIX)
+        self.retention[alias] = (policy, rawName, indexAlias)
+        return True
+
+    def __rewriteRetained(self):
+        for al, (policy, _, indexAlias) in self.retention.items():
+            pairs = policy.snapshot()
+            if(pairs is None or not self.aliasToFH[al].exist()):
+                continue
+            if(self.writer is not None):
+                self.writer.flush()
+            for alias, column in ((al, 1), (indexAlias, 0)):
+                handler = self.aliasToFH[alias].get()
+                handler.seek(0)
+                handler.truncate()
+                handler.writelines(str(pair[column]) + '\n' for pair in pairs)
+
+    def finishRetention(self):
+        """
+        Zapisuje wartości zatrzymane w politykach (np. niepełny kubełek BucketRetention). 
+        Polityki pozostają ustawione, więc wartości zapisywane później (np. w kolejnym wywołaniu epochLoop) nadal przez nie przechodzą.
+        """
+        self.__rewriteRetained()
+        for al, (policy, _, indexAlias) in self.retention.items():
+            for index, retained in policy.finish():
+                self.__writeAlias(al, retained, True, '\n')
+                self.__writeAlias(indexAlias, index, True, '\n')
+        self.flushAll()
+
     def print(self, arg, alias: list = None, ignoreWarnings = False, mode: str = None):
         """
         Przekazuje argument do wszystkich możliwych, aktywnych strumieni wyjściowych.\n
@@ -820,6 +2096,42 @@ class Output(SaveClass):
         """
         self.write(arg, alias, ignoreWarnings, '\n', mode)
 
+    def isEnabled(self, alias: list = None, mode: str = None):
+        """
+        Sprawdza, czy zapis do podanych aliasów cokolwiek wypisze. Nie formatuje ani nie oblicza żadnych wartości.\n
+        Alias jest aktywny, jeżeli jest to 'bash', alias w trybie 'metrics' lub alias z otwartym plikiem.
+        Tryb mode musi być nie niższy niż minMode.
+        """
+        if(self.silent):
+            return False
+        if(self.minMode is not None and Output.MODE_LEVELS.get(mode, 1) < Output.MODE_LEVELS[self.minMode]):
+            return False
+        if(alias is None):
+            return True
+        if(not isinstance(alias, list)):
+            alias = [alias]
+        for al in alias:
+            if(al == 'bash' or al in self.metricAliases):
+                return True
+            if(al in self.aliasToFH and self.aliasToFH[al].exist()):
+                return True
+        return False
+
+    def printLazy(self, alias, message, *args, mode: str = None):
+        """
+        Wersja print, która formatuje tekst dopiero wtedy, gdy alias i tryb są aktywne (isEnabled).\n
+        message - funkcja bez argumentów zwracająca tekst albo tekst do str.format.\n
+        args - argumenty dla str.format; argumenty będące funkcjami są wywoływane dopiero po sprawdzeniu aktywności.\n
+        Przykład: printLazy('debug:0', "Loss avg diff : {}", lambda: abs(a.getAverage() - a.getAverage(10)))
+        """
+        if(not self.isEnabled(alias, mode)):
+            return
+        if(callable(message)):
+            message = message()
+        elif(args):
+            message = message.format(*[arg() if callable(arg) else arg for arg in args])
+        self.print(message, alias, ignoreWarnings=True, mode=mode)
+
     def writeDefault(self, arg, ignoreWarnings = False, end = '', mode: str = None):
         if(self.currentDefaultAlias is None):
             self.printBash("Default output alias not set but called 'writeDefault'.", 'warn')
@@ -831,24 +2143,42 @@ class Output(SaveClass):
         self.print(arg, alias=self.currentDefaultAlias, ignoreWarnings=ignoreWarnings, mode=mode)
 
     def getFileName(self, alias):
+        if(alias in self.metricAliases):
+            return os.path.basename(self.metrics.seriesPath(self.metricAliases[alias]))
         if(alias in self.aliasToFH):
             return os.path.basename(self.aliasToFH[alias].handler.name)
+        if(self.silent):
+            return None
         self.printBash("Could not find alias '{}' in opened files.".format(alias), 'warn')
         return None
 
     def getRelativeFilePath(self, alias):
+        """
+        Dla aliasów w trybie 'metrics' zwraca ścieżkę w postaci <plik MetricsSink>#<nazwa serii>, którą odczytuje loadSeries.
+        """
+        if(alias in self.metricAliases):
+            return self.metrics.seriesPath(self.metricAliases[alias])
         if(alias in self.aliasToFH):
             return self.aliasToFH[alias].handler.name
+        if(self.silent):
+            return None
         self.printBash("Could not find alias '{}' in opened files.".format(alias), 'warn')
         return None
 
     def __del__(self):
+        if(getattr(self, 'writer', None) is not None):
+            self.writer.close()
         for _, fh in self.aliasToFH.items():
             del fh
 
     def flushAll(self):
+        self.__rewriteRetained()
+        if(self.writer is not None):
+            self.writer.flush()
         for _, fh in self.aliasToFH.items():
             fh.flush()
+        if(self.metrics is not None):
+            self.metrics.flush()
         sys.stdout.flush()
 
     def trySave(self, metadata, onlyKeyIngredients = False, temporaryLocation = False):
@@ -868,10 +2198,533 @@ class Output(SaveClass):
         'warn'
         'err'
         None
+
+        W procesach innych niż główny wypisywane są jedynie błędy.
         """
+        if(mode != 'err' and not isMainProcess()):
+            return
         prefix = Output.__getPrefix(mode)
         print(prefix, arg)
 
+class OutputWriter():
+    """
+    Wątek zapisujący teksty przekazane przez Output do plików. Kolejka ma ograniczony rozmiar - jeżeli się zapełni, 
+    to put blokuje wątek wywołujący do czasu zwolnienia miejsca, dzięki czemu żaden zapis nie zostaje utracony.
+    Wątek pobiera z kolejki do batchSize elementów naraz i łączy teksty dla tego samego pliku w jeden zapis.
+    Kolejność zapisów w obrębie jednego pliku jest zachowana.
+
+    flush czeka na zapisanie wszystkiego, co zostało przekazane wcześniej, oraz wywołuje flush na użytych plikach.
+    close opróżnia kolejkę i kończy wątek; wywoływane również przy zamykaniu interpretera (atexit).
+    Błędy zapisu i flush są zgłaszane przez Output.printBash i nie kończą wątku. Jeżeli wątek mimo to przestanie działać, 
+    to put, flush oraz close zapisują pozostałe w kolejce teksty synchronicznie w wątku wywołującym.
+    """
+    POLL_SECONDS = 0.5
+
+    def __init__(self, queueSize = 10000, batchSize = 512):
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.batchSize = batchSize
+        self.touched = set() # pliki zapisane od ostatniego flush
+        self.closed = False
+        self.thread = threading.Thread(target=self.__worker__, name='OutputWriter', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, fh, text):
+        if(self.closed or not self.__enqueue__((fh, text))):
+            fh.get().write(text)
+
+    def flush(self):
+        if(self.closed):
+            return
+        done = threading.Event()
+        if(not self.__enqueue__((None, done))):
+            return
+        while(not done.wait(OutputWriter.POLL_SECONDS)):
+            if(not self.thread.is_alive()):
+                self.__drain__()
+                return
+
+    def close(self):
+        if(self.closed):
+            return
+        if(self.__enqueue__((None, None))):
+            self.thread.join()
+        self.__drain__()
+        self.closed = True
+        atexit.unregister(self.close)
+
+    def __enqueue__(self, entry):
+        """
+        Dodaje element do kolejki. Zwraca False, jeżeli wątek przestał działać - pozostałe elementy zostały wtedy zapisane synchronicznie.
+        """
+        while(self.thread.is_alive()):
+            try:
+                self.queue.put(entry, timeout=OutputWriter.POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        self.__drain__()
+        return False
+
+    def __drain__(self):
+        pending = {}
+        try:
+            while True:
+                fh, item = self.queue.get_nowait()
+                if(fh is not None):
+                    pending.setdefault(fh, []).append(item)
+                elif(item is not None):
+                    item.set()
+                self.queue.task_done()
+        except queue.Empty:
+            pass
+        self.__writePending__(pending)
+        self.__flushTouched__()
+
+    def __writePending__(self, pending):
+        for fh, texts in pending.items():
+            try:
+                fh.get().write(''.join(texts))
+                self.touched.add(fh)
+            except Exception as ex:
+                Output.printBash("OutputWriter could not write to '{}': {}".format(fh.pathName, ex), 'err')
+        pending.clear()
+
+    def __flushTouched__(self):
+        for fh in self.touched:
+            try:
+                fh.flush()
+            except Exception as ex:
+                Output.printBash("OutputWriter could not flush '{}': {}".format(fh.pathName, ex), 'err')
+        self.touched.clear()
+
+    def __worker__(self):
+        try:
+            self.__work__()
+        except Exception as ex:
+            Output.printBash("OutputWriter thread stopped: {}. Remaining output is written synchronously.".format(ex), 'err')
+
+    def __work__(self):
+        pending = {}
+        while True:
+            items = [self.queue.get()]
+            try:
+                while(len(items) < self.batchSize):
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = False
+            for fh, item in items:
+                if(fh is not None):
+                    pending.setdefault(fh, []).append(item)
+                    continue
+                # znacznik flush / close
+                self.__writePending__(pending)
+                self.__flushTouched__()
+                if(item is None):
+                    stop = True
+                else:
+                    item.set()
+            self.__writePending__(pending)
+            for _ in items:
+                self.queue.task_done()
+            if(stop):
+                return
+
+class _Private_MetricsSeries():
+    __slots__ = ('id', 'buffer', 'count')
+
+    def __init__(self, id, chunkSize):
+        self.id = id
+        self.buffer = numpy.empty(chunkSize, dtype=numpy.float64)
+        self.count = 0
+
+class MetricsSink():
+    """
+    Zapisuje serie liczb do jednego binarnego pliku. Wartości każdej serii trafiają do wcześniej zaalokowanej tablicy float64 
+    o rozmiarze chunkSize, która po zapełnieniu (lub przy flush) dopisywana jest do pliku jako jeden rekord.
+    Dzięki temu pojedynczy zapis wartości nie formatuje tekstu ani nie wykonuje operacji na pliku.
+
+    Układ pliku: MAGIC, a następnie rekordy: nagłówek '<HI' (numer serii, liczba elementów) oraz dane.
+    Rekord o numerze NAME_RECORD definiuje kolejną serię - danymi jest jej nazwa w utf-8, a numerem serii kolejny wolny numer.
+    Odczyt przez MetricsSink.read lub loadSeries, eksport do csv przez exportCSV.
+    """
+    MAGIC = b'SMTHMET1'
+    FILE_NAME = 'metrics.smc'
+    NAME_RECORD = 0xFFFF
+    HEADER = struct.Struct('<HI')
+
+    def __init__(self, path, chunkSize = 4096):
+        self.path = path
+        self.chunkSize = chunkSize
+        self.series = {}
+        self.defined = set() # numery serii, których definicja jest już w pliku
+        if(os.path.isfile(path)): # kontynuacja zapisu, np. po wczytaniu stanu programu
+            for numb, name in enumerate(MetricsSink.__parse__(path)[0]):
+                self.series[name] = _Private_MetricsSeries(numb, chunkSize)
+                self.defined.add(numb)
+
+    def __getstate__(self):
+        self.flush()
+        return self.__dict__.copy()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def add(self, name):
+        if(name not in self.series):
+            if(len(self.series) >= MetricsSink.NAME_RECORD):
+                raise Exception("MetricsSink supports at most {} series.".format(MetricsSink.NAME_RECORD))
+            self.series[name] = _Private_MetricsSeries(len(self.series), self.chunkSize)
+        return self
+
+    def seriesPath(self, name):
+        return self.path + '#' + name
+
+    def append(self, name, value):
+        series = self.series[name]
+        series.buffer[series.count] = value
+        series.count += 1
+        if(series.count == self.chunkSize):
+            self.flush(series)
+
+    def flush(self, series = None):
+        toWrite = self.series.values() if series is None else [series]
+        if(not any(s.count > 0 or s.id not in self.defined for s in toWrite)):
+            return
+        newFile = not os.path.isfile(self.path)
+        names = {s.id: name for name, s in self.series.items()}
+        with open(self.path, 'ab') as file:
+            if(newFile):
+                file.write(MetricsSink.MAGIC)
+            for s in sorted(self.series.values(), key=lambda s: s.id): # definicje w kolejności numerów
+                if(s.id not in self.defined):
+                    name = names[s.id].encode('utf-8')
+                    file.write(MetricsSink.HEADER.pack(MetricsSink.NAME_RECORD, len(name)))
+                    file.write(name)
+                    self.defined.add(s.id)
+            for s in toWrite:
+                if(s.count > 0):
+                    file.write(MetricsSink.HEADER.pack(s.id, s.count))
+                    file.write(s.buffer[:s.count].astype('<f8', copy=False).tobytes())
+                    s.count = 0
+
+    def __parse__(path):
+        names = []
+        chunks = []
+        with open(path, 'rb') as file:
+            data = file.read()
+        if(data[:len(MetricsSink.MAGIC)] != MetricsSink.MAGIC):
+            raise Exception("File {} is not a MetricsSink file.".format(path))
+        offset = len(MetricsSink.MAGIC)
+        while(offset + MetricsSink.HEADER.size <= len(data)):
+            numb, count = MetricsSink.HEADER.unpack_from(data, offset)
+            offset += MetricsSink.HEADER.size
+            if(numb == MetricsSink.NAME_RECORD):
+                names.append(data[offset:offset + count].decode('utf-8'))
+                chunks.append([])
+                offset += count
+            else:
+                if(offset + count * 8 > len(data)):
+                    break # niedokończony rekord, np. po przerwaniu programu
+                chunks[numb].append(numpy.frombuffer(data, dtype='<f8', count=count, offset=offset))
+                offset += count * 8
+        return names, chunks
+
+    def read(path):
+        """
+        Zwraca słownik {nazwa serii: numpy.ndarray float64}.
+        """
+        names, chunks = MetricsSink.__parse__(path)
+        return {name: (numpy.concatenate(chunks[numb]) if chunks[numb] else numpy.empty(0, dtype=numpy.float64)) 
+            for numb, name in enumerate(names)}
+
+    def exportCSV(path, folder = None, names = None):
+        """
+        Zapisuje serie do plików <folder>/<nazwa serii>.csv w tym samym formacie co Output w trybie 'formatedLog'.
+        Domyślnie folder jest folderem pliku path. Zwraca listę zapisanych plików.
+        """
+        folder = os.path.dirname(path) if folder is None else folder
+        series = MetricsSink.read(path)
+        written = []
+        for name in (series.keys() if names is None else names):
+            csvPath = os.path.join(folder, name + '.csv')
+            with open(csvPath, 'w') as file:
+                file.writelines(str(value) + '\n' for value in series[name].tolist())
+            written.append(csvPath)
+        return written
+
+class RetentionPolicy():
+    """
+    Polityka zachowywania wartości serii liczbowej, stosowana w Output.write w momencie zapisu (Output.setRetention).
+    Dzięki niej rozmiar logów oraz koszt późniejszego rysowania wykresów nie rośnie wraz z długością treningu.
+
+    Wartości zwracane są jako pary (numer wartości w pierwotnej serii, wartość), aby wykresy zachowały oś paczek.
+    push - przyjmuje kolejną wartość i zwraca listę par do natychmiastowego zapisu.
+    finish - zwraca pary zatrzymane w polityce, zapisywane na koniec (Output.finishRetention).
+    snapshot - jeżeli zwraca listę par, to cała zawartość serii jest nią zastępowana przy Output.flushAll.
+    """
+    def __init__(self):
+        self.seen = 0 # liczba wartości przekazanych do push
+
+    def push(self, value):
+        self.seen += 1
+        return [(self.seen - 1, value)]
+
+    def finish(self):
+        return []
+
+    def snapshot(self):
+        return None
+
+    def fromStr(text):
+        """
+        Tworzy politykę z tekstu:
+            'nth:<N>' - EveryNthRetention
+            'bucket:<rozmiar>[:min|max|mean]' - BucketRetention
+            'reservoir:<pojemność>' - ReservoirRetention
+        """
+        parts = text.split(':')
+        try:
+            if(parts[0] == 'nth' and len(parts) == 2):
+                return EveryNthRetention(int(parts[1]))
+            if(parts[0] == 'bucket' and len(parts) in (2, 3)):
+                return BucketRetention(int(parts[1]), *parts[2:])
+            if(parts[0] == 'reservoir' and len(parts) == 2):
+                return ReservoirRetention(int(parts[1]))
+        except ValueError:
+            pass
+        raise Exception("Unknown retention policy: '{}'. Expected 'nth:<N>', 'bucket:<size>[:min|max|mean]' or 'reservoir:<capacity>'.".format(text))
+
+class EveryNthRetention(RetentionPolicy):
+    """
+    Zachowuje co N-tą wartość, zaczynając od pierwszej.
+    """
+    def __init__(self, n):
+        if(n < 1):
+            raise Exception("EveryNthRetention requires n >= 1, got {}.".format(n))
+        super().__init__()
+        self.n = n
+
+    def push(self, value):
+        index = self.seen
+        self.seen += 1
+        return [(index, value)] if index % self.n == 0 else []
+
+class BucketRetention(RetentionPolicy):
+    """
+    Dzieli serię na kolejne kubełki po size wartości i dla każdego pełnego kubełka zapisuje jedną statystykę: min, max lub mean.
+    Niepełny ostatni kubełek zapisywany jest dopiero w finish. Numerem kubełka jest numer jego ostatniej wartości.
+    """
+    STATS = ('min', 'max', 'mean')
+
+    def __init__(self, size, stat = 'mean'):
+        if(size < 1):
+            raise Exception("BucketRetention requires size >= 1, got {}.".format(size))
+        if(stat not in BucketRetention.STATS):
+            raise Exception("Unknown BucketRetention statistic: '{}'. Expected one of {}.".format(stat, BucketRetention.STATS))
+        super().__init__()
+        self.size = size
+        self.stat = stat
+        self.__reset__()
+
+    def __reset__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def __value__(self):
+        if(self.stat == 'min'):
+            return self.min
+        if(self.stat == 'max'):
+            return self.max
+        return self.sum / self.count
+
+    def push(self, value):
+        self.seen += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        if(self.count < self.size):
+            return []
+        return self.finish()
+
+    def finish(self):
+        if(self.count == 0):
+            return []
+        ret = (self.seen - 1, self.__value__())
+        self.__reset__()
+        return [ret]
+
+class ReservoirRetention(RetentionPolicy):
+    """
+    Zachowuje losową próbkę co najwyżej capacity wartości (algorytm R), w kolejności ich zapisu.
+    Seria jest w całości nadpisywana próbką przy Output.flushAll, dlatego wymaga aliasu w trybie 'formatedLog'.
+    """
+    def __init__(self, capacity, seed = None):
+        if(capacity < 1):
+            raise Exception("ReservoirRetention requires capacity >= 1, got {}.".format(capacity))
+        super().__init__()
+        self.capacity = capacity
+        self.sample = [] # pary (numer wartości, wartość)
+        self.random = random.Random(seed)
+
+    def push(self, value):
+        if(len(self.sample) < self.capacity):
+            self.sample.append((self.seen, value))
+        else:
+            idx = self.random.randint(0, self.seen)
+            if(idx < self.capacity):
+                self.sample[idx] = (self.seen, value)
+        self.seen += 1
+        return []
+
+    def snapshot(self):
+        return sorted(self.sample)
+
+class _Private_EndpointHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.endpoint.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _Private_UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0) # BaseHTTPRequestHandler oczekuje adresu (host, port)
+
+class MetricsEndpoint():
+    """
+    Lokalny serwer HTTP udostępniający stan trwającego treningu w tekstowym formacie ekspozycji (Prometheus):
+    epokę, paczkę, przepustowość, średnie straty z ostatnich okien, stan wygładzania oraz zużycie pamięci.
+
+    address - 'host:port' lub 'unix:<ścieżka do gniazda>'. Dla gniazda: curl --unix-socket <ścieżka> http://localhost/
+
+    Pętla treningowa wywołuje jedynie update, który zapamiętuje referencje w pamięci. 
+    Średnie, konwersje tensorów oraz odczyt pamięci wykonywane są w wątku serwera przy każdym zapytaniu, nigdy z plików.
+    Obiekt nie jest serializowany razem z Metadata - tworzy go Metadata.prepareOutput.
+    """
+    PREFIX = 'smoothing_'
+
+    def __init__(self, address, windows = (10, 100)):
+        self.address = address
+        self.windows = tuple(sorted(windows))
+        self.losses = collections.deque(maxlen=self.windows[-1])
+        self.batchTimes = collections.deque(maxlen=self.windows[-1]) # pary (czas, rozmiar paczki)
+        self.epoch = None
+        self.batch = None
+        self.samples = 0
+        self.smoothing = None
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if(self.server is not None):
+            return self
+        if(self.address.startswith('unix:')):
+            path = self.address[len('unix:'):]
+            if(os.path.exists(path)):
+                if(not stat.S_ISSOCK(os.stat(path).st_mode)):
+                    raise Exception("Cannot start metrics endpoint. Path '{}' exists and is not a socket.".format(path))
+                os.remove(path) # gniazdo pozostałe po poprzednim uruchomieniu
+            self.server = _Private_UnixHTTPServer(path, _Private_EndpointHandler)
+        else:
+            host, port = self.address.rsplit(':', 1)
+            self.server = http.server.ThreadingHTTPServer((host, int(port)), _Private_EndpointHandler)
+        self.server.endpoint = self
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='MetricsEndpoint', daemon=True)
+        self.thread.start()
+        Output.printBash("Metrics endpoint listening at: {}".format(self.address), 'info')
+        return self
+
+    def stop(self):
+        if(self.server is None):
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        if(self.address.startswith('unix:') and os.path.exists(self.address[len('unix:'):])):
+            os.remove(self.address[len('unix:'):])
+        self.server = None
+        self.thread = None
+
+    def __getstate__(self):
+        raise Exception("MetricsEndpoint cannot be serialized.")
+
+    def update(self, epoch, batch, batchSize, loss, smoothing):
+        """
+        Wywoływane w pętli treningowej po każdej paczce. Strata jest zapamiętywana jako tensor bez grafu obliczeń, 
+        a jej wartość odczytywana dopiero przy zapytaniu.
+        """
+        self.epoch = epoch
+        self.batch = batch
+        self.samples += batchSize
+        self.batchTimes.append((time.perf_counter(), batchSize))
+        if(loss is not None):
+            self.losses.append(loss.detach() if isinstance(loss, torch.Tensor) else loss)
+        self.smoothing = smoothing
+
+    def __throughput__(self):
+        times = list(self.batchTimes)
+        if(len(times) < 2 or times[-1][0] <= times[0][0]):
+            return None
+        return sum(size for _, size in times[1:]) / (times[-1][0] - times[0][0])
+
+    def __memory__(self):
+        memory = {}
+        try:
+            with open('/proc/self/statm') as file:
+                memory['memory_rss_bytes'] = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            pass
+        if(torch.cuda.is_available()):
+            memory['cuda_memory_allocated_bytes'] = torch.cuda.memory_allocated()
+            memory['cuda_memory_reserved_bytes'] = torch.cuda.memory_reserved()
+        return memory
+
+    def exposition(self):
+        lines = []
+        def add(name, value, labels = None, kind = 'gauge'):
+            if(value is None):
+                return
+            if(labels is None):
+                lines.append('# TYPE {}{} {}'.format(MetricsEndpoint.PREFIX, name, kind))
+            lines.append('{}{}{} {}'.format(MetricsEndpoint.PREFIX, name, labels if labels is not None else '', float(value)))
+
+        add('epoch', self.epoch)
+        add('batch', self.batch)
+        add('samples_total', self.samples, kind='counter')
+        add('throughput_samples_per_second', self.__throughput__())
+
+        losses = [float(loss) for loss in list(self.losses)]
+        if(losses):
+            lines.append('# TYPE {}loss_average gauge'.format(MetricsEndpoint.PREFIX))
+            for window in self.windows:
+                last = losses[-window:]
+                add('loss_average', sum(last) / len(last), '{{window="{}"}}'.format(window))
+
+        smoothing = self.smoothing
+        if(smoothing is not None):
+            add('enabled', int(bool(getattr(smoothing, 'enabled', False))))
+            add('count_weights', getattr(smoothing, 'countWeights', None))
+            add('convergence_metric', getattr(smoothing, 'convergenceMetric', None))
+
+        for name, value in self.__memory__().items():
+            add(name, value)
+        return '\n'.join(lines) + '\n'
+
 class DefaultMethods():
     def printLoss(metadata, helper, alias: list = None):
         """
@@ -894,7 +2747,7 @@ class DefaultMethods():
             metadata.stream.print(f"No weight difference")
         else:
             diffKey = list(helper.diff.keys())[-1]
-            metadata.stream.print(f"Weight difference: {helper.diff[diffKey]}", 'debug:0', 'bash:0', alias)
+            metadata.stream.printLazy('debug:0', "Weight difference: {}", helper.diff[diffKey], mode='debug')
             metadata.stream.print(f"Weight difference of last layer average: {helper.diff[diffKey].sum() / helper.diff[diffKey].numel()} :: was divided by: {helper.diff[diffKey].numel()}", alias)
             metadata.stream.print('################################################', alias)
 
@@ -909,6 +2762,7 @@ class LoopsState():
     def __init__(self):
         self.numbArray = []
         self.popNumbArray = None
+        self.worldSize = 1 # liczba procesów, dla której zapisano numery paczek
 
     def __getstate__(self):
         state = self.__dict__.copy()
@@ -918,6 +2772,20 @@ class LoopsState():
     def __setstate__(self, state):
         self.__dict__.update(state)
         self.popNumbArray = None
+        self.worldSize = state.get('worldSize', 1)
+
+    def rescale(self, worldSize):
+        """
+        Przelicza numery niedokończonych pętli zapisane przy innej liczbie procesów tak, 
+        aby wznowienie nastąpiło po tej samej liczbie przetworzonych próbek. Wymaga użycia DistributedBaseSampler.
+        Numer paczki zaokrąglany jest w dół, przez co część próbek może zostać przetworzona ponownie.
+        """
+        if(worldSize == self.worldSize):
+            return
+        for state in self.numbArray:
+            if(not state[1]):
+                state[0] = (state[0] * self.worldSize) // worldSize
+        self.worldSize = worldSize
 
     def imprint(self, numb, isEnd):
         """
@@ -926,8 +2794,9 @@ class LoopsState():
         czy aktualna pętla nie potrzebuje wznowienia
         """
         if(len(self.popNumbArray) == 1 and self.popNumbArray[0][1] == False):
-            self.numbArray[0][0] = numb
-            self.numbArray[0][0] = True
+            # popNumbArray jest płytką kopią numbArray, dlatego zmiana dotyczy wpisu wznowionej pętli w numbArray
+            self.popNumbArray[0][0] = numb
+            self.popNumbArray[0][1] = isEnd
             self.popNumbArray.clear()
         elif(len(self.popNumbArray) == 0):
             self.numbArray.append([numb, isEnd])
@@ -937,6 +2806,18 @@ class LoopsState():
         self.popNumbArray = None
         self.numbArray = []
 
+    def checkpointState(self, numb):
+        """
+        Zwraca kopię numbArray, w której aktualnie wykonywana pętla jest oznaczona jako niedokończona na paczce numb.
+        Pozwala zapisać stan programu w trakcie pętli, bez jej przerywania.
+        """
+        state = [list(loop) for loop in self.numbArray]
+        if(self.popNumbArray is not None and len(self.popNumbArray) == 1 and self.popNumbArray[0][1] == False):
+            state[-1] = [numb, False] # wznowiona pętla ma już swój wpis
+        else:
+            state.append([numb, False])
+        return state
+
     def tryCreateNew(self):
         if(self.popNumbArray is None):
             self.popNumbArray = self.numbArray.copy()
@@ -964,10 +2845,158 @@ class LoopsState():
         self.tryCreateNew()
         return self.canRun()
 
+class CheckpointPolicy():
+    """
+    Okresowy zapis wszystkich obiektów programu w trakcie pętli treningowej, co everyBatches paczek 
+    lub co everyMinutes minut, zależnie od tego, który warunek zostanie spełniony pierwszy.
+    Stan pętli zapisywany jest przez LoopsState tak samo jak przy SAVE_AND_EXIT_FLAG, dlatego wznowienie 
+    przez podanie nazwy pliku do wczytania zaczyna od następnej paczki.
+
+    Każdy zapis (generacja) trafia do osobnego katalogu <fileNameSave>.ckpt-<numer>, tworzonego pod nazwą z końcówką .tmp. 
+    Dopiero po zapisaniu wszystkich obiektów (przy zapisie w tle - w wątku ShardedCheckpointWriter, po zakończeniu zapisów tej generacji) 
+    katalog jest przemianowywany, a plik wskaźnika <fileNameSave>.ckpt podmieniany przez os.replace. 
+    Wskaźnik wskazuje więc zawsze na kompletną generację, nawet jeżeli program zakończy się w trakcie zapisu. Przechowywanych jest keepLast generacji.
+    SaveClass.tryLoad wczytuje generację wskazywaną przez wskaźnik (CheckpointPolicy.loadPrefix).
+    """
+    def __init__(self, everyBatches = None, everyMinutes = None, keepLast = 1):
+        if(everyBatches is None and everyMinutes is None):
+            raise Exception("CheckpointPolicy requires everyBatches or everyMinutes.")
+        if(keepLast < 1):
+            raise Exception("CheckpointPolicy keepLast must be at least 1, got {}.".format(keepLast))
+        self.everyBatches = everyBatches
+        self.everyMinutes = everyMinutes
+        self.keepLast = keepLast
+
+        self.lastNumber = None
+        self.lastTime = time.monotonic()
+        self.nextGeneration = 1
+
+    def due(self, totalNumber):
+        if(self.lastNumber is None):
+            self.lastNumber = totalNumber - 1 # licznik zaczyna się od pierwszej paczki w tym wywołaniu programu
+        if(self.everyBatches is not None and totalNumber - self.lastNumber >= self.everyBatches):
+            return True
+        if(self.everyMinutes is not None and time.monotonic() - self.lastTime >= self.everyMinutes * 60):
+            return True
+        return False
+
+    def reset(self, totalNumber):
+        self.lastNumber = totalNumber
+        self.lastTime = time.monotonic()
+
+    def pointerPath(fileName):
+        return StaticData.PATH + fileName + '.ckpt'
+
+    def generationName(fileName, numb):
+        return '{}.ckpt-{:06d}'.format(os.path.basename(fileName), numb)
+
+    def generations(fileName, root = None):
+        """
+        Zwraca posortowaną listę par (numer, ścieżka katalogu) kompletnych generacji zapisu fileName w katalogu root (domyślnie StaticData.PATH).
+        """
+        base = (StaticData.PATH if root is None else root) + fileName
+        dirPath = os.path.dirname(base) or '.'
+        if(not os.path.isdir(dirPath)):
+            return []
+        prefix = os.path.basename(base) + '.ckpt-'
+        found = []
+        for entry in os.listdir(dirPath):
+            if(entry.startswith(prefix) and entry[len(prefix):].isdigit() and os.path.isdir(os.path.join(dirPath, entry))):
+                found.append((int(entry[len(prefix):]), os.path.join(dirPath, entry)))
+        return sorted(found)
+
+    def loadPrefix(fileName):
+        """
+        Zwraca katalog, z którego należy wczytać zapis fileName: najnowszą kompletną generację wskazywaną przez wskaźnik, 
+        o ile nie istnieje nowszy zapis pod standardowymi nazwami (np. przez SAVE_AND_EXIT_FLAG lub na koniec modelRun). W przeciwnym wypadku StaticData.PATH.
+        """
+        pointer = CheckpointPolicy.pointerPath(fileName)
+        if(not os.path.isfile(pointer)):
+            return StaticData.PATH
+        reference = StaticData.PATH + fileName + StaticData.METADATA_SUFFIX
+        if(os.path.exists(reference) and os.path.getmtime(reference) > os.path.getmtime(pointer)):
+            return StaticData.PATH
+        with open(pointer, 'r') as file:
+            generation = file.read().strip()
+        generationDir = os.path.join(os.path.dirname(pointer), generation)
+        if(not os.path.isdir(generationDir)):
+            Output.printBash("Checkpoint pointer {} refers to missing generation '{}'.".format(pointer, generation), 'warn')
+            return StaticData.PATH
+        return generationDir + os.sep
+
+    def __commit__(self, tmpDir, generationDir, pointer, root, fileName, expected):
+        """
+        Kończy generację: przemianowuje katalog tymczasowy, podmienia wskaźnik i usuwa generacje starsze niż keepLast ostatnich.
+        Niekompletna generacja (np. po błędzie zapisu w tle) jest usuwana, a wskaźnik nadal wskazuje poprzednią.
+        """
+        missing = [path for path in expected if not os.path.exists(path)]
+        if(missing):
+            Output.printBash("Checkpoint {} is incomplete, missing {}. Keeping the previous checkpoint.".format(
+                os.path.basename(generationDir), missing), 'err')
+            shutil.rmtree(tmpDir, ignore_errors=True)
+            return
+        os.replace(tmpDir, generationDir)
+        with open(pointer + '.tmp', 'w') as file:
+            file.write(os.path.basename(generationDir))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(pointer + '.tmp', pointer)
+        generations = [path for _, path in CheckpointPolicy.generations(fileName, root)]
+        for path in generations[:-self.keepLast]:
+            shutil.rmtree(path, ignore_errors=True)
+        Output.printBash("Checkpoint {} complete.".format(os.path.basename(generationDir)), 'info')
+
+    def checkpoint(self, dictObjs, helperEpoch, numb):
+        """
+        Zapisuje obiekty z dictObjs tak, aby wznowienie aktualnej pętli treningowej zaczęło się od paczki numb.
+        """
+        metadata = dictObjs['Metadata']
+        self.reset(helperEpoch.trainTotalNumber)
+        if(not isMainProcess() or metadata.fileNameSave is None):
+            return False
+        fileName = metadata.fileNameSave
+        existing = CheckpointPolicy.generations(fileName)
+        self.nextGeneration = max(self.nextGeneration, existing[-1][0] + 1 if existing else 1)
+        generationDir = os.path.join(os.path.dirname(StaticData.PATH + fileName) or '.', CheckpointPolicy.generationName(fileName, self.nextGeneration))
+        self.nextGeneration += 1
+        tmpDir = generationDir + '.tmp'
+        shutil.rmtree(tmpDir, ignore_errors=True) # pozostałość po przerwanym zapisie
+        Path(tmpDir).mkdir(parents=True)
+
+        loopsState = helperEpoch.loopsState
+        numbArray = loopsState.numbArray
+        loopsState.numbArray = loopsState.checkpointState(numb)
+        path = StaticData.PATH
+        StaticData.PATH = tmpDir + os.sep # SaveClass.trySave zapisuje pod StaticData.PATH
+        try:
+            trySave(dictObjs=dictObjs)
+        finally:
+            StaticData.PATH = path
+            loopsState.numbArray = numbArray
+
+        expected = [os.path.join(tmpDir, os.path.basename(fileName) + type(obj).getFileSuffix()) for obj in dictObjs.values()]
+        commit = functools.partial(self.__commit__, tmpDir, generationDir, CheckpointPolicy.pointerPath(fileName), StaticData.PATH, fileName, expected)
+        if(CHECKPOINT_WRITER is not None):
+            CHECKPOINT_WRITER.after(commit) # po zakończeniu zapisów tej generacji w tle
+        else:
+            commit()
+        metadata.stream.printLazy('debug:0', "Checkpoint saved at train batch {}.", numb, mode='debug')
+        return True
 
 class Data_Metadata(SaveClass, BaseMainClass):
     def __init__(self, worker_seed = 841874, train = True, download = True, pin_memoryTrain = False, pin_memoryTest = False,
-            epoch = 1, batchTrainSize = 4, batchTestSize = 4, howOftenPrintTrain = 2000):
+            epoch = 1, batchTrainSize = 4, batchTestSize = 4, howOftenPrintTrain = 2000, prefetchBatches = 0,
+            autoTuneTestBatch = False, testMemoryBudget = 0.9, autoTuneLoader = False):
+        """
+            prefetchBatches - liczba paczek danych przygotowywanych z wyprzedzeniem na urządzeniu modelu 
+                przez DevicePrefetcher. Wartość 0 wyłącza przygotowywanie z wyprzedzeniem.
+            autoTuneTestBatch - jeżeli True, to przed pierwszą pętlą testową batchTestSize zostanie dobrany przez EvalBatchTuner.
+                Wynik zapamiętywany jest w TuningCache.
+            testMemoryBudget - budżet pamięci dla EvalBatchTuner; dla wartości <= 1 jest to część pamięci urządzenia, 
+                dla większych wartości liczba bajtów.
+            autoTuneLoader - jeżeli True, to parametry DataLoadera (num_workers, prefetch_factor, persistent_workers, pin_memory) 
+                zostaną dobrane przez LoaderTuner. Wynik zapamiętywany jest w TuningCache dla danego komputera oraz zbioru danych.
+        """
         super().__init__()
 
         # default values:
@@ -984,6 +3013,12 @@ class Data_Metadata(SaveClass, BaseMainClass):
         # print = batch size * howOftenPrintTrain
         self.howOftenPrintTrain = howOftenPrintTrain
 
+        self.prefetchBatches = prefetchBatches
+
+        self.autoTuneTestBatch = autoTuneTestBatch
+        self.testMemoryBudget = testMemoryBudget
+        self.autoTuneLoader = autoTuneLoader
+
     def tryPinMemoryTrain(self, metadata, modelMetadata):
         if(torch.cuda.is_available()):
             self.pin_memoryTrain = True
@@ -1007,6 +3042,10 @@ class Data_Metadata(SaveClass, BaseMainClass):
         tmp_str += ('Batch test size:\t{}\n'.format(self.batchTestSize))
         tmp_str += ('Number of epochs:\t{}\n'.format(self.epoch))
         tmp_str += ('How often print:\t{}\n'.format(self.howOftenPrintTrain))
+        tmp_str += ('Prefetch batches:\t{}\n'.format(self.prefetchBatches))
+        tmp_str += ('Auto tune test batch:\t{}\n'.format(self.autoTuneTestBatch))
+        tmp_str += ('Test memory budget:\t{}\n'.format(self.testMemoryBudget))
+        tmp_str += ('Auto tune loader:\t{}\n'.format(self.autoTuneLoader))
         return tmp_str
 
     def _getstate__(self):
@@ -1244,17 +3283,27 @@ class Statistics():
                 avgName = name + ".avg"
                 self.avgPlotBatches[avgName] = []
                 for fileName in val:
-                    avgFileName = fileName[:fileName.rfind(".")] + ".avg" + fileName[fileName.rfind("."):]
+                    if('#' in os.path.basename(fileName)): # seria z MetricsSink
+                        path, series = fileName.rsplit('#', 1)
+                        avgFileName = os.path.join(os.path.dirname(path), series + ".avg.csv")
+                    else:
+                        avgFileName = fileName[:fileName.rfind(".")] + ".avg" + fileName[fileName.rfind("."):]
                     avgFileFolderName = os.path.join(self.logFolder, avgFileName)
                     folder_fileName = fileName
                     if(self.rootInputFolder is not None):
                         folder_fileName = os.path.join(self.rootInputFolder, fileName)
-                    with open(avgFileFolderName, 'w') as fileAvgH, open(folder_fileName, 'r') as fileH:
-                        counter = 0
+                    values = loadSeries(folder_fileName)
+                    if(values is None):
+                        raise Exception("Could not find statistics file '{}'.".format(folder_fileName))
+                    with open(avgFileFolderName, 'w') as fileAvgH:
                         circularList = CircularList(runningAvgSize)
-                        for line in fileH.readlines():
-                            circularList.pushBack(float(line))
+                        for value in values.tolist():
+                            circularList.pushBack(value)
                             fileAvgH.write(str(circularList.getAverage()) + '\n')
+                    index = loadSeriesIndex(folder_fileName, len(values))
+                    if(index is not None):
+                        with open(seriesIndexPath(avgFileFolderName), 'w') as fileIndexH:
+                            fileIndexH.writelines(str(int(idx)) + '\n' for idx in index.tolist())
                     self.avgPlotBatches[avgName].append(avgFileName)
                 
                 plot(filePath=self.avgPlotBatches[avgName], name=avgName, plotInputRoot=self.rootInputFolder, plotOutputRoot=self.logFolder, fileFormat=fileFormat, dpi=dpi, widthTickFreq=widthTickFreq,
@@ -1285,6 +3334,322 @@ class Statistics():
     def __str__(self):
         return '\n'.join("%s: %s" % item for item in vars(self).items())
 
+class TuningCache():
+    """
+    Słownik zapisywany w pliku JSON w folderze StaticData.CACHE_PATH. Przechowuje wyniki strojenia parametrów, 
+    aby kolejne wywołania programu mogły pominąć ich wyszukiwanie.
+    Zapis odbywa się przez plik tymczasowy, dzięki czemu przerwany zapis nie uszkodzi istniejącego pliku.
+    """
+    def __init__(self, name, path = None):
+        self.path = os.path.join(path if path is not None else StaticData.CACHE_PATH, name + '.json')
+
+    def key(*parts):
+        return '|'.join(str(p) for p in parts)
+
+    def __read(self):
+        if(not os.path.exists(self.path)):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            Output.printBash("Could not read tuning cache '{}'. Cache ignored.".format(self.path), 'warn')
+            return {}
+
+    def get(self, key, default = None):
+        return self.__read().get(key, default)
+
+    def set(self, key, value):
+        Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+        content = self.__read()
+        content[key] = value
+        tmpPath = self.path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(content, f, indent=2, sort_keys=True)
+        os.replace(tmpPath, self.path)
+
+class EvalBatchTuner():
+    """
+    Wyszukuje rozmiar paczki dla ewaluacji modelu. 
+    Najpierw szuka największego rozmiaru, dla którego pamięć zużyta przez przejście w przód mieści się w budżecie, 
+    zaczynając od startSize i podwajając go, a następnie zawężając przedział wyszukiwaniem binarnym.
+    Następnie mierzy przepustowość (próbki na sekundę) dla kilku rozmiarów nie większych od znalezionego i wybiera najszybszy.
+
+    memoryBudget - dla wartości <= 1 jest to część całkowitej pamięci urządzenia, dla większych wartości liczba bajtów.
+    Dla CUDA mierzone jest maksymalne zużycie pamięci urządzenia. Dla procesora zużycie jest szacowane jako suma rozmiarów 
+    parametrów oraz wyjść wszystkich modułów modelu.
+    """
+    def __init__(self, memoryBudget = 0.9, maxBatchSize = 4096, measureBatches = 3, throughputFractions = (0.25, 0.5, 0.75, 1.0)):
+        self.memoryBudget = memoryBudget
+        self.maxBatchSize = maxBatchSize
+        self.measureBatches = measureBatches
+        self.throughputFractions = throughputFractions
+
+    def totalMemory(device):
+        if(device.type == 'cuda'):
+            return torch.cuda.get_device_properties(device).total_memory
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+    def searchMaxFit(fits, startSize, maxSize):
+        """
+        Zwraca największy rozmiar z przedziału [1, maxSize], dla którego fits(rozmiar) jest prawdziwe. 
+        Zakłada, że fits jest monotoniczne. Zwraca 0, jeżeli żaden rozmiar nie pasuje.
+        """
+        size = max(1, min(startSize, maxSize))
+        if(not fits(size)):
+            good, bad = 0, size
+        else:
+            good = size
+            while(good < maxSize):
+                size = min(good * 2, maxSize)
+                if(not fits(size)):
+                    break
+                good = size
+            if(good == maxSize):
+                return good
+            bad = size
+        while(bad - good > 1):
+            mid = (good + bad) // 2
+            if(fits(mid)):
+                good = mid
+            else:
+                bad = mid
+        return good
+
+    def __forwardMemory(self, module, inputs, device):
+        if(device.type == 'cuda'):
+            torch.cuda.synchronize(device)
+            torch.cuda.reset_peak_memory_stats(device)
+            module(inputs)
+            torch.cuda.synchronize(device)
+            return torch.cuda.max_memory_allocated(device)
+
+        outputBytes = [0]
+        def hook(mod, inp, out):
+            if(isinstance(out, torch.Tensor)):
+                outputBytes[0] += out.element_size() * out.nelement()
+        handles = [m.register_forward_hook(hook) for m in module.modules() if len(list(m.children())) == 0]
+        try:
+            module(inputs)
+        finally:
+            for h in handles:
+                h.remove()
+        paramBytes = sum(p.element_size() * p.nelement() for p in module.parameters())
+        return paramBytes + inputs.element_size() * inputs.nelement() + outputBytes[0]
+
+    def __fits(self, module, sample, device, budget, size):
+        inputs = sample.unsqueeze(0).expand(size, *sample.shape).contiguous()
+        try:
+            return self.__forwardMemory(module, inputs, device) <= budget
+        except RuntimeError as ex:
+            if('out of memory' not in str(ex)):
+                raise
+            return False
+        finally:
+            del inputs
+            if(device.type == 'cuda'):
+                torch.cuda.empty_cache()
+
+    def __throughput(self, module, sample, device, size):
+        inputs = sample.unsqueeze(0).expand(size, *sample.shape).contiguous()
+        module(inputs) # rozgrzewka
+        if(device.type == 'cuda'):
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        for _ in range(self.measureBatches):
+            module(inputs)
+        if(device.type == 'cuda'):
+            torch.cuda.synchronize(device)
+        return size * self.measureBatches / (time.perf_counter() - start)
+
+    def tune(self, module, sample, device, startSize = 16):
+        """
+        module - nn.Module w trybie ewaluacji
+        sample - pojedyncza próbka wejściowa (bez wymiaru paczki)
+        Zwraca najszybszy rozmiar paczki.
+        """
+        device = torch.device(device)
+        budget = self.memoryBudget * EvalBatchTuner.totalMemory(device) if self.memoryBudget <= 1 else self.memoryBudget
+        sample = sample.to(device)
+
+        with torch.no_grad():
+            maxFit = EvalBatchTuner.searchMaxFit(lambda size: self.__fits(module, sample, device, budget, size), 
+                startSize=startSize, maxSize=self.maxBatchSize)
+            if(maxFit == 0):
+                Output.printBash("EvalBatchTuner: even a batch of size 1 does not fit in the memory budget. Using size 1.", 'warn')
+                return 1
+
+            candidates = sorted({max(1, int(maxFit * fraction)) for fraction in self.throughputFractions})
+            speed = {size: self.__throughput(module, sample, device, size) for size in candidates}
+        best = max(speed, key=speed.get)
+        Output.printBash("EvalBatchTuner: max batch size in budget {}, throughput (samples/s) {}. Selected {}.".format(
+            maxFit, {k: round(v, 1) for k, v in speed.items()}, best), 'info')
+        return best
+
+class LoaderTuner():
+    """
+    Dobiera parametry torch.utils.data.DataLoader mierząc przepustowość (próbki na sekundę) 
+    wczytywania danych z rzeczywistymi transformacjami na bieżącym komputerze.
+    Przeszukiwanie jest zachłanne: kolejno dobierane są num_workers, prefetch_factor, pin_memory oraz persistent_workers,
+    przy czym każdy parametr wybierany jest przy ustalonych, najlepszych dotychczas wartościach pozostałych.
+    Każdy pomiar składa się z measureEpochs przejść po measureBatches paczkach, dzięki czemu uwzględniony jest koszt 
+    uruchamiania procesów roboczych przy każdym epoch'u.
+    """
+    def __init__(self, workerCandidates = None, prefetchCandidates = (2, 4, 8), measureBatches = 20, measureEpochs = 2):
+        if(workerCandidates is None):
+            cpus = os.cpu_count() or 1
+            workerCandidates = sorted({0, 1, 2} | {w for w in (4, 8, 16, 32) if w <= cpus})
+        self.workerCandidates = workerCandidates
+        self.prefetchCandidates = prefetchCandidates
+        self.measureBatches = measureBatches
+        self.measureEpochs = measureEpochs
+
+    def loaderKwargs(config):
+        """
+        Zamienia konfigurację na argumenty DataLoadera. Parametry prefetch_factor oraz persistent_workers 
+        są pomijane dla num_workers == 0, ponieważ DataLoader ich wtedy nie przyjmuje.
+        """
+        kwargs = {'num_workers': config['num_workers'], 'pin_memory': config['pin_memory']}
+        if(config['num_workers'] > 0):
+            kwargs['prefetch_factor'] = config['prefetch_factor']
+            kwargs['persistent_workers'] = config['persistent_workers']
+        return kwargs
+
+    def __measure(self, dataset, batchSize, config, loaderArgs):
+        loader = torch.utils.data.DataLoader(dataset, batch_size=batchSize, sampler=torch.utils.data.RandomSampler(dataset), 
+            **loaderArgs, **LoaderTuner.loaderKwargs(config))
+        samples = 0
+        start = time.perf_counter()
+        for _ in range(self.measureEpochs):
+            for idx, (inputs, labels) in enumerate(loader):
+                samples += len(inputs)
+                if(idx + 1 >= self.measureBatches):
+                    break
+        elapsed = time.perf_counter() - start
+        del loader
+        return samples / elapsed
+
+    def __pick(self, dataset, batchSize, config, name, candidates, loaderArgs):
+        speed = {}
+        for value in candidates:
+            tmp = dict(config)
+            tmp[name] = value
+            speed[value] = self.__measure(dataset, batchSize, tmp, loaderArgs)
+        best = max(speed, key=speed.get)
+        Output.printBash("LoaderTuner: {} throughput (samples/s) {}. Selected {}.".format(
+            name, {k: round(v, 1) for k, v in speed.items()}, best), 'info')
+        config[name] = best
+        return config
+
+    def tune(self, dataset, batchSize, **loaderArgs):
+        """
+        loaderArgs - pozostałe argumenty DataLoadera, np. collate_fn, worker_init_fn.
+        Zwraca słownik z kluczami num_workers, prefetch_factor, persistent_workers, pin_memory.
+        """
+        config = {'num_workers': 0, 'prefetch_factor': 2, 'persistent_workers': False, 'pin_memory': False}
+        config = self.__pick(dataset, batchSize, config, 'num_workers', self.workerCandidates, loaderArgs)
+        if(config['num_workers'] > 0):
+            config = self.__pick(dataset, batchSize, config, 'prefetch_factor', self.prefetchCandidates, loaderArgs)
+        if(torch.cuda.is_available()):
+            config = self.__pick(dataset, batchSize, config, 'pin_memory', (False, True), loaderArgs)
+        if(config['num_workers'] > 0):
+            config = self.__pick(dataset, batchSize, config, 'persistent_workers', (False, True), loaderArgs)
+        return config
+
+def emptyHook(fun):
+    """
+    Oznacza metodę klasy Data jako pustą. HookRegistry pomija jej wywołanie, jeżeli nie została nadpisana w klasie pochodnej.
+    """
+    fun.__emptyHook__ = True
+    return fun
+
+def forwardHook(fun):
+    """
+    Oznacza metodę, która jedynie przekazuje wywołanie do tej samej metody klasy bazowej przez super(). 
+    HookRegistry wywołuje wtedy od razu metodę klasy bazowej.
+    """
+    fun.__forwardHook__ = True
+    return fun
+
+def contextHook(fun):
+    """
+    Oznacza metodę, która zamiast ośmiu nazwanych argumentów przyjmuje pojedynczy argument ctx typu LoopContext.
+    Dotyczy to tylko wywołań przez HookRegistry.
+    """
+    fun.__contextHook__ = True
+    return fun
+
+class LoopContext():
+    """
+    Argumenty przekazywane do metod wywoływanych w pętlach klasy Data. Tworzony raz na pętlę.
+    Pętla epok nie posiada helpera, dlatego przy helper=None nie jest on umieszczany w kwargs.
+    """
+    __slots__ = ('helperEpoch', 'helper', 'model', 'dataMetadata', 'modelMetadata', 'metadata', 'smoothing', 'smoothingMetadata', 'kwargs')
+
+    def __init__(self, helperEpoch: 'EpochDataContainer', model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', 
+        metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata', helper = None):
+        self.helperEpoch = helperEpoch
+        self.helper = helper
+        self.model = model
+        self.dataMetadata = dataMetadata
+        self.modelMetadata = modelMetadata
+        self.metadata = metadata
+        self.smoothing = smoothing
+        self.smoothingMetadata = smoothingMetadata
+
+        self.kwargs = {'helperEpoch': helperEpoch, 'model': model, 'dataMetadata': dataMetadata, 'modelMetadata': modelMetadata, 
+            'metadata': metadata, 'smoothing': smoothing, 'smoothingMetadata': smoothingMetadata}
+        if(helper is not None):
+            self.kwargs['helper'] = helper
+
+class HookRegistry():
+    """
+    Zbiór metod wywoływanych w pętlach klasy Data, tworzony raz na pętlę.
+    Dla każdej nazwy wyszukuje w MRO klasy obiektu implementację metody, pomijając metody oznaczone przez forwardHook.
+    Metody oznaczone przez emptyHook nie są wywoływane. Pozostałe zostają powiązane z argumentami z LoopContext, 
+    dzięki czemu w pętli wywołuje się je bez argumentów.
+
+    Metoda dostępna jest pod nazwą bez podkreśleń, np. hooks.beforeTrain(). Dla pominiętej metody wartością jest None.
+    """
+    TRAIN_HOOKS = ('__beforeTrainLoop__', '__beforeTrain__', '__train__', '__afterTrain__', '__afterTrainLoop__', '__trainLoopExit__')
+    TEST_HOOKS = ('__beforeTestLoop__', '__beforeTest__', '__test__', '__afterTest__', '__afterTestLoop__', '__testLoopExit__')
+    EPOCH_HOOKS = ('__beforeEpochLoop__', '__epoch__', '__afterEpochLoop__', '__epochLoopExit__')
+
+    _resolved = {}
+
+    def __init__(self, obj, ctx: 'LoopContext', names):
+        self.ctx = ctx
+        for name in names:
+            fun = HookRegistry.resolve(type(obj), name)
+            setattr(self, name.strip('_'), None if fun is None else HookRegistry.__bind(obj, fun, ctx))
+
+    def resolve(cls, name):
+        """
+        Zwraca funkcję, która zostanie wywołana dla danej nazwy metody lub None, jeżeli metodę należy pominąć.
+        Wynik jest zapamiętywany dla danej klasy.
+        """
+        key = (cls, name)
+        if(key in HookRegistry._resolved):
+            return HookRegistry._resolved[key]
+
+        fun = None
+        for klass in cls.__mro__:
+            candidate = klass.__dict__.get(name)
+            if(candidate is None or getattr(candidate, '__forwardHook__', False)):
+                continue
+            fun = candidate
+            break
+        if(fun is not None and getattr(fun, '__emptyHook__', False)):
+            fun = None
+        HookRegistry._resolved[key] = fun
+        return fun
+
+    def __bind(obj, fun, ctx):
+        method = fun.__get__(obj, type(obj))
+        if(getattr(fun, '__contextHook__', False)):
+            return functools.partial(method, ctx)
+        return functools.partial(method, **ctx.kwargs)
+
 class Data(SaveClass, BaseMainClass, BaseLogicClass):
     """
         Metody konieczne do przeciążenia, dla których wymaga się użycia super().
@@ -1321,9 +3686,14 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         __beforeEpochLoop__
         __afterEpochLoop__
         __epochLoopExit__
+        __batchIterator__
+        __batchTransform__
 
         Metody, których nie powinno się przeciążać
         __getstate__
+
+        Metody pętli wywoływane są przez HookRegistry. Przeciążenie, które jedynie wywołuje super(), można oznaczyć
+        dekoratorem forwardHook, a przeciążenie przyjmujące pojedynczy argument ctx typu LoopContext - dekoratorem contextHook.
     """
     def __init__(self, dataMetadata):
         super().__init__()
@@ -1348,6 +3718,9 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         self.testHelper = None
         self.epochHelper = None
 
+        self.ddpModule = None # model opakowany w DistributedDataParallel; tworzony w epochLoop przy wielu procesach
+        self.testBatchTuned = False # czy w tym wywołaniu programu dobrano już rozmiar paczki testowej
+
         self.__prepare__(dataMetadata)
 
     def __strAppend__(self):
@@ -1370,6 +3743,7 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         del state['testset']
         del state['testloader']
         del state['transform']
+        state.pop('ddpModule', None)
 
     def __getstate__(self):
         """
@@ -1391,6 +3765,8 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         self.testset = None
         self.testloader = None
         self.transform = None
+        self.ddpModule = None
+        self.testBatchTuned = False
 
     def __setInputTransform__(self, dataMetadata):
         """
@@ -1441,8 +3817,12 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         
         # forward + backward + optimize
         #print(torch.cuda.memory_summary(device='cuda:0'))
-        outputs = model.getNNModelModule()(helper.inputs)
-        helper.loss = model.__getLossFun__()(outputs, helper.labels)
+        outputs = self.getTrainModule(model)(helper.inputs)
+        sampler = getattr(self, 'trainSampler', None)
+        if(isinstance(sampler, LossAwareSampler)):
+            helper.loss = sampler.weightedLoss(model.__getLossFun__(), outputs, helper.labels, helper.batchNumber)
+        else:
+            helper.loss = model.__getLossFun__()(outputs, helper.labels)
         #print(torch.cuda.memory_summary())
         helper.loss.backward()
         #print(torch.cuda.memory_summary())
@@ -1450,8 +3830,52 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
 
         helper.outputs = outputs
 
-        # run smoothing
-        helper.smoothingSuccess = smoothing(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, smoothingMetadata=smoothingMetadata, metadata=metadata)
+        # run smoothing; wagi są identyczne we wszystkich procesach, dlatego wygładza tylko główny proces
+        if(isMainProcess()):
+            helper.smoothingSuccess = smoothing(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, smoothingMetadata=smoothingMetadata, metadata=metadata)
+        else:
+            helper.smoothingSuccess = False
+
+    def getTrainModule(self, model: 'Model'):
+        """
+        Zwraca moduł używany w treningu. Przy wielu procesach jest to model opakowany w DistributedDataParallel, 
+        który synchronizuje gradienty między procesami.
+        """
+        if(self.ddpModule is not None):
+            return self.ddpModule
+        return model.getNNModelModule()
+
+    def prepareDistributed(self, model: 'Model', modelMetadata: 'Model_Metadata'):
+        """
+        Przy zainicjalizowanej grupie procesów opakowuje model w DistributedDataParallel. 
+        Wagi oraz bufory modelu zostają przy tym rozesłane z głównego procesu.
+        """
+        if(distributedWorldSize() <= 1 or self.ddpModule is not None):
+            return
+        device = torch.device(getattr(modelMetadata, 'device', 'cpu'))
+        self.ddpModule = DistributedDataParallel(model.getNNModelModule(), device_ids=[device] if device.type == 'cuda' else None)
+
+    def __batchIterator__(self, loader, startNumb, dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata'):
+        """
+        Zwraca iterator krotek (batch, inputs, labels) dla podanego loadera, posiadający metodę close().
+        Paczki o numerze mniejszym niż startNumb są pomijane bez przenoszenia ich na urządzenie.
+        Jeżeli dataMetadata.prefetchBatches > 0, to paczki są przygotowywane z wyprzedzeniem na urządzeniu modelu.
+        Dla ResidentTensorLoader paczki tworzone są od razu od numeru startNumb, bez przygotowywania z wyprzedzeniem.
+        """
+        if(isinstance(loader, ResidentTensorLoader)):
+            return loader.iterFrom(startBatch=startNumb, device=getattr(modelMetadata, 'device', None))
+
+        if(getattr(dataMetadata, 'prefetchBatches', 0) > 0):
+            prefetcher = DevicePrefetcher(loader=loader, device=getattr(modelMetadata, 'device', None), 
+                prefetchBatches=dataMetadata.prefetchBatches, startAt=startNumb)
+            return iter(prefetcher)
+
+        def skipBatches():
+            for batch, (inputs, labels) in enumerate(loader):
+                if(batch < startNumb): # already iterated
+                    continue
+                yield batch, inputs, labels
+        return skipBatches()
 
     def setTrainLoop(self, model: 'Model', modelMetadata: 'Model_Metadata', metadata: 'Metadata'):
         helper = TrainDataContainer()
@@ -1467,8 +3891,16 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
     def __beforeTrainLoop__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):      
         model.getNNModelModule().train()
 
+    def __batchTransform__(self, inputs, train):
+        """
+        Przekształcenie całej paczki danych wejściowych, wykonywane po przeniesieniu jej na urządzenie modelu.
+        Flaga train informuje, czy paczka pochodzi z pętli treningowej, np. w celu wykonania augmentacji.
+        Domyślnie zwraca niezmienione dane.
+        """
+        return inputs
+
     def __beforeTrain__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
-        helper.inputs, helper.labels = helper.inputs.to(modelMetadata.device), helper.labels.to(modelMetadata.device)
+        helper.inputs, helper.labels = self.__batchTransform__(helper.inputs.to(modelMetadata.device), train=True), helper.labels.to(modelMetadata.device)
         model.__getOptimizer__().zero_grad()
 
     def __afterTrain__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
@@ -1505,16 +3937,23 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         if(self.trainHelper is None): # jeżeli nie było wznowione; nowe wywołanie
             self.trainHelper = self.setTrainLoop(model=model, modelMetadata=modelMetadata, metadata=metadata)
         
+        ctx = LoopContext(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        hooks = HookRegistry(self, ctx, HookRegistry.TRAIN_HOOKS)
+
         self.trainHelper.loopTimer.clearTime()
         #torch.cuda.empty_cache()
-        self.__beforeTrainLoop__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
-        metadata.stream.print("Starting train batch at: {}".format(startNumb), "debug:0")
+        if(hooks.beforeTrainLoop is not None):
+            hooks.beforeTrainLoop()
+        metadata.stream.printLazy('debug:0', "Starting train batch at: {}", startNumb, mode='debug')
 
-        self.trainHelper.loopTimer.start()
-        for batch, (inputs, labels) in enumerate(self.trainloader):
-            if(batch < startNumb): # already iterated
-                continue
+        # kolejność paczek zależy od numeru epoch'u, dlatego wznowiona pętla otrzymuje tę samą kolejność
+        for source in (self.trainloader, getattr(self, 'trainSampler', None)):
+            if(hasattr(source, 'setEpoch')):
+                source.setEpoch(helperEpoch.epochNumber)
 
+        batchIterator = self.__batchIterator__(loader=self.trainloader, startNumb=startNumb, dataMetadata=dataMetadata, modelMetadata=modelMetadata)
+        self.trainHelper.loopTimer.start()
+        for batch, inputs, labels in batchIterator:
             #del self.trainHelper.inputs
             #del self.trainHelper.labels
 
@@ -1523,16 +3962,20 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
             self.trainHelper.batchNumber = batch
             helperEpoch.trainTotalNumber += 1
             if(SAVE_AND_EXIT_FLAG):
-                metadata.stream.print("Triggered SAVE_AND_EXIT_FLAG.", "debug:0")
-                self.__trainLoopExit__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+                batchIterator.close()
+                metadata.stream.printLazy('debug:0', "Triggered SAVE_AND_EXIT_FLAG.", mode='debug')
+                if(hooks.trainLoopExit is not None):
+                    hooks.trainLoopExit()
                 self.trainLoopTearDown()
                 return
 
             if(StaticData.TEST_MODE and batch >= StaticData.MAX_DEBUG_LOOPS):
-                metadata.stream.print("In test mode, triggered max loops which is {} iteration. Breaking train loop.".format(StaticData.MAX_DEBUG_LOOPS), "debug:0")
+                metadata.stream.printLazy('debug:0', "In test mode, triggered max loops which is {} iteration. Breaking train loop.", StaticData.MAX_DEBUG_LOOPS, mode='debug')
                 break
             
-            self.__beforeTrain__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+            checkpointBarrier() # zapis w trybie 'reference' odwołuje się do tensorów, które zmieni ten krok
+            if(hooks.beforeTrain is not None):
+                hooks.beforeTrain()
             
             #del self.trainHelper.loss
 
@@ -1540,18 +3983,8 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
             self.trainHelper.timer.start()
             
             
-            #self.__train__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
-            inputs = inputs.to("cuda:0")
-            labels = labels.to("cuda:0")
-            outputs = model.getNNModelModule()(inputs)
-            self.trainHelper.loss = model.__getLossFun__()(outputs, labels)
-            #print(torch.cuda.memory_summary())
-            self.trainHelper.loss.backward()
-            #print(torch.cuda.memory_summary())
-            model.__getOptimizer__().step()
-
-            self.trainHelper.outputs = outputs
-
+            if(hooks.train is not None):
+                hooks.train()
 
             self.trainHelper.timer.end()
             if(helperEpoch.currentLoopTimeAlias is None and warnings()):
@@ -1569,9 +4002,21 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
                     metadata.stream.print("Successful first smoothing call while train at batch {}".format(batch), ['model:0', 'debug:0'])
                     helperEpoch.firstSmoothingSuccess = True
                 else:
-                    metadata.stream.print("Successful smoothing call while train at batch {}".format(batch), 'debug:0')
+                    metadata.stream.printLazy('debug:0', "Successful smoothing call while train at batch {}", batch, mode='debug')
+
+            if(hooks.afterTrain is not None):
+                hooks.afterTrain()
+
+            if(metadata.endpoint is not None):
+                metadata.endpoint.update(epoch=helperEpoch.epochNumber, batch=batch, batchSize=labels.size(0), loss=self.trainHelper.loss, 
+                    smoothing=smoothing)
 
-            self.__afterTrain__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+            if(CHECKPOINT_POLICY is not None and CHECKPOINT_POLICY.due(helperEpoch.trainTotalNumber)):
+                CHECKPOINT_POLICY.checkpoint(dictObjs={
+                        'Metadata': metadata, type(dataMetadata).__name__: dataMetadata, type(modelMetadata).__name__: modelMetadata,
+                        type(smoothingMetadata).__name__: smoothingMetadata, type(self).__name__: self, type(model).__name__: model,
+                        type(smoothing).__name__: smoothing
+                    }, helperEpoch=helperEpoch, numb=batch + 1)
 
             '''if(self.trainHelper.smoothingSuccess and smoothing.__isSmoothingGoodEnough__(
                 helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, 
@@ -1585,14 +4030,17 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
             correct += torch.argmax(self.trainHelper.outputs, dim=1).eq(self.trainHelper.labels.data).cpu().sum()
             
 
+        batchIterator.close()
         self.trainHelper.loopTimer.end()
         self.trainHelper.loopTimer.addToStatistics()
         self.trainHelper.loopEnded = True
 
         metadata.stream.print("Train epoch accuracy: {}%".format(100.*correct/total), "model:0")
 
-        self.__afterTrainLoop__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
-        self.__trainLoopExit__(helperEpoch=helperEpoch, helper=self.trainHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        if(hooks.afterTrainLoop is not None):
+            hooks.afterTrainLoop()
+        if(hooks.trainLoopExit is not None):
+            hooks.trainLoopExit()
 
         helperEpoch.statistics.trainLoopTimerSum.append(self.trainHelper.loopTimer.getTimeSum())
         metadata.stream.print('Train time;', alias='stat')
@@ -1621,7 +4069,7 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         model.getNNModelModule().eval()
 
     def __beforeTest__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
-        helper.inputs = helper.inputs.to(modelMetadata.device)
+        helper.inputs = self.__batchTransform__(helper.inputs.to(modelMetadata.device), train=False)
         helper.labels = helper.labels.to(modelMetadata.device)
 
     def __afterTest__(self, helperEpoch: 'EpochDataContainer', helper, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
@@ -1668,30 +4116,117 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
     def testLoopTearDown(self):
         self.testHelper = None
 
+    def tuneTestBatchSize(self, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata'):
+        """
+        Dobiera dataMetadata.batchTestSize przy pomocy EvalBatchTuner i tworzy na nowo self.testloader przez __recreateTestLoader__.
+        Wynik zapamiętywany jest w TuningCache dla trójki (model, zbiór danych, urządzenie), dzięki czemu kolejne wywołania pomijają wyszukiwanie.
+        Zbiory strumieniowe (IterableDataset) są pomijane - nie udostępniają pojedynczych próbek, a DataLoader nie przyjmuje dla nich samplera.
+        """
+        self.testBatchTuned = True
+        if(isinstance(self.testset, torch.utils.data.IterableDataset)):
+            Output.printBash("Test batch size tuning skipped for iterable dataset '{}'.".format(type(self.testset).__name__), 'info')
+            return
+        module = model.getNNModelModule()
+        device = torch.device(getattr(modelMetadata, 'device', 'cpu'))
+        sample = self.__batchTransform__(self.testset[0][0].unsqueeze(0).to(device), train=False).squeeze(0)
+        deviceName = torch.cuda.get_device_name(device) if device.type == 'cuda' else 'cpu'
+        key = TuningCache.key(type(module).__name__, getattr(model, 'name', None), type(self.testset).__name__, tuple(sample.shape), 
+            str(device), deviceName, dataMetadata.testMemoryBudget)
+
+        cache = TuningCache('evalBatchSize')
+        size = cache.get(key)
+        if(size is None):
+            wasTraining = module.training
+            module.eval()
+            size = EvalBatchTuner(memoryBudget=dataMetadata.testMemoryBudget).tune(module=module, sample=sample, device=device, 
+                startSize=dataMetadata.batchTestSize)
+            module.train(wasTraining)
+            cache.set(key, size)
+        else:
+            Output.printBash("Test batch size {} taken from tuning cache.".format(size), 'info')
+
+        if(size == dataMetadata.batchTestSize):
+            return
+        dataMetadata.batchTestSize = size
+        self.__recreateTestLoader__(dataMetadata)
+        if(self.epochHelper is not None):
+            self._updateTotalNumbLoops(dataMetadata=dataMetadata)
+
+    def __recreateTestLoader__(self, dataMetadata: 'Data_Metadata'):
+        """
+        Tworzy na nowo self.testloader dla zmienionego dataMetadata.batchTestSize. Sampler pobierany jest z self.testSampler.
+        Klasy tworzące loadery w inny sposób (np. przez rejestr loaderów) powinny nadpisać tę metodę.
+        """
+        old = self.testloader
+        if(isinstance(old, ResidentTensorLoader)):
+            self.testloader = old.withBatchSize(dataMetadata.batchTestSize)
+            return
+        workerArgs = {'prefetch_factor': old.prefetch_factor, 'persistent_workers': old.persistent_workers} if old.num_workers > 0 else {}
+        self.testloader = torch.utils.data.DataLoader(self.testset, batch_size=dataMetadata.batchTestSize, sampler=self.testSampler, 
+            num_workers=old.num_workers, collate_fn=old.collate_fn, pin_memory=old.pin_memory, worker_init_fn=old.worker_init_fn, **workerArgs)
+
+    def loaderSettings(self, dataset, batchSize, pinMemory, dataMetadata: 'Data_Metadata', numWorkers = 2, **loaderArgs):
+        """
+        Zwraca argumenty DataLoadera num_workers, pin_memory oraz, jeżeli dotyczy, prefetch_factor i persistent_workers.
+        Jeżeli dataMetadata.autoTuneLoader jest ustawione, to są one dobierane przez LoaderTuner i zapamiętywane w TuningCache 
+        dla pary (komputer, zbiór danych). W przeciwnym wypadku zwraca numWorkers oraz pinMemory.
+
+        loaderArgs - pozostałe argumenty DataLoadera używane podczas pomiarów, np. collate_fn, worker_init_fn.
+        """
+        if(not getattr(dataMetadata, 'autoTuneLoader', False)):
+            return {'num_workers': numWorkers, 'pin_memory': pinMemory}
+
+        transform = getattr(dataset, 'transform', None)
+        collate = loaderArgs.get('collate_fn')
+        key = TuningCache.key(socket.gethostname(), os.cpu_count(), torch.cuda.is_available(), type(dataset).__name__, len(dataset), 
+            repr(transform).replace('\n', ''), type(collate).__name__ if collate is not None else None, batchSize)
+        cache = TuningCache('loaderConfig')
+        config = cache.get(key)
+        if(config is None):
+            config = LoaderTuner().tune(dataset=dataset, batchSize=batchSize, **loaderArgs)
+            cache.set(key, config)
+        else:
+            Output.printBash("DataLoader settings {} taken from tuning cache.".format(config), 'info')
+        return LoaderTuner.loaderKwargs(config)
+
     def testLoop(self, helperEpoch: 'EpochDataContainer', model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         startNumb = helperEpoch.loopsState.decide()
         if(startNumb is None):
             self.testLoopTearDown()
             return # loop already ended. This state can occur when framework was loaded from file.
+
+        if(not isMainProcess()): # test wykonuje tylko główny proces; stan pętli musi pozostać zgodny z głównym procesem
+            helperEpoch.loopsState.imprint(numb=0, isEnd=True)
+            self.testLoopTearDown()
+            return
+
+        # numery paczek wznowionej pętli zależą od rozmiaru paczki, dlatego strojenie odbywa się tylko przed nową pętlą
+        if(getattr(dataMetadata, 'autoTuneTestBatch', False) and not self.testBatchTuned and self.testHelper is None and startNumb == 0):
+            self.tuneTestBatchSize(model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata)
         
         if(self.testHelper is None): # jeżeli nie było wznowione; nowe wywołanie
             self.testHelper = self.setTestLoop(model=model, modelMetadata=modelMetadata, metadata=metadata)
 
+        ctx = LoopContext(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        hooks = HookRegistry(self, ctx, HookRegistry.TEST_HOOKS)
+
         self.testHelper.loopTimer.clearTime()
         #torch.cuda.empty_cache()
-        self.__beforeTestLoop__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        if(hooks.beforeTestLoop is not None):
+            hooks.beforeTestLoop()
 
         with torch.no_grad():
+            batchIterator = self.__batchIterator__(loader=self.testloader, startNumb=startNumb, dataMetadata=dataMetadata, modelMetadata=modelMetadata)
             self.testHelper.loopTimer.start()
-            for batch, (inputs, labels) in enumerate(self.testloader):
-                if(batch < startNumb): # already iterated
-                    continue
+            for batch, inputs, labels in batchIterator:
                 self.testHelper.inputs = inputs
                 self.testHelper.labels = labels
                 self.testHelper.batchNumber = batch
 
                 if(SAVE_AND_EXIT_FLAG):
-                    self.__testLoopExit__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+                    batchIterator.close()
+                    if(hooks.testLoopExit is not None):
+                        hooks.testLoopExit()
                     self.testLoopTearDown()
                     return
 
@@ -1699,11 +4234,13 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
                     break
                 
                 helperEpoch.testTotalNumber += 1
-                self.__beforeTest__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+                if(hooks.beforeTest is not None):
+                    hooks.beforeTest()
 
                 self.testHelper.timer.clearTime()
                 self.testHelper.timer.start()
-                self.__test__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+                if(hooks.test is not None):
+                    hooks.test()
                 self.testHelper.timer.end()
                 if(helperEpoch.currentLoopTimeAlias is None and warnings()):
                     Output.printBash("Alias for test loop file was not set. Variable helperEpoch.currentLoopTimeAlias may be set" +
@@ -1713,20 +4250,26 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
                 self.testHelper.timer.addToStatistics()
 
                 self.testHelper.predSizeSum += labels.size(0)
-                self.__afterTest__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+                if(hooks.afterTest is not None):
+                    hooks.afterTest()
 
+            batchIterator.close()
             self.testHelper.loopTimer.end()
             self.testHelper.loopTimer.addToStatistics()
             self.testHelper.loopEnded = True
 
-        self.__afterTestLoop__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
-        self.__testLoopExit__(helperEpoch=helperEpoch, helper=self.testHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        if(hooks.afterTestLoop is not None):
+            hooks.afterTestLoop()
+        if(hooks.testLoopExit is not None):
+            hooks.testLoopExit()
         helperEpoch.statistics.testLoopTimerSum.append(self.testHelper.loopTimer.getTimeSum())
         self.testLoopTearDown()
 
+    @emptyHook
     def __beforeEpochLoop__(self, helperEpoch: 'EpochDataContainer', model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         pass
 
+    @emptyHook
     def __afterEpochLoop__(self, helperEpoch: 'EpochDataContainer', model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         pass
 
@@ -1741,6 +4284,7 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
         """
         raise Exception("Not implemented")
 
+    @emptyHook
     def __epochLoopExit__(self, helperEpoch: 'EpochDataContainer', model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         pass
 
@@ -1762,13 +4306,20 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
     def epochLoopTearDown(self):
         del self.epochHelper
         self.epochHelper = None
+        self.ddpModule = None
 
     def epochLoop(self, model: 'Model', dataMetadata: 'Data_Metadata', modelMetadata: 'Model_Metadata', metadata: 'Metadata', smoothing: 'Smoothing', smoothingMetadata: 'Smoothing_Metadata'):
         metadata.prepareOutput()
         if(self.epochHelper is None):
             self.epochHelper = self.setEpochLoop(metadata)
+        self.epochHelper.loopsState.rescale(distributedWorldSize())
+        self.prepareDistributed(model=model, modelMetadata=modelMetadata)
+
+        ctx = LoopContext(helperEpoch=self.epochHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        hooks = HookRegistry(self, ctx, HookRegistry.EPOCH_HOOKS)
 
-        self.__beforeEpochLoop__(helperEpoch=self.epochHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        if(hooks.beforeEpochLoop is not None):
+            hooks.beforeEpochLoop()
 
         for ep, (loopEpoch) in enumerate(range(dataMetadata.epoch)):  # loop over the dataset multiple times
             if(ep < self.epochHelper.epochNumber): # already iterated
@@ -1780,17 +4331,22 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
             metadata.stream.print(f"\nEpoch {loopEpoch+1}\n-------------------------------")
             metadata.stream.flushAll()
             
-            self.__epoch__(helperEpoch=self.epochHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+            hooks.epoch()
             model.schedulerStep(epochNumb=ep, metadata=metadata)
 
             if(SAVE_AND_EXIT_FLAG):
-                self.__epochLoopExit__(helperEpoch=self.epochHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+                if(hooks.epochLoopExit is not None):
+                    hooks.epochLoopExit()
+                metadata.stream.flushAll() # zapisz wszystkie logi oczekujące w OutputWriter
                 self.epochLoopTearDown()
                 return
 
-        self.__afterEpochLoop__(helperEpoch=self.epochHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
-        self.__epochLoopExit__(helperEpoch=self.epochHelper, model=model, dataMetadata=dataMetadata, modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+        if(hooks.afterEpochLoop is not None):
+            hooks.afterEpochLoop()
+        if(hooks.epochLoopExit is not None):
+            hooks.epochLoopExit()
 
+        metadata.stream.finishRetention() # niepełne kubełki polityk muszą trafić do plików przed rysowaniem i uśrednianiem
         a = metadata.stream.getRelativeFilePath('loopTrainTime')
         b = metadata.stream.getRelativeFilePath('loopTestTime_normal')
         c = metadata.stream.getRelativeFilePath('loopTestTime_smooothing')
@@ -1808,7 +4364,7 @@ class Data(SaveClass, BaseMainClass, BaseLogicClass):
 
         self.resetEpochState()
         metadata.stream.flushAll()
-        stat = self.epochHelper.statistics
+        stat = self.epochHelper.statistics if isMainProcess() else None
         self.epochLoopTearDown()
         return stat
 
@@ -2103,26 +4659,43 @@ class PredefinedModel(__BaseModel):
         return self.modelObj
 
 
-def tryLoad(tupleClasses: list, metadata, temporaryLocation = False):
+def _Private_tryLoadPair(metadata, mdcl, objcl, temporaryLocation, mapLocation):
+    loaded = {}
+    classMetadataObj = None
+    # load class metadata
+    if(mdcl is not None):
+        classMetadataObj = SaveClass.tryLoad(metadata, mdcl, temporaryLocation=temporaryLocation, mapLocation=mapLocation)
+        if(classMetadataObj is None):
+            return None
+        loaded[mdcl.__name__] = classMetadataObj
+    # load class
+    obj = SaveClass.tryLoad(metadata, objcl, classMetadataObj, temporaryLocation=temporaryLocation, mapLocation=mapLocation)
+    if(obj is None):
+        return None
+    loaded[objcl.__name__] = obj
+    return loaded
+
+def tryLoad(tupleClasses: list, metadata, temporaryLocation = False, mapLocation = None, parallel = True):
+    """
+    Wczytuje pary (klasa metadanych, klasa). Jeżeli parallel jest True, to każda para wczytywana jest w osobnym wątku, 
+    ponieważ obiekty różnych par nie zależą od siebie. Pozwala to nałożyć na siebie odczyt wag modelu oraz __update__ klasy Data.
+    """
     dictObjs = {}
     dictObjs[type(metadata).__name__] = metadata
     if(dictObjs['Metadata'] is None):
         return None
 
-    for mdcl, objcl in tupleClasses:
-        # load class metadata
-        if(mdcl is not None):
-            dictObjs[mdcl.__name__] = SaveClass.tryLoad(metadata, mdcl, temporaryLocation=temporaryLocation)
-            if(dictObjs[mdcl.__name__] is None):
-                return None
-            # load class
-            dictObjs[objcl.__name__] = SaveClass.tryLoad(metadata, objcl, dictObjs[mdcl.__name__], temporaryLocation=temporaryLocation)
-            if(dictObjs[objcl.__name__] is None):
-                return None
-        else:
-            dictObjs[objcl.__name__] = SaveClass.tryLoad(metadata, objcl, temporaryLocation=temporaryLocation)
-            if(dictObjs[objcl.__name__] is None):
-                return None
+    mapLocation = loadMapLocation() if mapLocation is None else mapLocation
+    if(parallel and len(tupleClasses) > 1):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(tupleClasses), thread_name_prefix='tryLoad') as executor:
+            results = list(executor.map(lambda pair: _Private_tryLoadPair(metadata, pair[0], pair[1], temporaryLocation, mapLocation), tupleClasses))
+    else:
+        results = [_Private_tryLoadPair(metadata, mdcl, objcl, temporaryLocation, mapLocation) for mdcl, objcl in tupleClasses]
+
+    for loaded in results:
+        if(loaded is None):
+            return None
+        dictObjs.update(loaded)
     return dictObjs
 
 def trySave(dictObjs: dict, onlyKeyIngredients = False, temporaryLocation = False):
@@ -2147,7 +4720,13 @@ def commandLineArg(metadata, dataMetadata, modelMetadata, argv, enableLoad = Tru
         'bashOutput=',
         'mname=',
         'formatedOutput=',
-        'log='
+        'log=',
+        'binaryMetrics=',
+        'asyncOutput=',
+        'retention=',
+        'retentionKeepRaw=',
+        'metricsEndpoint=',
+        'minMode='
         ]
 
     try:
@@ -2203,9 +4782,32 @@ def commandLineArg(metadata, dataMetadata, modelMetadata, argv, enableLoad = Tru
             metadata.name = arg
         elif opt in ('--log'):
             metadata.logFolderSuffix = arg
+        elif opt in ('--binaryMetrics'):
+            boolean = Metadata.onOff(arg)
+            metadata.binaryMetrics = boolean if boolean is not None else Metadata.exitError(help)
+        elif opt in ('--asyncOutput'):
+            boolean = Metadata.onOff(arg)
+            metadata.asyncOutput = boolean if boolean is not None else Metadata.exitError(help)
+        elif opt in ('--retention'):
+            try:
+                RetentionPolicy.fromStr(arg)
+            except Exception as ex:
+                Metadata.exitError(str(ex) + '\n' + help)
+            metadata.retention = arg
+        elif opt in ('--retentionKeepRaw'):
+            boolean = Metadata.onOff(arg)
+            metadata.retentionKeepRaw = boolean if boolean is not None else Metadata.exitError(help)
+        elif opt in ('--metricsEndpoint'):
+            metadata.metricsEndpoint = arg
+        elif opt in ('--minMode'):
+            metadata.minMode = arg if arg in Output.MODE_LEVELS else Metadata.exitError(help)
         else:
             Output.printBash("Unknown flag provided to program: {}.".format(opt), 'info')
 
+    if(metadata.retention is not None and metadata.binaryMetrics and RetentionPolicy.fromStr(metadata.retention).snapshot() is not None):
+        Metadata.exitError("Retention policy '{}' rewrites the whole series and cannot be used with --binaryMetrics=on.\n".format(
+            metadata.retention) + help)
+
     if(metadata.modelOutput is None):
         metadata.modelOutput = 'default_model'
 
@@ -2304,8 +4906,9 @@ def averageStatistics(statistics: list, filePaths: dict=None,
     for f in filePaths.values():
         flattedFilePaths += f
 
+    flattedHasIndex = [False] * len(flattedFilePaths)
     for index in range(len(flattedFilePaths)):
-        flattedNewVals.append([])
+        flattedNewVals.append({}) # numer wartości w serii -> suma wartości
 
     for st in statistics:
         # przechodź kolejno po wszystkich folderach
@@ -2313,13 +4916,18 @@ def averageStatistics(statistics: list, filePaths: dict=None,
             # iteruj po wszystkich plikach z danego folderu
             openPath = os.path.join(st.logFolder, files)
             config.append(openPath)
-            with open(openPath) as fh:
-                rows = [float(l.rstrip("\n")) for l in fh]
-                if(len(rows) < len(flattedNewVals[index])):
-                    rows = rows + [0.0 for item in range(len(flattedNewVals[index]) - len(rows))]
-                if(len(rows) > len(flattedNewVals[index])):
-                    flattedNewVals[index] = flattedNewVals[index] + [0.0 for item in range(len(rows) - len(flattedNewVals[index]))]
-                flattedNewVals[index] = list(map(operator.add, rows, flattedNewVals[index]))
+            rows = loadSeries(openPath)
+            if(rows is None):
+                raise Exception("Could not find statistics file '{}'.".format(openPath))
+            # wartości zachowane przez RetentionPolicy uśredniane są według numerów paczek, a nie pozycji w pliku
+            rowsIndex = loadSeriesIndex(openPath, len(rows))
+            if(rowsIndex is not None):
+                flattedHasIndex[index] = True
+                rowsIndex = [int(idx) for idx in rowsIndex.tolist()]
+            else:
+                rowsIndex = range(len(rows))
+            for idx, value in zip(rowsIndex, rows.tolist()):
+                flattedNewVals[index][idx] = flattedNewVals[index].get(idx, 0.0) + value
 
         # dodaj do statystyk sumy
         addLast(tmp_testLossSum, st.testLossSum, True)
@@ -2382,17 +4990,21 @@ def averageStatistics(statistics: list, filePaths: dict=None,
     newOutLogFolder = Output.createLogFolder(folderSuffix=outputFolderNameSuffix, relativeRoot=relativeRootFolder)[0]
     
 
-    # podziel
+    # podziel, brakujące wartości traktowane są jako 0
     for arrFile in flattedNewVals:
-        for idx, obj in enumerate(arrFile):
+        for idx in arrFile:
             arrFile[idx] = arrFile[idx] / numOfAvgFiles
 
     
     # zapisz uśrednione wyniki do odpowiednich logów
     for index, files in enumerate(flattedFilePaths):
         with open(os.path.join(newOutLogFolder, files), "w") as fh:
-            for obj in flattedNewVals[index]:
-                fh.write(str(obj) + "\n")
+            for idx in sorted(flattedNewVals[index]):
+                fh.write(str(flattedNewVals[index][idx]) + "\n")
+        if(flattedHasIndex[index]):
+            with open(seriesIndexPath(os.path.join(newOutLogFolder, files)), "w") as fh:
+                for idx in sorted(flattedNewVals[index]):
+                    fh.write(str(idx) + "\n")
         
     # zapisz konfigurację
     with open(os.path.join(newOutLogFolder, 'config.txt'), "w") as fh:
@@ -2515,6 +5127,43 @@ def modelRun(Metadata_Class, Data_Metadata_Class, Model_Metadata_Class, Smoothin
 
     return stat
 
+def _Private_distributedWorker(rank, worldSize, masterAddr, masterPort, resultQueue, fun, args):
+    os.environ['MASTER_ADDR'] = masterAddr
+    os.environ['MASTER_PORT'] = str(masterPort)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // worldSize))
+    dist.init_process_group(backend='gloo', rank=rank, world_size=worldSize)
+    try:
+        result = fun(*args)
+        if(rank == 0):
+            resultQueue.put(result)
+    finally:
+        dist.destroy_process_group()
+
+def runDistributed(fun, worldSize = None, args = (), masterAddr = '127.0.0.1', masterPort = 29500):
+    """
+    Uruchamia fun(*args) w worldSize lokalnych procesach połączonych backendem gloo i zwraca wynik głównego procesu (rank 0).
+    Wewnątrz fun można wywołać przykładowo modelRun lub runObjs. Data.epochLoop opakowuje wtedy model w DistributedDataParallel, 
+    a dane dzielone są między procesy przez sampler stworzony funkcją createSampler.
+    Dostępne rdzenie procesora dzielone są po równo między procesy. Domyślnie worldSize jest równy liczbie rdzeni.
+
+    fun oraz args muszą dać się zserializować przez pickle, ponieważ procesy są tworzone metodą 'spawn'.
+    """
+    if(worldSize is None):
+        worldSize = os.cpu_count() or 1
+    if(worldSize <= 1):
+        return fun(*args)
+
+    resultQueue = torch.multiprocessing.get_context('spawn').SimpleQueue()
+    context = torch.multiprocessing.spawn(_Private_distributedWorker, args=(worldSize, masterAddr, masterPort, resultQueue, fun, args), 
+        nprocs=worldSize, join=False)
+    result = None
+    while(not context.join(timeout=0.1)):
+        if(not resultQueue.empty()):
+            result = resultQueue.get()
+    if(not resultQueue.empty()):
+        result = resultQueue.get()
+    return result
+
 #########################################
 # other functions
 def cloneTorchDict(weights: dict, toDevice = None):
@@ -2569,6 +5218,44 @@ def selectCPU(device, metadata):
 def checkForEmptyFile(filePath):
     return os.path.isfile(filePath) and os.path.getsize(filePath) > 0
 
+def loadSeries(filePath):
+    """
+    Zwraca serię statystyk jako numpy.ndarray float64 lub None, jeżeli nie została znaleziona.
+    Obsługiwane są:
+        ścieżki <plik MetricsSink>#<nazwa serii> zwracane przez Output.getRelativeFilePath,
+        pliki csv z jedną wartością w linii,
+        ścieżki do nieistniejących plików <folder>/<nazwa serii>.csv, jeżeli w folderze istnieje plik MetricsSink z tą serią.
+    """
+    if('#' in os.path.basename(filePath)):
+        path, name = filePath.rsplit('#', 1)
+        return MetricsSink.read(path).get(name) if os.path.isfile(path) else None
+    if(os.path.isfile(filePath)):
+        with open(filePath) as file:
+            return numpy.array([float(line) for line in file if line.strip()], dtype=numpy.float64)
+    metricsPath = os.path.join(os.path.dirname(filePath), MetricsSink.FILE_NAME)
+    if(os.path.isfile(metricsPath)):
+        return MetricsSink.read(metricsPath).get(os.path.splitext(os.path.basename(filePath))[0])
+    return None
+
+def seriesIndexPath(filePath):
+    """
+    Zwraca ścieżkę serii z numerami wartości serii filePath, zapisywanej przez Output.setRetention.
+    """
+    if('#' in os.path.basename(filePath)):
+        return filePath + Output.INDEX_SUFFIX
+    root, ext = os.path.splitext(filePath)
+    return root + Output.INDEX_SUFFIX + ext
+
+def loadSeriesIndex(filePath, length):
+    """
+    Zwraca numery wartości serii filePath w pierwotnej serii (np. numery paczek zachowanych przez RetentionPolicy) 
+    lub None, jeżeli nie zostały zapisane albo ich liczba nie zgadza się z length.
+    """
+    index = loadSeries(seriesIndexPath(filePath))
+    if(index is None or len(index) != length):
+        return None
+    return index
+
 def plot(filePath: list, name = None, plotInputRoot = None, plotOutputRoot = None, fileFormat = '.svg', dpi = 900, widthTickFreq = 0.08, 
     aspectRatio = 0.3, startAt = None, resolutionInches = 11.5):
     """
@@ -2609,13 +5296,16 @@ def plot(filePath: list, name = None, plotInputRoot = None, plotOutputRoot = Non
         fp = filePath
 
     for fn in fp:
-        if(not checkForEmptyFile(fn)):
+        data = loadSeries(fn)
+        if(data is None or len(data) == 0):
             Output.printBash("Cannot plot file '{}'. File is empty or does not exist.".format(fn), 'warn')
             continue
-        data = pd.read_csv(fn, header=None)
-        if(len(data) > sampleMaxSize):
-            sampleMaxSize = len(data)
-        plt.plot(data, label=os.path.basename(fn))
+        index = loadSeriesIndex(fn, len(data))
+        if(index is None):
+            index = numpy.arange(len(data))
+        if(index[-1] + 1 > sampleMaxSize):
+            sampleMaxSize = index[-1] + 1
+        plt.plot(index, data, label=os.path.basename(fn).split('#')[-1])
 
         xleft2, xright2 = ax.get_xlim()
         xleft.append(xleft2)
@@ -9,6 +9,9 @@ import numpy as np
 import time
 from framework.test import utils as ut
 import torchvision.models as models
+import tempfile
+import os
+import pickle
 
 init_weights = {
     'linear1.weight': [[5., 5., 5.]], 
@@ -478,6 +481,204 @@ class Test_DefaultSmoothingBorderline(Test_DefaultSmoothing):
         self.utils_checkSmoothedWeights(model=self.model, helperEpoch=self.helperEpoch, dataMetadata=self.dataMetadata, smoothing=smoothing, 
         smoothingMetadata=self.smoothingMetadata, helper=self.helper, metadata=self.metadata, w=45, b=85, sumW=5+17+23, sumB=7+19+29, count=4) 
 
+class Test_MemmapDataset(ut.Utils):
+    def test_writeRead(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'set')
+            data = np.arange(2 * 4 * 4 * 3, dtype=np.uint8).reshape(2, 4, 4, 3)
+            dc.MemmapDataset.write(path, data, [3, 7])
+            self.assertTrue(dc.MemmapDataset.exists(path))
+
+            dataset = dc.MemmapDataset(path)
+            ut.testCmpPandas(len(dataset), "length", 2)
+            sample, label = dataset[1]
+            ut.testCmpPandas(tuple(sample.shape), "shape", (3, 4, 4))
+            ut.testCmpPandas(sample.dtype, "dtype", torch.uint8)
+            ut.testCmpPandas(label, "label", 7)
+            self.assertTrue(torch.equal(sample, torch.from_numpy(data[1].transpose(2, 0, 1).copy())))
+
+class Test_BatchAugment(ut.Utils):
+    def test_normalize(self):
+        inputs = torch.full((2, 3, 2, 2), 255, dtype=torch.uint8)
+        out = dc.BatchAugment.normalize(inputs, dc.DefaultData.NORMALIZE_MEAN, dc.DefaultData.NORMALIZE_STD)
+        ut.testCmpPandas(out.dtype, "dtype", torch.float32)
+        expected = (1.0 - dc.DefaultData.NORMALIZE_MEAN[0]) / dc.DefaultData.NORMALIZE_STD[0]
+        self.assertAlmostEqual(out[0, 0, 0, 0].item(), expected, places=5)
+
+    def test_augment(self):
+        torch.manual_seed(0)
+        inputs = torch.arange(8 * 2 * 6 * 6, dtype=torch.float32).view(8, 2, 6, 6)
+        augment = dc.BatchAugment(size=6, padding=2)
+        out = augment.augment(inputs)
+        ut.testCmpPandas(tuple(out.shape), "shape", (8, 2, 6, 6))
+        
+        # każdy niezerowy wiersz wycinka jest wierszem oryginału, ewentualnie odbitym
+        for idx in range(8):
+            for row in out[idx, 0]:
+                values = row[row != 0]
+                if(len(values) == 0):
+                    continue
+                found = [r for r in inputs[idx, 0] if set(values.tolist()) <= set(r.tolist())]
+                ut.testCmpPandas(len(found), "found", 1)
+
+    def test_noAugmentInTest(self):
+        inputs = torch.rand(4, 3, 8, 8)
+        augment = dc.BatchAugment(size=8, padding=2, mean=(0., 0., 0.), std=(1., 1., 1.))
+        self.assertTrue(torch.equal(augment(inputs, train=False), inputs))
+
+class Test_DefaultDataBatchTransform(unittest.TestCase):
+    def createData(self, fromGrayToRGB, resizeTo):
+        data = object.__new__(dc.DefaultData)
+        data.batchAugment = None
+        data.batchAugmentOnDevice = False
+        data.deviceNormalize = True
+        data.fromGrayToRGB = fromGrayToRGB
+        data.resizeTo = resizeTo
+        return data
+
+    def test_grayToRGBResize(self):
+        data = self.createData(fromGrayToRGB=True, resizeTo=64)
+        out = data.__batchTransform__(torch.rand(2, 1, 28, 28), train=True)
+        ut.testCmpPandas(tuple(out.shape), "shape", (2, 3, 64, 64))
+        self.assertTrue(torch.allclose(out[:, 0] * dc.DefaultData.NORMALIZE_STD[0] + dc.DefaultData.NORMALIZE_MEAN[0],
+            out[:, 1] * dc.DefaultData.NORMALIZE_STD[1] + dc.DefaultData.NORMALIZE_MEAN[1], atol=1e-5))
+
+    def test_noResize(self):
+        data = self.createData(fromGrayToRGB=False, resizeTo=None)
+        out = data.__batchTransform__(torch.zeros(2, 3, 32, 32, dtype=torch.uint8), train=False)
+        ut.testCmpPandas(tuple(out.shape), "shape", (2, 3, 32, 32))
+        ut.testCmpPandas(out.dtype, "dtype", torch.float32)
+
+class Test_SharedTensorDataset(unittest.TestCase):
+    def test_refCount(self):
+        name = dc.SharedTensorDataset.segmentName('test_refCount', os.getpid())
+        data = np.arange(4 * 1 * 2 * 2, dtype=np.uint8).reshape(4, 1, 2, 2)
+        first = dc.SharedTensorDataset(name, lambda: (data, np.arange(4)))
+        second = dc.SharedTensorDataset(name, lambda: self.fail("Segment should already exist."))
+        try:
+            sample, label = second[3]
+            ut.testCmpPandas(label, "label", 3)
+            self.assertTrue(torch.equal(sample, torch.from_numpy(data[3])))
+
+            worker = pickle.loads(pickle.dumps(first))
+            ut.testCmpPandas(worker.owner, "owner", False)
+            ut.testCmpPandas(len(worker), "length", 4)
+            worker.release()
+
+            first.release()
+            ut.testCmpPandas(len(second), "length_after_release", 4)
+        finally:
+            first.release()
+            second.release()
+        ut.testCmpPandas(os.path.exists(os.path.join('/dev/shm', name)), "segment_exists", False)
+
+    def test_releaseOnClear(self):
+        name = dc.SharedTensorDataset.segmentName('test_releaseOnClear', os.getpid())
+        data = np.zeros((2, 1, 2, 2), dtype=np.uint8)
+        dataset = dc.DataRegistry.dataset(name, lambda: dc.SharedTensorDataset(name, lambda: (data, np.arange(2))))
+        ut.testCmpPandas(os.path.exists(os.path.join('/dev/shm', name)), "segment_created", True)
+        dc.DataRegistry.clear()
+        ut.testCmpPandas(dataset.released, "released", True)
+        ut.testCmpPandas(os.path.exists(os.path.join('/dev/shm', name)), "segment_exists", False)
+
+    def test_releaseAll(self):
+        name = dc.SharedTensorDataset.segmentName('test_releaseAll', os.getpid())
+        data = np.zeros((2, 1, 2, 2), dtype=np.uint8)
+        dataset = dc.SharedTensorDataset(name, lambda: (data, np.arange(2)))
+        worker = pickle.loads(pickle.dumps(dataset))
+        dc.SharedTensorDataset.releaseAll()
+        ut.testCmpPandas(os.path.exists(os.path.join('/dev/shm', name)), "segment_exists", False)
+        ut.testCmpPandas(worker.released, "worker_untouched", False)
+        worker.release()
+
+class Test_ShardedDataset(unittest.TestCase):
+    def test_packReadResume(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'set')
+            data = np.arange(23 * 2 * 2 * 3, dtype=np.uint8).reshape(23, 2, 2, 3)
+            dc.ShardedDataset.pack(path, data, np.arange(23), samplesPerShard=5)
+
+            dataset = dc.ShardedDataset(path, shuffleBuffer=4)
+            ut.testCmpPandas(len(dataset), "length", 23)
+            items = list(dataset)
+            ut.testCmpPandas(sorted(label for _, label in items), "labels", list(range(23)))
+            for sample, label in items:
+                self.assertTrue(torch.equal(sample, torch.from_numpy(data[label].transpose(2, 0, 1).copy())))
+
+            sequential = dc.ShardedDataset(path, shuffleBuffer=0)
+            order = [label for _, label in sequential]
+            sequential.setResume(sequential.positions(batches=3, batchSize=4, workers=1))
+            ut.testCmpPandas([label for _, label in sequential], "resumed", order[12:])
+
+    def test_resumeShuffleBuffer(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'set')
+            data = np.arange(23 * 2 * 2 * 3, dtype=np.uint8).reshape(23, 2, 2, 3)
+            dc.ShardedDataset.pack(path, data, np.arange(23), samplesPerShard=5)
+
+            dataset = dc.ShardedDataset(path, shuffleBuffer=6)
+            order = [label for _, label in dataset]
+            for batches in (1, 3, 9, 11):
+                dataset.setResume(dataset.positions(batches=batches, batchSize=2, workers=1))
+                resumed = list(dataset)
+                ut.testCmpPandas([label for _, label in resumed], "resumed_{}".format(batches), order[batches * 2:])
+                for sample, label in resumed:
+                    self.assertTrue(torch.equal(sample, torch.from_numpy(data[label].transpose(2, 0, 1).copy())))
+            dataset.setResume(None)
+
+    def test_unsupportedFlags(self):
+        for flag, value in (('shareDatasets', True), ('residentData', 'cpu'), ('lossAwareSampling', True), ('autoTuneLoader', True)):
+            with self.assertRaises(Exception):
+                dc.DefaultDataSharded(dc.DefaultDataSharded_Metadata(**{flag: value}))
+
+class Test_DataRegistry(unittest.TestCase):
+    def tearDown(self):
+        dc.DataRegistry.clear()
+
+    def test_dataset(self):
+        calls = []
+        def factory():
+            calls.append(1)
+            return torch.utils.data.TensorDataset(torch.rand(8, 2))
+        first = dc.DataRegistry.dataset(('set', True), factory)
+        second = dc.DataRegistry.dataset(('set', True), factory)
+        self.assertIs(first, second)
+        ut.testCmpPandas(len(calls), "factory_calls", 1)
+
+    def test_loaderSampler(self):
+        dataset = torch.utils.data.TensorDataset(torch.arange(8))
+        first = dc.DataRegistry.loader('loader', lambda: torch.utils.data.DataLoader(dataset, batch_size=2, sampler=sf.BaseSampler(8, 2)), 
+            sampler=None)
+        sampler = sf.BaseSampler(8, 2, startIndex=2)
+        second = dc.DataRegistry.loader('loader', lambda: None, sampler=sampler)
+        self.assertIs(first, second)
+        self.assertIs(second.batch_sampler.sampler, sampler)
+        self.assertIs(second.sampler, sampler)
+        ut.testCmpPandas([int(x) for batch in second for x in batch[0]], "resumed_order", list(sampler))
+
+class Test_RecreateTestLoader(unittest.TestCase):
+    def tearDown(self):
+        dc.DataRegistry.clear()
+
+    def test_sharedLoader(self):
+        dataMetadata = dc.DefaultDataSynthetic_Metadata(trainSize=8, testSize=8, batchTrainSize=2, batchTestSize=2, shareDatasets=True)
+        data = dc.DefaultDataSynthetic(dataMetadata)
+        dataMetadata.batchTestSize = 4
+        data.__recreateTestLoader__(dataMetadata)
+        ut.testCmpPandas(data.testloader.batch_size, "batch_size", 4)
+        self.assertIs(data.testloader.sampler, data.testSampler)
+        ut.testCmpPandas(any(loader is data.testloader for loader in dc.DataRegistry.loaders.values()), "registered", True)
+
+class Test_DefaultDataSynthetic(unittest.TestCase):
+    def test_cropSize(self):
+        dataMetadata = dc.DefaultDataSynthetic_Metadata(shape=(1, 28, 28), trainSize=4, testSize=4)
+        data = dc.DefaultDataSynthetic(dataMetadata)
+        ut.testCmpPandas(tuple(data.trainset[0][0].shape), "train_shape", (1, 28, 28))
+        ut.testCmpPandas(tuple(data.testset[0][0].shape), "test_shape", (1, 28, 28))
+
+        augment = dc.BatchAugment(size=(28, 20))
+        ut.testCmpPandas(tuple(augment(torch.zeros(2, 1, 28, 20, dtype=torch.uint8), train=True).shape), "batch_shape", (2, 1, 28, 20))
+
 def run():
     inst = Test_DefaultSmoothingOscilationWeightedMean()
     inst.test__sumWeightsToArrayStd()
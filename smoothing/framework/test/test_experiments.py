@@ -268,6 +268,29 @@ class Test_RunExperiment(unittest.TestCase):
                 modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata)
     
 
+    def test_experiment_disabled_synthetic_predefModel_resnet18(self):
+        with sf.test_mode():
+            metadata = sf.Metadata(testFlag=True, trainFlag=True, debugInfo=True)
+            dataMetadata = dc.DefaultDataSynthetic_Metadata(trainSize=64, testSize=32, batchTrainSize=16, batchTestSize=16, epoch=1, 
+                test_howOftenPrintTrain=2, howOftenPrintTrain=3)
+            optimizerDataDict={"learning_rate":1e-3, "momentum":0.9}
+
+            obj = models.resnet18(num_classes=10)
+            smoothingMetadata = dc.DisabledSmoothing_Metadata()
+            modelMetadata = dc.DefaultModel_Metadata(lossFuncDataDict={}, optimizerDataDict=optimizerDataDict, device='cpu')
+
+            data = dc.DefaultDataSynthetic(dataMetadata)
+            smoothing = dc.DisabledSmoothing(smoothingMetadata)
+            model = dc.DefaultModelPredef(obj=obj, modelMetadata=modelMetadata, name="resnet18")
+
+            optimizer = optim.SGD(model.getNNModelModule().parameters(), lr=optimizerDataDict['learning_rate'], 
+                momentum=optimizerDataDict['momentum'])
+            loss_fn = nn.CrossEntropyLoss()     
+
+            stat=dc.run(metadataObj=metadata, data=data, model=model, smoothing=smoothing, optimizer=optimizer, lossFunc=loss_fn,
+                modelMetadata=modelMetadata, dataMetadata=dataMetadata, smoothingMetadata=smoothingMetadata)
+
+
 
 if __name__ == '__main__':
     sf.useDeterministic()
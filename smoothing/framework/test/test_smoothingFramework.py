@@ -7,6 +7,14 @@ import torch.optim as optim
 import numpy as np
 import random
 import pickle
+import tempfile
+import os
+import urllib.request
+import socket
+import threading
+import time
+import json
+import io
 
 from framework.test import utils as ut
 
@@ -30,6 +38,22 @@ class Test_BaseSampler(unittest.TestCase):
         random.Random(988).shuffle(testList)
         ut.testCmpPandas(sampler.sequence, "sampler_sequence_2", testList)
 
+class Test_DistributedBaseSampler(unittest.TestCase):
+    def test_partition(self):
+        testList = list(range(10))
+        random.Random(988).shuffle(testList)
+        testList += testList[:2]
+
+        samplers = [sf.DistributedBaseSampler(dataSize=10, batchSize=1, seed=988, rank=r, worldSize=3) for r in range(3)]
+        for r, sampler in enumerate(samplers):
+            ut.testCmpPandas(sampler.sequence, "sampler_sequence_{}".format(r), testList[r::3])
+
+    def test_startIndex(self):
+        sampler = sf.DistributedBaseSampler(dataSize=12, batchSize=2, startIndex=1, seed=988, rank=1, worldSize=2)
+        testList = list(range(12))
+        random.Random(988).shuffle(testList)
+        ut.testCmpPandas(sampler.sequence, "sampler_sequence", testList[1::2][2:])
+
 class Test_test_mode(unittest.TestCase):
     def test_onOff(self):
         ut.testCmpPandas(sf.test_mode.isActive(), "test_mode_plain", False)
@@ -209,6 +233,656 @@ class Test_LoopsState(unittest.TestCase):
         ok = state.decide()
         ut.testCmpPandas(ok, "loopState_loop_here", 0)
 
+    def test_rescale(self):
+        state = sf.LoopsState()
+        state.decide()
+        state.imprint(64, True)
+        state.imprint(32, False)
+        state.worldSize = 2
+
+        state = pickle.loads(pickle.dumps(state))
+        state.rescale(4)
+        ut.testCmpPandas(state.worldSize, "loopState_world_size", 4)
+
+        ok = state.decide()
+        ut.testCmpPandas(ok, "loopState_go_next", None)
+
+        ok = state.decide()
+        ut.testCmpPandas(ok, "loopState_loop_here", 16)
+
+    def test_checkpointState(self):
+        state = sf.LoopsState()
+        state.decide()
+        state.imprint(64, True)
+        ut.testCmpPandas(state.checkpointState(5), "checkpoint_new_loop", [[64, True], [5, False]])
+
+        state.numbArray = state.checkpointState(5)
+        state = pickle.loads(pickle.dumps(state))
+        ut.testCmpPandas(state.decide(), "loopState_go_next", None)
+        ut.testCmpPandas(state.decide(), "loopState_loop_here", 5)
+        ut.testCmpPandas(state.checkpointState(9), "checkpoint_resumed_loop", [[64, True], [9, False]])
+
+        state.imprint(12, True)
+        ut.testCmpPandas(state.numbArray, "resumed_loop_ended", [[64, True], [12, True]])
+
+class Test_Output(unittest.TestCase):
+    def setUp(self):
+        self.logFolder = tempfile.TemporaryDirectory()
+        self.oldLogFolder = sf.StaticData.LOG_FOLDER
+        sf.StaticData.LOG_FOLDER = self.logFolder.name
+
+    def tearDown(self):
+        sf.StaticData.LOG_FOLDER = self.oldLogFolder
+        self.logFolder.cleanup()
+
+    def test_createLogFolderCollision(self):
+        first, firstRel = sf.Output.createLogFolder(folderSuffix="collision")
+        second, secondRel = sf.Output.createLogFolder(folderSuffix="collision")
+        ut.testCmpPandas(first != second, "different_folders", True)
+        ut.testCmpPandas(firstRel != secondRel, "different_relative_folders", True)
+
+class _Private_SavedObject():
+    def __init__(self, fileNameSave = None):
+        self.fileNameSave = fileNameSave
+
+    def getFileSuffix(self = None):
+        return '.saved'
+
+class _Private_SilentStream():
+    def print(self, *args, **kwargs):
+        pass
+
+class _Private_CheckpointedWeights(sf.SaveClass):
+    def __init__(self, fileNameSave, size = 2**22):
+        super().__init__()
+        self.fileNameSave = fileNameSave
+        self.weights = torch.zeros(size)
+        self.stream = _Private_SilentStream()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['stream']
+        return state
+
+    def trySave(self, onlyKeyIngredients = False, temporaryLocation = False):
+        return super().trySave(metadata=self, suffix='.saved', onlyKeyIngredients=onlyKeyIngredients, temporaryLocation=temporaryLocation)
+
+    def getFileSuffix(self = None):
+        return '.saved'
+
+class Test_ChunkedArchive(unittest.TestCase):
+    def test_writeRead(self):
+        with tempfile.TemporaryDirectory() as path:
+            data = bytes(random.Random(5).getrandbits(8) for _ in range(3000)) + b'a' * 5000
+            for codec in ('zlib', 'lzma'):
+                filePath = os.path.join(path, codec)
+                stats = sf.ChunkedArchive.write(filePath, [('data', data), ('empty', b'')], codec=codec, chunkSize=1000, workers=2)
+                ut.testCmpPandas(stats['rawBytes'], "raw_bytes", len(data))
+                archive = sf.ChunkedArchive(filePath)
+                ut.testCmpPandas(archive.names(), "names", ['data', 'empty'])
+                ut.testCmpPandas(archive.read('data') == data, "read_all", True)
+                ut.testCmpPandas(archive.read('data', 1500, 2600) == data[1500:4100], "read_range", True)
+                ut.testCmpPandas(archive.read('empty'), "read_empty", b'')
+
+    def test_packFolder(self):
+        with tempfile.TemporaryDirectory() as path:
+            folder = os.path.join(path, 'logs')
+            os.makedirs(os.path.join(folder, 'sub'))
+            with open(os.path.join(folder, 'sub', 'stat.csv'), 'w') as file:
+                file.write('1;2\n' * 100)
+            sf.ChunkedArchive.packFolder(folder, remove=True)
+            ut.testCmpPandas(os.listdir(path), "only_archive", ['logs' + sf.ChunkedArchive.SUFFIX])
+            sf.ChunkedArchive(folder + sf.ChunkedArchive.SUFFIX).extractAll(folder)
+            with open(os.path.join(folder, 'sub', 'stat.csv')) as file:
+                ut.testCmpPandas(file.read(), "extracted", '1;2\n' * 100)
+
+class Test_SaveClassLoad(unittest.TestCase):
+    def test_loadFile(self):
+        with tempfile.TemporaryDirectory() as path:
+            filePath = os.path.join(path, 'obj')
+            torch.save({'classNameStr': 'Linear', 'obj': nn.Linear(3, 2)}, filePath)
+            loaded = sf.SaveClass.loadFile(filePath, mapLocation='cpu')
+            ut.testCmpPandas(loaded['obj'].weight.device.type, "device", 'cpu')
+            ut.testCmpPandas(list(loaded['obj'].weight.shape), "shape", [2, 3])
+
+    def test_remapDevice(self):
+        obj = _Private_SavedObject()
+        obj.device = 'cuda:0'
+        sf._Private_remapDevice(obj, None)
+        ut.testCmpPandas(obj.device, "not_remapped", 'cuda:0')
+        sf._Private_remapDevice(obj, 'cpu')
+        ut.testCmpPandas(obj.device, "remapped", 'cpu')
+
+class Test_CheckpointPolicy(unittest.TestCase):
+    def test_due(self):
+        policy = sf.CheckpointPolicy(everyBatches=3)
+        ut.testCmpPandas([policy.due(numb) for numb in range(1, 4)], "due", [False, False, True])
+        policy.reset(3)
+        ut.testCmpPandas(policy.due(4), "due_after_reset", False)
+        ut.testCmpPandas(sf.CheckpointPolicy(everyMinutes=0).due(1), "due_minutes", True)
+
+    def test_generations(self):
+        class NotSaved(_Private_SavedObject):
+            def getFileSuffix(self = None):
+                return '.notSaved'
+
+            def trySave(self, metadata, onlyKeyIngredients = False, temporaryLocation = False):
+                return False # np. przerwany zapis
+
+        oldPath, oldTmpPath = sf.StaticData.PATH, sf.StaticData.TMP_PATH
+        with tempfile.TemporaryDirectory() as path:
+            sf.StaticData.PATH = sf.StaticData.TMP_PATH = path + os.sep
+            try:
+                saved = _Private_CheckpointedWeights('run', size=4)
+                helperEpoch = sf.EpochDataContainer()
+                policy = sf.CheckpointPolicy(everyBatches=1, keepLast=2)
+                for numb in range(3):
+                    saved.weights.fill_(numb)
+                    policy.checkpoint({'Metadata': saved}, helperEpoch, numb + 1)
+                ut.testCmpPandas(sorted(os.listdir(path)), "files", ['run.ckpt', 'run.ckpt-000002', 'run.ckpt-000003'])
+
+                saved.weights.fill_(10)
+                policy.checkpoint({'Metadata': saved, 'NotSaved': NotSaved()}, helperEpoch, 4)
+                ut.testCmpPandas(sorted(os.listdir(path)), "incomplete_dropped", ['run.ckpt', 'run.ckpt-000002', 'run.ckpt-000003'])
+                prefix = sf.CheckpointPolicy.loadPrefix('run')
+                ut.testCmpPandas(prefix, "latest_complete", os.path.join(path, 'run.ckpt-000003') + os.sep)
+                ut.testCmpPandas(sf.SaveClass.loadFile(prefix + 'run.saved')['obj'].weights.tolist(), "loaded", [2.0] * 4)
+            finally:
+                sf.StaticData.PATH, sf.StaticData.TMP_PATH = oldPath, oldTmpPath
+
+    def test_referenceCheckpoint(self):
+        oldPath, oldTmpPath = sf.StaticData.PATH, sf.StaticData.TMP_PATH
+        with tempfile.TemporaryDirectory() as path:
+            sf.StaticData.PATH = sf.StaticData.TMP_PATH = path + os.sep
+            writer = sf.useAsyncCheckpoint(snapshotMode='reference')
+            try:
+                saved = _Private_CheckpointedWeights('run')
+                helperEpoch = sf.EpochDataContainer()
+                helperEpoch.trainTotalNumber = 1
+                policy = sf.CheckpointPolicy(everyBatches=1)
+                for numb in range(3):
+                    policy.checkpoint({'Metadata': saved}, helperEpoch, numb + 1)
+                    expected = saved.weights.clone()
+                    sf.checkpointBarrier()
+                    saved.weights.add_(1.0) # kolejny krok treningu zaraz po barierze
+                    loaded = sf.SaveClass.loadFile(sf.CheckpointPolicy.loadPrefix('run') + 'run.saved')['obj']
+                    ut.testCmpPandas(torch.equal(loaded.weights, expected), "not_torn_{}".format(numb), True)
+            finally:
+                writer.close()
+                sf.CHECKPOINT_WRITER = None
+                sf.StaticData.PATH, sf.StaticData.TMP_PATH = oldPath, oldTmpPath
+
+class Test_OutputWriter(unittest.TestCase):
+    def setUp(self):
+        self.logFolder = tempfile.TemporaryDirectory()
+        self.oldLogFolder = sf.StaticData.LOG_FOLDER
+        sf.StaticData.LOG_FOLDER = self.logFolder.name
+
+    def tearDown(self):
+        sf.StaticData.LOG_FOLDER = self.oldLogFolder
+        self.logFolder.cleanup()
+
+    def test_asyncWrite(self):
+        output = sf.Output('writerTest')
+        output.startWriter(queueSize=4)
+        output.open(metadata=None, outputType='formatedLog', alias='values', pathName='values')
+        for numb in range(1000):
+            output.print(numb, 'values')
+        output.flushAll()
+        with open(output.getRelativeFilePath('values')) as file:
+            ut.testCmpPandas(file.read().split(), "values", [str(numb) for numb in range(1000)])
+
+        output.print('last', 'values')
+        output.stopWriter()
+        with open(output.getRelativeFilePath('values')) as file:
+            ut.testCmpPandas(file.read().split()[-1], "drained_on_stop", 'last')
+
+    def test_deadWriter(self):
+        class FailingFile():
+            pathName = 'failing'
+            def __init__(self):
+                self.text = io.StringIO()
+            def get(self):
+                return self.text
+            def flush(self):
+                raise OSError('flush failed')
+
+        writer = sf.OutputWriter(queueSize=2)
+        fh = FailingFile()
+        writer.put(fh, 'a')
+        writer.flush()
+        ut.testCmpPandas(writer.thread.is_alive(), "alive_after_flush_error", True)
+
+        flushTouched = writer.__flushTouched__
+        def crash():
+            writer.__flushTouched__ = flushTouched
+            raise Exception('writer crashed')
+        writer.__flushTouched__ = crash
+        writer.put(fh, 'b')
+        writer.flush()
+        ut.testCmpPandas(writer.thread.is_alive(), "thread_stopped", False)
+        for text in 'cdef': # więcej niż queueSize
+            writer.put(fh, text)
+        writer.flush()
+        writer.close()
+        ut.testCmpPandas(fh.text.getvalue(), "synchronous_fallback", 'abcdef')
+
+class Test_OutputLazy(unittest.TestCase):
+    def setUp(self):
+        self.logFolder = tempfile.TemporaryDirectory()
+        self.oldLogFolder = sf.StaticData.LOG_FOLDER
+        sf.StaticData.LOG_FOLDER = self.logFolder.name
+
+    def tearDown(self):
+        sf.StaticData.LOG_FOLDER = self.oldLogFolder
+        self.logFolder.cleanup()
+
+    def test_minModeMetadata(self):
+        ut.testCmpPandas(sf.Metadata(minMode='info').minMode, "min_mode", 'info')
+        with self.assertRaises(Exception):
+            sf.Metadata(minMode='verbose')
+
+    def test_printLazy(self):
+        calls = []
+        def message():
+            calls.append(1)
+            return 'computed'
+
+        output = sf.Output('lazyTest')
+        output.open(metadata=None, outputType='formatedLog', alias='values', pathName='values')
+        output.printLazy('debug:0', message)
+        output.printLazy('debug:0', "{}", message)
+        ut.testCmpPandas(len(calls), "not_opened", 0)
+
+        output.minMode = 'info'
+        output.printLazy('values', message, mode='debug')
+        ut.testCmpPandas(len(calls), "below_min_mode", 0)
+
+        output.printLazy('values', "{} {}", message, 2)
+        output.printLazy('values', message)
+        output.flushAll()
+        ut.testCmpPandas(len(calls), "enabled", 2)
+        with open(output.getRelativeFilePath('values')) as file:
+            ut.testCmpPandas(file.read().split('\n'), "values", ['computed 2', 'computed', ''])
+
+class Test_Retention(unittest.TestCase):
+    def setUp(self):
+        self.logFolder = tempfile.TemporaryDirectory()
+        self.oldLogFolder = sf.StaticData.LOG_FOLDER
+        sf.StaticData.LOG_FOLDER = self.logFolder.name
+
+    def tearDown(self):
+        sf.StaticData.LOG_FOLDER = self.oldLogFolder
+        self.logFolder.cleanup()
+
+    def test_policies(self):
+        nth, bucket, reservoir = sf.RetentionPolicy.fromStr('nth:3'), sf.RetentionPolicy.fromStr('bucket:4:max'), sf.ReservoirRetention(5, seed=1)
+        kept = {'nth': [], 'bucket': []}
+        for numb in range(10):
+            kept['nth'] += nth.push(numb)
+            kept['bucket'] += bucket.push(numb)
+            reservoir.push(numb)
+        ut.testCmpPandas(kept['nth'], "nth", [(0, 0), (3, 3), (6, 6), (9, 9)])
+        ut.testCmpPandas(kept['bucket'] + bucket.finish(), "bucket", [(3, 3), (7, 7), (9, 9)])
+        sample = reservoir.snapshot()
+        ut.testCmpPandas(len(sample), "reservoir_size", 5)
+        ut.testCmpPandas(sample, "reservoir_order", sorted(sample))
+        ut.testCmpPandas([index == value for index, value in sample], "reservoir_index", [True] * 5)
+
+    def test_output(self):
+        output = sf.Output('retentionTest')
+        output.open(metadata=None, outputType='formatedLog', alias='values', pathName='values')
+        output.setRetention('values', sf.BucketRetention(4, 'mean'), keepRaw=True)
+        for numb in range(10):
+            output.print(numb, 'values')
+        output.finishRetention()
+        path = output.getRelativeFilePath('values')
+        ut.testCmpPandas(sf.loadSeries(path).tolist(), "values", [1.5, 5.5, 8.5])
+        ut.testCmpPandas(sf.loadSeriesIndex(path, 3).tolist(), "index", [3.0, 7.0, 9.0])
+        ut.testCmpPandas(sf.MetricsSink.read(output.metrics.path)['values_raw'].tolist(), "raw", [float(numb) for numb in range(10)])
+
+        # polityka pozostaje po finishRetention, np. dla kolejnego wywołania epochLoop
+        for numb in range(10, 14):
+            output.print(numb, 'values')
+        output.finishRetention()
+        ut.testCmpPandas(sf.loadSeries(path).tolist(), "values_next", [1.5, 5.5, 8.5, 11.5])
+        ut.testCmpPandas(sf.loadSeriesIndex(path, 4).tolist(), "index_next", [3.0, 7.0, 9.0, 13.0])
+
+    def test_reservoirIndex(self):
+        output = sf.Output('retentionTest')
+        output.open(metadata=None, outputType='formatedLog', alias='values', pathName='values')
+        output.setRetention('values', sf.ReservoirRetention(4, seed=3))
+        for numb in range(20):
+            output.print(numb * 10, 'values')
+        output.flushAll()
+        path = output.getRelativeFilePath('values')
+        values, index = sf.loadSeries(path), sf.loadSeriesIndex(path, 4)
+        ut.testCmpPandas((index * 10).tolist(), "index_matches", values.tolist())
+        ut.testCmpPandas(index.tolist(), "index_sorted", sorted(index.tolist()))
+
+    def test_binaryMetricsReservoir(self):
+        metadata = sf.Metadata(binaryMetrics=True, retention='reservoir:5')
+        metadata.prepareOutput()
+        try:
+            ut.testCmpPandas(metadata.stream.retention, "reservoir_skipped", {})
+            metadata = pickle.loads(pickle.dumps(metadata)) # __setstate__ ponownie przygotowuje wyjście
+        finally:
+            metadata.resetOutput()
+
+        with self.assertRaises(SystemExit):
+            sf.commandLineArg(sf.Metadata(), sf.Data_Metadata(), sf.Model_Metadata(), ['--binaryMetrics=on', '--retention=reservoir:5'])
+
+class Test_MetricsEndpoint(unittest.TestCase):
+    def test_exposition(self):
+        class SmoothingState():
+            enabled = True
+            countWeights = 7
+            convergenceMetric = torch.tensor(0.25)
+
+        endpoint = sf.MetricsEndpoint('127.0.0.1:0', windows=(2, 4))
+        for numb in range(6):
+            endpoint.update(epoch=1, batch=numb, batchSize=4, loss=torch.tensor(float(numb), requires_grad=True) * 1, smoothing=SmoothingState())
+        ut.testCmpPandas(endpoint.losses[-1].requires_grad, "detached", False)
+
+        endpoint.start()
+        try:
+            port = endpoint.server.server_address[1]
+            lines = urllib.request.urlopen('http://127.0.0.1:{}/'.format(port)).read().decode('utf-8').split('\n')
+        finally:
+            endpoint.stop()
+        ut.testCmpPandas('smoothing_batch 5.0' in lines, "batch", True)
+        ut.testCmpPandas('smoothing_samples_total 24.0' in lines, "samples", True)
+        ut.testCmpPandas('smoothing_loss_average{window="2"} 4.5' in lines, "loss_2", True)
+        ut.testCmpPandas('smoothing_loss_average{window="4"} 3.5' in lines, "loss_4", True)
+        ut.testCmpPandas('smoothing_count_weights 7.0' in lines, "count_weights", True)
+        ut.testCmpPandas('smoothing_convergence_metric 0.25' in lines, "convergence", True)
+
+    def test_unixSocketPath(self):
+        with tempfile.TemporaryDirectory() as path:
+            filePath = os.path.join(path, 'notSocket')
+            with open(filePath, 'w') as file:
+                file.write('data')
+            with self.assertRaises(Exception):
+                sf.MetricsEndpoint('unix:' + filePath).start()
+            ut.testCmpPandas(os.path.isfile(filePath), "file_kept", True)
+
+            socketPath = os.path.join(path, 'endpoint.sock')
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(socketPath)
+            stale.close() # gniazdo pozostaje w systemie plików
+            endpoint = sf.MetricsEndpoint('unix:' + socketPath).start()
+            endpoint.stop()
+            ut.testCmpPandas(os.path.exists(socketPath), "socket_removed", False)
+
+class Test_MetricsSink(unittest.TestCase):
+    def setUp(self):
+        self.logFolder = tempfile.TemporaryDirectory()
+        self.oldLogFolder = sf.StaticData.LOG_FOLDER
+        sf.StaticData.LOG_FOLDER = self.logFolder.name
+
+    def tearDown(self):
+        sf.StaticData.LOG_FOLDER = self.oldLogFolder
+        self.logFolder.cleanup()
+
+    def test_appendRead(self):
+        with tempfile.TemporaryDirectory() as path:
+            filePath = os.path.join(path, sf.MetricsSink.FILE_NAME)
+            sink = sf.MetricsSink(filePath, chunkSize=3).add('loss').add('time')
+            for numb in range(7):
+                sink.append('loss', numb)
+            sink.append('time', 0.5)
+            sink = pickle.loads(pickle.dumps(sink)) # zapis przed serializacją
+            sink.append('time', 1.5)
+            sink.flush()
+
+            series = sf.MetricsSink.read(filePath)
+            ut.testCmpPandas(series['loss'].tolist(), "loss", [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+            ut.testCmpPandas(series['time'].tolist(), "time", [0.5, 1.5])
+            ut.testCmpPandas(sf.loadSeries(os.path.join(path, 'time.csv')).tolist(), "fallback", [0.5, 1.5])
+
+            sf.MetricsSink.exportCSV(filePath, names=['loss'])
+            with open(os.path.join(path, 'loss.csv')) as file:
+                ut.testCmpPandas(file.readline(), "csv_line", '0.0\n')
+
+    def test_output(self):
+        output = sf.Output('metricsTest')
+        output.open(metadata=None, outputType='metrics', alias='statLossTrain', pathName='statLossTrain')
+        output.print(0.25, ['statLossTrain'])
+        output.print('0.75', 'statLossTrain')
+        output.flushAll()
+        path = output.getRelativeFilePath('statLossTrain')
+        ut.testCmpPandas(path.endswith(sf.MetricsSink.FILE_NAME + '#statLossTrain'), "series_path", True)
+        ut.testCmpPandas(sf.loadSeries(path).tolist(), "values", [0.25, 0.75])
+
+class Test_TuningCache(unittest.TestCase):
+    def test_setGet(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = sf.TuningCache('test', path=path)
+            key = sf.TuningCache.key('model', 'dataset', 'cpu')
+            ut.testCmpPandas(cache.get(key), "cache_empty", None)
+
+            cache.set(key, 64)
+            cache.set('other', 8)
+            ut.testCmpPandas(sf.TuningCache('test', path=path).get(key), "cache_value", 64)
+            ut.testCmpPandas(cache.get('other'), "cache_other", 8)
+
+class Test_EvalBatchTuner(unittest.TestCase):
+    def test_searchMaxFit(self):
+        ut.testCmpPandas(sf.EvalBatchTuner.searchMaxFit(lambda size: size <= 37, startSize=4, maxSize=4096), "max_fit", 37)
+        ut.testCmpPandas(sf.EvalBatchTuner.searchMaxFit(lambda size: size <= 37, startSize=64, maxSize=4096), "max_fit_big_start", 37)
+        ut.testCmpPandas(sf.EvalBatchTuner.searchMaxFit(lambda size: True, startSize=4, maxSize=100), "max_fit_limit", 100)
+        ut.testCmpPandas(sf.EvalBatchTuner.searchMaxFit(lambda size: False, startSize=4, maxSize=100), "max_fit_none", 0)
+
+    def test_tuneCPU(self):
+        module = nn.Linear(3, 2).eval()
+        size = sf.EvalBatchTuner(memoryBudget=10000, maxBatchSize=512, measureBatches=1).tune(module=module, sample=torch.ones(3), device='cpu', startSize=4)
+        ut.testCmpPandas(1 <= size <= 512, "size_in_range", True)
+
+class Test_LoaderTuner(unittest.TestCase):
+    def test_loaderKwargs(self):
+        config = {'num_workers': 0, 'prefetch_factor': 4, 'persistent_workers': True, 'pin_memory': False}
+        ut.testCmpPandas(sorted(sf.LoaderTuner.loaderKwargs(config).keys()), "keys_no_workers", ['num_workers', 'pin_memory'])
+        config['num_workers'] = 2
+        ut.testCmpPandas(sf.LoaderTuner.loaderKwargs(config)['prefetch_factor'], "prefetch", 4)
+
+    def test_tune(self):
+        dataset = torch.utils.data.TensorDataset(torch.rand(64, 3), torch.zeros(64))
+        config = sf.LoaderTuner(workerCandidates=[0], measureBatches=2, measureEpochs=1).tune(dataset=dataset, batchSize=8)
+        ut.testCmpPandas(config['num_workers'], "num_workers", 0)
+        ut.testCmpPandas(config['persistent_workers'], "persistent_workers", False)
+
+class Test_ShardedCheckpointWriter(unittest.TestCase):
+    def test_saveLoad(self):
+        with tempfile.TemporaryDirectory() as path:
+            module = nn.Sequential(nn.Linear(3, 2), nn.Linear(2, 3))
+            module[1].weight = nn.Parameter(module[0].weight.t().detach().clone())
+            toSave = {'classNameStr': 'Sequential', 'obj': module, 'extra': [torch.arange(4), 5]}
+            filePath = os.path.join(path, 'model')
+
+            writer = sf.ShardedCheckpointWriter(shardSize=16)
+            writer.save(toSave, filePath)
+            expected = module[0].weight.detach().clone()
+            with torch.no_grad():
+                module[0].weight.add_(1.0) # migawka nie może widzieć zmian wykonanych po save
+            ut.testCmpPandas(writer.wait(), "write_ok", True)
+            writer.close()
+
+            ut.testCmpPandas(sf.ShardedCheckpointWriter.isManifest(filePath), "is_manifest", True)
+            loaded = sf.ShardedCheckpointWriter.load(filePath)
+            ut.testCmpPandas(loaded['classNameStr'], "class_name", 'Sequential')
+            ut.testCmpPandas(torch.equal(loaded['obj'][0].weight, expected), "weight", True)
+            ut.testCmpPandas(isinstance(loaded['obj'][0].weight, nn.Parameter), "is_parameter", True)
+            ut.testCmpPandas(loaded['extra'][0].tolist(), "extra", [0, 1, 2, 3])
+            ut.testCmpPandas(len([d for d in os.listdir(path) if '.shards-' in d]), "one_shard_dir", 1)
+
+    def test_sharedParameters(self):
+        with tempfile.TemporaryDirectory() as path:
+            module = nn.Linear(3, 2)
+            module.optimizer = optim.SGD(module.parameters(), lr=0.1)
+            filePath = os.path.join(path, 'model')
+
+            writer = sf.ShardedCheckpointWriter()
+            writer.save({'classNameStr': 'Linear', 'obj': module}, filePath)
+            ut.testCmpPandas(writer.wait(), "write_ok", True)
+            writer.close()
+
+            loaded = sf.ShardedCheckpointWriter.load(filePath)['obj']
+            ut.testCmpPandas(loaded.optimizer.param_groups[0]['params'][0] is loaded.weight, "same_weight", True)
+            ut.testCmpPandas(loaded.optimizer.param_groups[0]['params'][1] is loaded.bias, "same_bias", True)
+
+            before = loaded.weight.detach().clone()
+            loaded(torch.ones(1, 3)).sum().backward()
+            loaded.optimizer.step()
+            ut.testCmpPandas(torch.equal(before, loaded.weight.detach()), "weights_updated", False)
+
+    def test_deduplicate(self):
+        with tempfile.TemporaryDirectory() as path:
+            def blobCount():
+                return sum(len(files) for _, _, files in os.walk(os.path.join(path, sf.BlobStore.DIR_NAME)))
+
+            weights = torch.arange(6, dtype=torch.float32)
+            writer = sf.ShardedCheckpointWriter(deduplicate=True)
+            writer.save({'classNameStr': 'A', 'obj': {'weights': weights}}, os.path.join(path, 'run.model'))
+            writer.save({'classNameStr': 'B', 'obj': {'saved': weights.clone(), 'sum': torch.zeros(2)}}, os.path.join(path, 'run.smoothing'))
+            ut.testCmpPandas(writer.wait(), "write_ok", True)
+            ut.testCmpPandas(blobCount(), "blobs", 4) # 2 szkielety oraz 2 unikalne tensory
+
+            loaded = sf.ShardedCheckpointWriter.load(os.path.join(path, 'run.smoothing'))
+            ut.testCmpPandas(loaded['obj']['saved'].tolist(), "saved", weights.tolist())
+
+            sf.ShardedCheckpointWriter.remove(os.path.join(path, 'run.smoothing'))
+            ut.testCmpPandas(blobCount(), "blobs_after_gc", 2)
+            loaded = sf.ShardedCheckpointWriter.load(os.path.join(path, 'run.model'))
+            ut.testCmpPandas(loaded['obj']['weights'].tolist(), "weights", weights.tolist())
+            writer.close()
+
+    def test_collectConcurrentWriter(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = sf.BlobStore(os.path.join(path, sf.BlobStore.DIR_NAME))
+            stale, _ = store.put(torch.zeros(3))
+            putDone = threading.Event()
+
+            def writer(): # zapis innego procesu: bloby są już na dysku, manifest jeszcze nie
+                with store.lock():
+                    key, _ = store.put(torch.ones(3))
+                    putDone.set()
+                    time.sleep(0.3)
+                    with open(os.path.join(path, 'other.model'), 'w') as file:
+                        json.dump({'format': sf.ShardedCheckpointWriter.FORMAT, 'blobStore': sf.BlobStore.DIR_NAME, 
+                            'skeleton': key, 'blobs': [key]}, file)
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            putDone.wait()
+            inFlight = store.blobPath('ab' * 32) + '.tmp'
+            os.makedirs(os.path.dirname(inFlight), exist_ok=True)
+            open(inFlight, 'wb').close()
+
+            removed = store.collect(path)
+            thread.join()
+            ut.testCmpPandas(removed, "removed_stale", 1)
+            ut.testCmpPandas(os.path.exists(store.blobPath(stale)), "stale_removed", False)
+            ut.testCmpPandas(store.get(sf.BlobStore.key(torch.ones(3))).tolist(), "in_flight_blob_kept", [1.0, 1.0, 1.0])
+            ut.testCmpPandas(os.path.exists(inFlight), "tmp_kept", True)
+
+    def test_compression(self):
+        with tempfile.TemporaryDirectory() as path:
+            filePath = os.path.join(path, 'run.model')
+            module = nn.Linear(4, 3)
+            writer = sf.ShardedCheckpointWriter(compression='zlib', compressionWorkers=2)
+            writer.save({'classNameStr': 'Linear', 'obj': module}, filePath)
+            ut.testCmpPandas(writer.wait(), "write_ok", True)
+            writer.close()
+
+            ut.testCmpPandas(sf.ChunkedArchive.isArchive(filePath), "is_archive", True)
+            loaded = sf.SaveClass.loadFile(filePath, mapLocation='cpu')
+            ut.testCmpPandas(torch.equal(loaded['obj'].weight, module.weight), "weight", True)
+            first = sf.ShardedCheckpointWriter.archiveTensor(filePath, 0)
+            ut.testCmpPandas(torch.equal(first, module.weight.detach()), "random_access", True)
+
+class Test_LossAwareSampler(unittest.TestCase):
+    def test_skewTowardsHighLoss(self):
+        sampler = sf.LossAwareSampler(dataSize=100, batchSize=10, uniformMix=0.0)
+        ut.testCmpPandas(len(list(sampler)), "length", 100)
+        losses = np.full(100, 0.01)
+        losses[:10] = 10.0
+        sampler.update(np.arange(100), losses)
+        sequence = list(sampler)
+        ut.testCmpPandas(sum(1 for idx in sequence if idx < 10) > 50, "high_loss_majority", True)
+        weights = sampler.weights(np.arange(100))
+        self.assertTrue(weights[0] < weights[50])
+
+    def test_weightedLoss(self):
+        sampler = sf.LossAwareSampler(dataSize=8, batchSize=4)
+        list(sampler)
+        lossFun = nn.CrossEntropyLoss()
+        outputs = torch.randn(4, 3, requires_grad=True)
+        labels = torch.tensor([0, 1, 2, 0])
+        loss = sampler.weightedLoss(lossFun, outputs, labels, batch=1)
+        ut.testCmpPandas(lossFun.reduction, "reduction", 'mean')
+        ut.testCmpPandas(loss.dim(), "dim", 0)
+        # przy jednakowych prawdopodobieństwach wagi są równe 1
+        self.assertAlmostEqual(loss.item(), lossFun(outputs, labels).item(), places=5)
+        indices = sampler.batchIndices(1)
+        ut.testCmpPandas(bool(np.isnan(sampler.losses[indices]).any()), "losses_recorded", False)
+
+    def test_checkpoint(self):
+        sampler = sf.LossAwareSampler(dataSize=20, batchSize=4)
+        iterator = iter(sampler)
+        first = [next(iterator) for _ in range(5)]
+        restored = pickle.loads(pickle.dumps(sampler))
+        ut.testCmpPandas(list(restored)[:5], "same_sequence", first)
+
+    def test_residentResume(self):
+        sampler = sf.LossAwareSampler(dataSize=20, batchSize=4)
+        loader = sf.ResidentTensorLoader(torch.arange(20).view(20, 1), torch.arange(20), batchSize=4, sampler=sampler)
+        loader.setEpoch(3)
+        iterator = loader.iterFrom()
+        done = [next(iterator)[2].tolist() for _ in range(2)] # loader pobrał już całą sekwencję samplera
+        expected = [labels.tolist() for _, _, labels in iterator]
+        ut.testCmpPandas(sampler.exhausted, "sampler_exhausted", True)
+
+        restored = pickle.loads(pickle.dumps(sampler)) # zapis w trakcie epoch'u
+        ut.testCmpPandas(restored.epoch, "same_epoch", 3)
+        loader = sf.ResidentTensorLoader(torch.arange(20).view(20, 1), torch.arange(20), batchSize=4, sampler=restored)
+        loader.setEpoch(3)
+        ut.testCmpPandas([labels.tolist() for _, _, labels in loader.iterFrom(startBatch=2)], "resumed", expected)
+
+        loader.setEpoch(4)
+        ut.testCmpPandas([labels.tolist() for _, _, labels in loader.iterFrom()][:2] != done, "next_epoch_new_sequence", True)
+
+class Test_ResidentTensorLoader(unittest.TestCase):
+    def test_iterFrom(self):
+        inputs = torch.arange(10).view(10, 1)
+        labels = torch.arange(10)
+        sampler = sf.BaseSampler(10, 3)
+        loader = sf.ResidentTensorLoader(inputs, labels, batchSize=3, sampler=sampler)
+        ut.testCmpPandas(len(loader), "length", 4)
+
+        order = [idx for _, batchLabels in loader for idx in batchLabels.tolist()]
+        ut.testCmpPandas(order, "order", list(sampler))
+
+        resumed = list(loader.iterFrom(startBatch=2))
+        ut.testCmpPandas([batch for batch, _, _ in resumed], "batches", [2, 3])
+        ut.testCmpPandas(resumed[0][2].tolist(), "labels", list(sampler)[6:9])
+        self.assertTrue(torch.equal(resumed[0][1].view(-1), resumed[0][2]))
+
+    def test_shuffle(self):
+        inputs = torch.arange(20).view(20, 1)
+        loader = sf.ResidentTensorLoader(inputs, torch.arange(20), batchSize=4, shuffle=True)
+        def order(startBatch = 0):
+            return [idx for _, _, batchLabels in loader.iterFrom(startBatch=startBatch) for idx in batchLabels.tolist()]
+
+        loader.setEpoch(1)
+        first = order()
+        ut.testCmpPandas(sorted(first), "all_samples", list(range(20)))
+        ut.testCmpPandas(order() != first, "next_epoch_differs", True)
+        loader.setEpoch(2)
+        second = order()
+        ut.testCmpPandas(second != first, "epoch_differs", True)
+        loader.setEpoch(2)
+        ut.testCmpPandas(order(startBatch=2), "resumed_same_epoch", second[8:])
+
 class Test_Data_Metadata(unittest.TestCase):
     def test_pinMemory(self):
         ok = False
@@ -227,6 +901,70 @@ class Test_Data_Metadata(unittest.TestCase):
         data_metadata.tryPinMemoryTest(metadata, model_metadata)
         ut.testCmpPandas(data_metadata.pin_memoryTest, "pin_memory_test", ok)
 
+class Test_DevicePrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.loader = [(torch.tensor([float(i)]), torch.tensor([i])) for i in range(5)]
+
+    def test_order(self):
+        prefetcher = sf.DevicePrefetcher(loader=self.loader, device='cpu', prefetchBatches=2, startAt=1)
+        batches = []
+        for batch, inputs, labels in prefetcher:
+            ut.testCmpPandas(inputs.item(), "inputs", float(batch))
+            ut.testCmpPandas(labels.item(), "labels", batch)
+            batches.append(batch)
+        ut.testCmpPandas(batches, "batches", [1, 2, 3, 4])
+
+    def test_close(self):
+        prefetcher = sf.DevicePrefetcher(loader=self.loader, device='cpu', prefetchBatches=1)
+        for batch, inputs, labels in prefetcher:
+            if(batch == 1):
+                break
+        prefetcher.close()
+        ut.testCmpPandas(prefetcher.iterator, "iterator", None)
+
+        batches = [batch for batch, _, _ in prefetcher]
+        ut.testCmpPandas(batches, "batches", [0, 1, 2, 3, 4])
+
+class HookBase():
+    def __beforeTrain__(self, helperEpoch, helper, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata):
+        helper.append('base')
+
+    @sf.emptyHook
+    def __afterTrain__(self, helperEpoch, helper, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata):
+        pass
+
+    @sf.emptyHook
+    def __train__(self, helperEpoch, helper, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata):
+        pass
+
+class HookDerived(HookBase):
+    @sf.forwardHook
+    def __beforeTrain__(self, helperEpoch, helper, model, dataMetadata, modelMetadata, metadata, smoothing, smoothingMetadata):
+        helper.append('derived')
+        super().__beforeTrain__(helperEpoch=helperEpoch, helper=helper, model=model, dataMetadata=dataMetadata,
+            modelMetadata=modelMetadata, metadata=metadata, smoothing=smoothing, smoothingMetadata=smoothingMetadata)
+
+    @sf.contextHook
+    def __train__(self, ctx):
+        ctx.helper.append('context')
+
+class Test_HookRegistry(unittest.TestCase):
+    def test_dispatch(self):
+        calls = []
+        ctx = sf.LoopContext(helperEpoch=None, helper=calls, model=None, dataMetadata=None, modelMetadata=None, metadata=None,
+            smoothing=None, smoothingMetadata=None)
+        hooks = sf.HookRegistry(HookDerived(), ctx, ('__beforeTrain__', '__train__', '__afterTrain__'))
+
+        ut.testCmpPandas(hooks.afterTrain, "afterTrain", None)
+        hooks.beforeTrain()
+        hooks.train()
+        ut.testCmpPandas(calls, "calls", ['base', 'context'])
+
+    def test_epochContext(self):
+        ctx = sf.LoopContext(helperEpoch=None, model=None, dataMetadata=None, modelMetadata=None, metadata=None,
+            smoothing=None, smoothingMetadata=None)
+        ut.testCmpPandas('helper' in ctx.kwargs, "helper_in_kwargs", False)
+
 class Test_RunningArthmeticMeanWeights(ut.Utils):
     def test_calcMeanDullInit(self):
         weights = self.setWeightTensorDict(2, 5)
@@ -0,0 +1,32 @@
+"""
+Pakuje zbiory danych torchvision do shardów czytanych przez dc.ShardedDataset oraz dc.DefaultDataSharded.
+Shardy zapisywane są w folderze StaticData.DATA_PATH/shards, osobno dla zbioru treningowego i testowego.
+
+Użycie:
+    python packShards.py CIFAR10 [samplesPerShard]
+    python packShards.py EMNIST [samplesPerShard] split=digits
+"""
+import sys
+
+import torchvision
+from framework import smoothingFramework as sf
+from framework import defaultClasses as dc
+
+def pack(datasetName, samplesPerShard, **kwargs):
+    datasetClass = getattr(torchvision.datasets, datasetName)
+    name = dc.MemmapDataset.cacheName(datasetClass, **kwargs)
+    for train in (True, False):
+        source = datasetClass(root=sf.StaticData.DATA_PATH, train=train, download=True, **kwargs)
+        path = dc.ShardedDataset.shardPath(name, train)
+        dc.ShardedDataset.pack(path, source.data, source.targets, samplesPerShard=samplesPerShard)
+        sf.Output.printBash("Packed {} samples into '{}'.".format(len(source.targets), path), 'info')
+    return name
+
+if(__name__ == '__main__'):
+    if(len(sys.argv) < 2):
+        sf.Output.printBash(__doc__, 'err')
+        sys.exit(1)
+    samplesPerShard = int(sys.argv[2]) if len(sys.argv) > 2 and '=' not in sys.argv[2] else 10000
+    kwargs = dict(arg.split('=', 1) for arg in sys.argv[2:] if '=' in arg)
+    name = pack(sys.argv[1], samplesPerShard, **kwargs)
+    sf.Output.printBash("Use dc.DefaultDataSharded_Metadata(shardName='{}').".format(name), 'info')